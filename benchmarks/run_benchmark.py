@@ -0,0 +1,236 @@
+# benchmarks/run_benchmark.py
+"""
+Нагрузочный прогон Flask-приложения без внешних API.
+
+Поднимает заглушки Кинопоиска и GigaChat (benchmarks/stub_servers.py), запускает
+src/app.py на локальном порту и гоняет /chat, /chat-stream и /movie-details
+с заданной параллельностью. Итог — пропускная способность и p50/p95/p99 по эндпоинтам.
+
+    python benchmarks/run_benchmark.py --concurrency 16 --requests 400 \\
+        --kinopoisk-profile 80:30:0.02 --gigachat-profile 600:200
+
+Профиль: 'задержка_мс[:разброс_мс[:доля_ошибок[:HTTP-код]]]'.
+"""
+import os
+import sys
+import json
+import random
+import logging
+import argparse
+import tempfile
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Dict, List, Optional
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from stub_servers import GigaChatStub, KinopoiskStub, Profile  # noqa: E402
+
+# Смесь запросов: простые (разбираются без LLM) и свободный текст (нужен LLM)
+DEFAULT_MESSAGES = [
+    "комедия",
+    "комедия 2010",
+    "топ 5 боевиков",
+    "посоветуй фантастику",
+    "3 триллера 2015 года",
+    "мелодрама",
+    "хочу что-нибудь душевное на вечер с семьёй",
+    "фильм про космос, чтобы было страшно",
+    "что-то похожее на Начало, но попроще",
+    "расскажи про фильм Титаник",
+]
+
+DEFAULT_MIX = "chat=5,chat-stream=4,movie-details=1"
+
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def add(self, endpoint: str, seconds: float, ok: bool):
+        with self._lock:
+            self.latencies.setdefault(endpoint, [])
+            if ok:
+                self.latencies[endpoint].append(seconds)
+            else:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, wall_time: float) -> Dict[str, Dict]:
+        result = {}
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            ordered = sorted(self.latencies.get(endpoint, []))
+            result[endpoint] = {
+                'ok': len(ordered),
+                'errors': self.errors.get(endpoint, 0),
+                'rps': round(len(ordered) / wall_time, 2) if wall_time else 0.0,
+                'p50_ms': _ms(percentile(ordered, 0.50)),
+                'p95_ms': _ms(percentile(ordered, 0.95)),
+                'p99_ms': _ms(percentile(ordered, 0.99))
+            }
+        return result
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def parse_mix(spec: str) -> List[str]:
+    """'chat=5,chat-stream=4' → список эндпоинтов с весами, из которого берётся следующий запрос."""
+    weighted = []
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        weighted.extend([name.strip()] * int(weight or 1))
+    return weighted
+
+
+def start_app(kinopoisk: KinopoiskStub, gigachat: GigaChatStub, workdir: str):
+    os.environ.update({
+        'KINOPOISK_URL': kinopoisk.base_url,
+        'KINOPOISK_API_KEY': 'bench',
+        'GIGACHAT_AUTH_KEY': 'bench',
+        'GIGACHAT_AUTH_URL': f"{gigachat.base_url}/api/v2/oauth",
+        'GIGACHAT_API_URL': f"{gigachat.base_url}/api/v1/chat/completions",
+        'PERSON_INDEX_PATH': os.path.join(workdir, 'person_index.json'),
+        'RESPONSE_CACHE_PATH': os.path.join(workdir, 'responses.sqlite3'),
+        'FLASK_SECRET_KEY': 'bench'
+    })
+    from werkzeug.serving import make_server
+    from src.app import app
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-app', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def run_worker(base_url: str, plan: List[str], messages: List[str], recorder: Recorder, seed: int):
+    rnd = random.Random(seed)
+    # Своя сессия (cookie) на воркер — как отдельный пользователь
+    http = requests.Session()
+    for endpoint in plan:
+        started = monotonic()
+        ok = False
+        try:
+            if endpoint == 'chat':
+                response = http.post(f"{base_url}/chat", json={'message': rnd.choice(messages)}, timeout=120)
+                ok = response.ok
+            elif endpoint == 'chat-stream':
+                with http.post(f"{base_url}/chat-stream", json={'message': rnd.choice(messages)},
+                               stream=True, timeout=120) as response:
+                    first_byte = None
+                    for line in response.iter_lines():
+                        if first_byte is None and line:
+                            first_byte = monotonic() - started
+                    ok = response.ok and first_byte is not None
+                    if ok:
+                        recorder.add('chat-stream (ttfb)', first_byte, True)
+            elif endpoint == 'movie-details':
+                movie_id = rnd.randint(100000, 999999)
+                response = http.post(f"{base_url}/movie-details",
+                                     json={'movie_id': movie_id, 'title': f"Фильм {movie_id}"}, timeout=120)
+                ok = response.ok
+        except requests.RequestException:
+            ok = False
+        recorder.add(endpoint, monotonic() - started, ok)
+
+
+def run(args) -> Dict:
+    kinopoisk = KinopoiskStub(Profile.parse(args.kinopoisk_profile)).start()
+    gigachat = GigaChatStub(Profile.parse(args.gigachat_profile)).start()
+    workdir = tempfile.mkdtemp(prefix='kinobot-bench-')
+    messages = DEFAULT_MESSAGES
+    if args.messages:
+        with open(args.messages, 'r', encoding='utf-8') as f:
+            messages = [line.strip() for line in f if line.strip()]
+
+    # Приложение печатает в stdout на каждый вызов LLM — на время прогона глушим
+    quiet = open(os.devnull, 'w') if not args.verbose else None
+    with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+        server, base_url = start_app(kinopoisk, gigachat, workdir)
+        mix = parse_mix(args.mix)
+        rnd = random.Random(args.seed)
+
+        # Прогрев: создание агента, загрузка индексов, первый токен
+        warmup = Recorder()
+        run_worker(base_url, [rnd.choice(mix) for _ in range(args.warmup)], messages, warmup, args.seed)
+
+        recorder = Recorder()
+        plans = [[] for _ in range(args.concurrency)]
+        for i in range(args.requests):
+            plans[i % args.concurrency].append(rnd.choice(mix))
+        started = monotonic()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for i, plan in enumerate(plans):
+                pool.submit(run_worker, base_url, plan, messages, recorder, args.seed + i + 1)
+        wall_time = monotonic() - started
+
+        server.shutdown()
+    if quiet:
+        quiet.close()
+    kinopoisk.stop()
+    gigachat.stop()
+
+    total_ok = sum(len(v) for k, v in recorder.latencies.items() if not k.endswith('(ttfb)'))
+    return {
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'wall_time_s': round(wall_time, 2),
+        'throughput_rps': round(total_ok / wall_time, 2) if wall_time else 0.0,
+        'endpoints': recorder.report(wall_time),
+        'upstream': {**kinopoisk.stats.snapshot(), **gigachat.stats.snapshot()}
+    }
+
+
+def print_report(result: Dict):
+    print(f"Параллельность: {result['concurrency']}, запросов: {result['requests']}, "
+          f"время: {result['wall_time_s']} с, пропускная способность: {result['throughput_rps']} rps\n")
+    header = f"{'эндпоинт':<22}{'ok':>6}{'ошибки':>8}{'rps':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}"
+    print(header)
+    print('-' * len(header))
+    for endpoint, row in result['endpoints'].items():
+        print(f"{endpoint:<22}{row['ok']:>6}{row['errors']:>8}{row['rps']:>8}"
+              f"{str(row['p50_ms']):>10}{str(row['p95_ms']):>10}{str(row['p99_ms']):>10}")
+    print("\nЗапросы к заглушкам:")
+    for endpoint, row in result['upstream'].items():
+        print(f"  {endpoint:<30}{row['requests']:>6}  (ошибок: {row['failures']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон Kinobot AI на локальных заглушках API")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"веса эндпоинтов, по умолчанию {DEFAULT_MIX}")
+    parser.add_argument('--kinopoisk-profile', default='80:30:0', help="задержка:разброс:доля_ошибок:код")
+    parser.add_argument('--gigachat-profile', default='600:200:0', help="задержка:разброс:доля_ошибок:код")
+    parser.add_argument('--messages', help="файл с сообщениями пользователей, по одному на строку")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="сохранить результат в JSON-файл")
+    parser.add_argument('--verbose', action='store_true', help="не глушить вывод приложения")
+    args = parser.parse_args()
+
+    result = run(args)
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+# benchmarks/stub_servers.py
+"""
+Локальные заглушки внешних API для нагрузочных прогонов без ключей:
+
+- Кинопоиск v1.4: GET /v1.4/movie, /v1.4/movie/{id}, /v1.4/person/search;
+- GigaChat: POST /api/v2/oauth и /api/v1/chat/completions (обычный и SSE-ответ).
+
+У каждой заглушки свой профиль: задержка (среднее ± разброс, мс) и доля ошибок.
+"""
+import json
+import math
+import random
+import threading
+import zlib
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep, time
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+GENRES = ['драма', 'комедия', 'боевик', 'триллер', 'фантастика', 'мелодрама', 'ужасы', 'мультфильм']
+CATALOG_SIZE = 400
+
+
+@dataclass
+class Profile:
+    latency_ms: float = 50.0
+    jitter_ms: float = 10.0
+    error_rate: float = 0.0
+    error_status: int = 500
+
+    @classmethod
+    def parse(cls, spec: str) -> 'Profile':
+        """'задержка[:разброс[:доля_ошибок[:код]]]', например '120:40:0.02:429'."""
+        parts = [p for p in spec.split(':')]
+        profile = cls()
+        if len(parts) > 0 and parts[0]:
+            profile.latency_ms = float(parts[0])
+        if len(parts) > 1 and parts[1]:
+            profile.jitter_ms = float(parts[1])
+        if len(parts) > 2 and parts[2]:
+            profile.error_rate = float(parts[2])
+        if len(parts) > 3 and parts[3]:
+            profile.error_status = int(parts[3])
+        return profile
+
+    def delay(self) -> float:
+        return max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+
+    def should_fail(self) -> bool:
+        return random.random() < self.error_rate
+
+
+class StubStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.failures: Dict[str, int] = {}
+
+    def count(self, endpoint: str, failed: bool):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            if failed:
+                self.failures[endpoint] = self.failures.get(endpoint, 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {
+                endpoint: {'requests': n, 'failures': self.failures.get(endpoint, 0)}
+                for endpoint, n in sorted(self.requests.items())
+            }
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, как у настоящих API
+    server: 'StubServer'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        try:
+            return json.loads(raw or b'{}')
+        except ValueError:
+            return {}
+
+    def _handle(self, method: str):
+        url = urlparse(self.path)
+        route = self.server.route(method, url.path)
+        if route is None:
+            self._send_json({'error': 'not found'}, status=404)
+            return
+        endpoint, handler = route
+        body = self._read_json() if method == 'POST' else {}
+        sleep(self.server.profile.delay())
+        if self.server.profile.should_fail():
+            self.server.stats.count(endpoint, failed=True)
+            self._send_json({'error': 'stub failure'}, status=self.server.profile.error_status)
+            return
+        self.server.stats.count(endpoint, failed=False)
+        handler(self, url.path, parse_qs(url.query), body)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, profile: Profile, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), _StubHandler)
+        self.profile = profile
+        self.stats = StubStats()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def route(self, method: str, path: str):
+        raise NotImplementedError
+
+    def start(self) -> 'StubServer':
+        self._thread = threading.Thread(target=self.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def _stable_id(text: str) -> int:
+    return zlib.crc32(text.encode('utf-8')) % 900000 + 100000
+
+
+def _movie_doc(movie_id: int, genre: Optional[str] = None, year: Optional[int] = None,
+               country: Optional[str] = None, name: Optional[str] = None) -> dict:
+    rnd = random.Random(movie_id)
+    return {
+        'id': movie_id,
+        'name': name or f"Фильм {movie_id}",
+        'alternativeName': f"Movie {movie_id}",
+        'year': year or rnd.randint(1970, 2024),
+        'genres': [{'name': genre or rnd.choice(GENRES)}],
+        'rating': {'imdb': round(rnd.uniform(5.0, 9.0), 1), 'kp': round(rnd.uniform(5.0, 9.0), 1)},
+        # Около трети фильмов не проходит порог голосов — как и в реальной выдаче
+        'votes': {'imdb': rnd.choice([150, 3500, 12000, 80000]), 'kp': rnd.choice([40, 800, 5000])},
+        'description': f"Описание фильма {movie_id}. " * 5,
+        'poster': {'url': None},
+        'persons': [],
+        'countries': [{'name': country or rnd.choice(['США', 'США', 'Россия', 'Франция'])}],
+        'type': 'movie'
+    }
+
+
+class KinopoiskStub(StubServer):
+    """Эмуляция api.kinopoisk.dev v1.4: детерминированные документы по параметрам запроса."""
+
+    def route(self, method: str, path: str):
+        if method != 'GET':
+            return None
+        if path == '/v1.4/movie':
+            return 'kinopoisk /movie', self._search
+        if path == '/v1.4/person/search':
+            return 'kinopoisk /person/search', self._person
+        if path.startswith('/v1.4/movie/'):
+            return 'kinopoisk /movie/{id}', self._details
+        return None
+
+    @staticmethod
+    def _search(handler: _StubHandler, path: str, query: Dict[str, list], body: dict):
+        def first(key):
+            values = query.get(key)
+            return values[0] if values else None
+
+        limit = int(first('limit') or 10)
+        page = int(first('page') or 1)
+        title = first('query')
+        if title:
+            docs = [_movie_doc(_stable_id(title) + i, name=title if i == 0 else f"{title} {i + 1}") for i in range(min(limit, 3))]
+            handler._send_json({'docs': docs, 'total': len(docs), 'limit': limit, 'page': 1, 'pages': 1})
+            return
+
+        genre, country = first('genres.name'), first('countries.name')
+        year = int(first('year')) if first('year') else None
+        seed = _stable_id(json.dumps([genre, year, country, first('persons.id')]))
+        start = (page - 1) * limit
+        docs = [
+            _movie_doc(seed + i, genre=genre, year=year, country=country)
+            for i in range(start, min(start + limit, CATALOG_SIZE))
+        ]
+        handler._send_json({
+            'docs': docs,
+            'total': CATALOG_SIZE,
+            'limit': limit,
+            'page': page,
+            'pages': math.ceil(CATALOG_SIZE / limit)
+        })
+
+    @staticmethod
+    def _details(handler: _StubHandler, path: str, query: Dict[str, list], body: dict):
+        movie_id = path.rsplit('/', 1)[-1]
+        if not movie_id.isdigit():
+            handler._send_json({'error': 'bad id'}, status=400)
+            return
+        handler._send_json(_movie_doc(int(movie_id)))
+
+    @staticmethod
+    def _person(handler: _StubHandler, path: str, query: Dict[str, list], body: dict):
+        name = (query.get('query') or [''])[0]
+        handler._send_json({'docs': [{'id': _stable_id(name), 'name': name}], 'total': 1, 'pages': 1})
+
+
+class GigaChatStub(StubServer):
+    """
+    Эмуляция GigaChat: OAuth выдаёт токен на 30 минут, completions отвечает JSON
+    параметров на промпт извлечения (есть system-сообщение) и текстом — на остальное.
+    """
+
+    def __init__(self, profile: Profile, stream_chunks: int = 8, **kwargs):
+        super().__init__(profile, **kwargs)
+        self.stream_chunks = stream_chunks
+
+    def route(self, method: str, path: str):
+        if method != 'POST':
+            return None
+        if path == '/api/v2/oauth':
+            return 'gigachat /oauth', self._oauth
+        if path == '/api/v1/chat/completions':
+            return 'gigachat /chat/completions', self._completions
+        return None
+
+    @staticmethod
+    def _oauth(handler: _StubHandler, path: str, query: Dict[str, list], body: dict):
+        handler._send_json({'access_token': 'stub-token', 'expires_at': int((time() + 1800) * 1000)})
+
+    @staticmethod
+    def _answer(messages: list) -> str:
+        if any(m.get('role') == 'system' for m in messages):
+            genre = random.choice(GENRES)
+            return json.dumps({
+                'intent': 'initial', 'target_movie': None, 'genre': genre, 'year': None,
+                'actor': None, 'director': None, 'studio': None, 'country': None,
+                'mood': None, 'count': random.choice([1, 1, 5]), 'min_rating': None
+            }, ensure_ascii=False)
+        return "🎬 Фильм из заглушки — короткое описание, как его сформулировала бы модель. 🍿"
+
+    def _completions(self, handler: _StubHandler, path: str, query: Dict[str, list], body: dict):
+        text = self._answer(body.get('messages') or [])
+        if not body.get('stream'):
+            handler._send_json({'choices': [{'message': {'role': 'assistant', 'content': text}, 'index': 0}]})
+            return
+
+        # SSE без Content-Length: соединение закрывается после [DONE]
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.send_header('Connection', 'close')
+        handler.end_headers()
+        handler.close_connection = True
+        step = max(1, math.ceil(len(text) / self.stream_chunks))
+        for i in range(0, len(text), step):
+            chunk = {'choices': [{'delta': {'content': text[i:i + step]}, 'index': 0}]}
+            handler.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            handler.wfile.flush()
+            sleep(self.profile.delay() / self.stream_chunks)
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.wfile.flush()
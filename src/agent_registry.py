@@ -0,0 +1,44 @@
+# src/agent_registry.py
+import os
+import logging
+import threading
+from typing import Optional
+
+from src.llm.dialog_agent import DialogMovieAgent
+
+logger = logging.getLogger(__name__)
+
+# Один DialogMovieAgent на процесс (воркер gunicorn): LLMRouter, токен GigaChat
+# и requests.Session в KinopoiskClient живут между запросами.
+_agent: Optional[DialogMovieAgent] = None
+_agent_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def get_dialog_agent() -> DialogMovieAgent:
+    global _agent, _agent_pid
+    pid = os.getpid()
+    agent = _agent
+    if agent is not None and _agent_pid == pid:
+        return agent
+
+    with _lock:
+        # Агент, созданный до fork (preload_app), не переиспользуем: сокеты
+        # пула соединений нельзя делить между процессами.
+        if _agent is None or _agent_pid != pid:
+            logger.info(f"[AgentRegistry] Создаём DialogMovieAgent для процесса {pid}")
+            _agent = DialogMovieAgent()
+            _agent_pid = pid
+        return _agent
+
+
+def peek_dialog_agent() -> Optional[DialogMovieAgent]:
+    """Агент этого процесса, если он уже создан (без создания нового)."""
+    return _agent if _agent_pid == os.getpid() else None
+
+
+def reset_dialog_agent():
+    global _agent, _agent_pid
+    with _lock:
+        _agent = None
+        _agent_pid = None
@@ -1,13 +1,19 @@
 # src/app.py
 import os
 import sys
+import json
+import uuid
 import logging
+from time import monotonic
 
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, os.path.dirname(__file__))
 
-from flask import Flask, render_template, request, jsonify, session
-from llm.dialog_agent import DialogMovieAgent
+from flask import Flask, Response, g, render_template, request, jsonify, session, stream_with_context
+from agent_registry import get_dialog_agent, peek_dialog_agent
+from src.metrics import METRICS
+from src.session_store import compact_movies, create_session_store
+from config import SESSION_BACKEND, SESSION_DB_PATH, SESSION_MAX, SESSION_TTL
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,12 +23,58 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__, template_folder='templates', static_folder='static')
 app.secret_key = os.environ.get('FLASK_SECRET_KEY') or 'kinobot_dev_secret_key_2025'
 
+# Состояние диалога — на сервере; в cookie только id сессии
+session_store = create_session_store(SESSION_BACKEND, SESSION_DB_PATH, maxsize=SESSION_MAX, ttl=SESSION_TTL)
+
+def _agent_metrics():
+    # Агент не создаём ради метрик: до первого запроса показателей кэшей ещё нет
+    agent = peek_dialog_agent()
+    return agent.metrics_samples() if agent else []
+
+METRICS.register_collector(_agent_metrics)
+
+@app.before_request
+def _start_timer():
+    g.request_started = monotonic()
+
+@app.after_request
+def _observe_request(response):
+    # Для /chat-stream — время до начала ответа (заголовков и первого события)
+    if request.endpoint and request.endpoint not in ('metrics', 'static'):
+        METRICS.observe(
+            'request_seconds', monotonic() - g.request_started,
+            help='Длительность обработки входящих запросов',
+            route=request.endpoint, status=response.status_code
+        )
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 # ... (импорты без изменений) ...
 
+def _session_id() -> str:
+    # Списки фильмов из старых cookie-сессий больше не нужны
+    for key in ('last_movies', 'last_params', 'last_actor'):
+        session.pop(key, None)
+    sid = session.get('sid')
+    if not sid:
+        sid = session['sid'] = uuid.uuid4().hex
+    return sid
+
+def _remember_result(result: dict, state: dict):
+    if not result.get("needs_clarification"):
+        if result.get("movies_list"):
+            state['last_movies'] = compact_movies(result["movies_list"])
+        state['last_params'] = result.get("parameters", {})
+        actor = result["parameters"].get("actor")
+        if actor:
+            state['last_actor'] = actor
+
+def _sse(event: dict) -> str:
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
 @app.route('/chat', methods=['POST'])
 def chat():
     data = request.json
@@ -31,27 +83,12 @@ def chat():
         return jsonify({"error": "Сообщение не может быть пустым"}), 400
 
     try:
-        dialog_agent = DialogMovieAgent()
-        result = dialog_agent.chat(user_message, data.get('history', []))
-
-        if not result.get("needs_clarification"):
-            if result.get("movies_list"):
-                simplified = []
-                for m in result["movies_list"]:
-                    simplified.append({
-                        'id': m.get('id'),
-                        'title': m.get('title'),
-                        'year': m.get('year'),
-                        'genre': m.get('genre'),
-                        'country': m.get('country'),
-                        'rating_imdb': m.get('rating_imdb'),
-                        'rating_kp': m.get('rating_kp')
-                    })
-                session['last_movies'] = simplified
-            session['last_params'] = result.get("parameters", {})
-            actor = result["parameters"].get("actor")
-            if actor:
-                session['last_actor'] = actor
+        dialog_agent = get_dialog_agent()
+        sid = _session_id()
+        state = session_store.load(sid)
+        result = dialog_agent.chat(user_message, data.get('history', []), state=state)
+        _remember_result(result, state)
+        session_store.save(sid, state)
 
         return jsonify({
             "response": result["response"],
@@ -64,6 +101,56 @@ def chat():
         logger.error(f"[APP] Ошибка: {e}", exc_info=True)
         return jsonify({"error": "Произошла ошибка"}), 500
 
+@app.route('/chat-stream', methods=['POST'])
+def chat_stream():
+    """
+    Потоковый /chat (text/event-stream). Поиск выполняется до начала ответа,
+    поэтому первый байт — это заголовок карточки; текст LLM приходит следом.
+    События: meta → (chunk)* → done.
+    """
+    data = request.json
+    user_message = data.get('message', '').strip()
+    if not user_message:
+        return jsonify({"error": "Сообщение не может быть пустым"}), 400
+
+    try:
+        dialog_agent = get_dialog_agent()
+        # id сессии выдаём до стрима: после отправки заголовков cookie уже не поменять
+        sid = _session_id()
+        state = session_store.load(sid)
+        result = dialog_agent.chat(user_message, data.get('history', []), state=state, generate=False)
+        _remember_result(result, state)
+        session_store.save(sid, state)
+    except Exception as e:
+        logger.error(f"[APP] Ошибка: {e}", exc_info=True)
+        return jsonify({"error": "Произошла ошибка"}), 500
+
+    movie = result.get("movie")
+    stream_description = bool(movie) and not result.get("needs_clarification")
+
+    def generate():
+        yield _sse({
+            "type": "meta",
+            "response": result["response"],
+            "needs_clarification": result.get("needs_clarification", False),
+            "parameters": result.get("parameters", {}),
+            "movie": movie,
+            "streaming": stream_description
+        })
+        if stream_description:
+            try:
+                for chunk in dialog_agent.stream_single(movie):
+                    yield _sse({"type": "chunk", "text": chunk})
+            except Exception as e:
+                logger.error(f"[APP] Ошибка стриминга: {e}", exc_info=True)
+        yield _sse({"type": "done"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/movie-details', methods=['POST'])
 def movie_details():
     data = request.json
@@ -71,7 +158,7 @@ def movie_details():
     title = data.get('title', 'Фильм')
 
     try:
-        dialog_agent = DialogMovieAgent()
+        dialog_agent = get_dialog_agent()
         movie = None
         # Поиск по ID (если числовой)
         if movie_id and str(movie_id).isdigit():
@@ -82,15 +169,8 @@ def movie_details():
             movie = found[0] if found else None
 
         if movie:
-            prompt_template = dialog_agent._load_prompt('response_generation_prompt.txt')
-            prompt = prompt_template.format(
-                title=movie.get('title', '—'),
-                year=movie.get('year', '—'),
-                genre=movie.get('genre', '—'),
-                rating=movie.get('rating', '—'),
-                description=movie.get('description', 'Описание отсутствует.')
-            )
-            messages = [{"role": "user", "content": prompt}]
+            movie = dialog_agent.enrich_movies([movie])[0]
+            messages = dialog_agent._single_messages(movie)
             response_text = dialog_agent.llm_router.call_llm(messages, max_tokens=300)
             response_text = response_text.strip() if response_text else f"🎬 <strong>{movie['title']}</strong> ({movie['year']}) — ⭐ {movie['rating']}"
         else:
@@ -104,9 +184,16 @@ def movie_details():
 
 @app.route('/new-chat', methods=['POST'])
 def new_chat():
+    sid = session.get('sid')
+    if sid:
+        session_store.delete(sid)
     session.clear()
     return jsonify({"status": "ok"})
 
+@app.route('/metrics')
+def metrics():
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/health')
 def health():
     return jsonify({"status": "ok"}), 200
@@ -0,0 +1,280 @@
+# src/cache.py
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class Expiring(NamedTuple):
+    """Результат загрузчика, которому осталось жить ttl секунд (например, ответ из дискового кэша)."""
+    value: Any
+    ttl: Optional[float]
+
+
+def make_cache_key(params: Dict[str, Any]) -> str:
+    """Канонический ключ для словаря параметров запроса."""
+    def canon(value):
+        if isinstance(value, str):
+            return value.strip().lower()
+        if isinstance(value, dict):
+            return {str(k): canon(v) for k, v in value.items() if v is not None}
+        if isinstance(value, (list, tuple, set)):
+            return sorted((canon(v) for v in value), key=str)
+        if isinstance(value, bool) or value is None:
+            return value
+        # 2005 и "2005" дают один и тот же запрос к API
+        return str(value)
+
+    return json.dumps(canon(params), sort_keys=True, ensure_ascii=False)
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш с временем жизни записей и счётчиками."""
+
+    def __init__(self, maxsize: int = 512, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """Возвращает значение или `default` (по умолчанию MISSING), если записи нет или она устарела."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at <= monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        expires_at = monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def peek(self, key: Hashable) -> Tuple[Any, Optional[float]]:
+        """(значение, секунд до истечения) без учёта в счётчиках и LRU; (MISSING, None) — записи нет."""
+        with self._lock:
+            item = self._data.get(key)
+        if item is None:
+            return MISSING, None
+        remaining = item[0] - monotonic()
+        if remaining <= 0:
+            return MISSING, None
+        return item[1], remaining
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable):
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and item[0] > monotonic()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class StaleWhileRevalidateCache:
+    """
+    LRU-кэш, который после истечения TTL продолжает отдавать устаревшее значение,
+    а обновляет его в фоне. Записи старше max_stale считаются отсутствующими.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600, max_stale: float = 86400, workers: int = 2):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='swr-refresh')
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.evictions = 0
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """ttl — сколько значению осталось быть свежим, если меньше self.ttl."""
+        with self._lock:
+            self._put_locked(key, value, ttl)
+
+    def put_if_absent(self, key: Hashable, value: Any) -> bool:
+        """Кладёт значение, только если записи нет (или она старше max_stale); возраст существующей не меняется."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and monotonic() - item[0] <= self.max_stale:
+                return False
+            self._put_locked(key, value)
+            return True
+
+    def _put_locked(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        # Запись хранит момент получения данных: с остатком ttl она «старше» на self.ttl - ttl
+        age = max(0.0, self.ttl - ttl) if ttl is not None else 0.0
+        self._data[key] = (monotonic() - age, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: Hashable, loader: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Значение из кэша (возможно устаревшее) или MISSING. Для устаревшей записи
+        loader(), если передан, запускается в фоне.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                age = monotonic() - item[0]
+                if age <= self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return item[1]
+                if age <= self.max_stale:
+                    self._data.move_to_end(key)
+                    self.stale_hits += 1
+                    if loader is not None and key not in self._refreshing:
+                        self._refreshing.add(key)
+                        self._executor.submit(self._refresh, key, loader)
+                    return item[1]
+                del self._data[key]
+            self.misses += 1
+            return MISSING
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], refresher: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Значение из кэша (возможно устаревшее) или результат loader(); None не кэшируется.
+        refresher — загрузчик для фонового обновления устаревшей записи (по умолчанию loader).
+        Загрузчик может вернуть Expiring(значение, остаток ttl).
+        """
+        value = self.get(key, refresher or loader)
+        if value is not MISSING:
+            return value
+        value, ttl = self._unwrap(loader())
+        if value is not None:
+            self.put(key, value, ttl)
+        return value
+
+    @staticmethod
+    def _unwrap(result: Any) -> Tuple[Any, Optional[float]]:
+        return (result.value, result.ttl) if isinstance(result, Expiring) else (result, None)
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Any]):
+        try:
+            value, ttl = self._unwrap(loader())
+            with self._lock:
+                if value is not None:
+                    self._put_locked(key, value, ttl)
+                self.refreshes += 1
+        except Exception as e:
+            logger.warning(f"[Cache] Фоновое обновление ключа {key!r} не удалось: {e}")
+            with self._lock:
+                self.refresh_errors += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'refresh_errors': self.refresh_errors,
+                'evictions': self.evictions
+            }
+
+
+class SingleFlight:
+    """
+    Склейка одинаковых одновременных вызовов: пока запрос с ключом `key` выполняется,
+    повторные вызовы с тем же ключом не идут во внешний API, а ждут его результат
+    (или получают то же исключение). Результат не кэшируется — после завершения
+    следующий вызов выполняется заново.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.collapsed = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.calls += 1
+            else:
+                self.collapsed += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'collapsed': self.collapsed,
+                'in_flight': len(self._calls)
+            }
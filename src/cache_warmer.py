@@ -0,0 +1,245 @@
+# src/cache_warmer.py
+import json
+import random
+import logging
+import threading
+from collections import Counter
+from datetime import date
+from time import monotonic
+from typing import Dict, Iterable, List, Optional
+
+from src.cache import make_cache_key
+from src.client.rate_limiter import WARMUP, RateLimitExceeded, priority
+from src.llm.vocabulary import MOOD_TO_GENRE
+from config import (
+    SEARCH_CACHE_TTL, CACHE_WARMER_INTERVAL, CACHE_WARMER_BUDGET, CACHE_WARMER_YEARS,
+    CACHE_WARMER_TRAFFIC_TOP, CACHE_WARMER_QUERIES_PATH
+)
+
+logger = logging.getLogger(__name__)
+
+# Аргументы recommend_movies, от которых зависит запрос к Кинопоиску
+# (director и studio в поиск по API не передаются)
+WARMABLE_ARGS = ('genre_name', 'year', 'actor', 'country', 'min_imdb_rating', 'limit', 'movie_type', 'query')
+# «топ», «лучшие» — DialogMovieAgent подставляет min_rating = 6.0
+TOP_RATING = 6.0
+
+
+def normalize_query(args: Dict) -> Dict:
+    """Только значимые аргументы recommend_movies; limit и movie_type — как у DialogMovieAgent по умолчанию."""
+    query = {k: v for k, v in args.items() if k in WARMABLE_ARGS and v is not None}
+    query.setdefault('limit', 1)
+    query.setdefault('movie_type', 'movie')
+    return query
+
+
+def default_queries(years: int = CACHE_WARMER_YEARS) -> List[Dict]:
+    """Жанры из MOOD_TO_GENRE × (любой год + последние `years` лет) × (без порога, «топ»)."""
+    genres = list(dict.fromkeys(genre for mood_genres in MOOD_TO_GENRE.values() for genre in mood_genres))
+    this_year = date.today().year
+    return [
+        normalize_query({'genre_name': genre, 'year': year, 'min_imdb_rating': rating})
+        for year in [None] + [this_year - i for i in range(years)]
+        for rating in (None, TOP_RATING)
+        for genre in genres
+    ]
+
+
+def load_queries(path: str) -> List[Dict]:
+    """
+    JSON-список наборов аргументов recommend_movies, например
+    [{"genre_name": "комедия", "year": 2024}, {"mood": "страшный", "min_imdb_rating": 6}].
+    Ключ "mood" раскрывается в жанры из MOOD_TO_GENRE.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    queries = []
+    for entry in entries:
+        entry = dict(entry)
+        mood = entry.pop('mood', None)
+        unknown = set(entry) - set(WARMABLE_ARGS)
+        if unknown:
+            logger.warning(f"[CacheWarmer] Пропускаем {entry}: неизвестные аргументы {sorted(unknown)}")
+            continue
+        genres = MOOD_TO_GENRE.get(mood.lower(), []) if mood else [entry.get('genre_name')]
+        if not genres:
+            logger.warning(f"[CacheWarmer] Пропускаем {entry}: неизвестное настроение '{mood}'")
+        queries.extend(normalize_query(dict(entry, genre_name=genre)) for genre in genres)
+    return queries
+
+
+class CacheWarmer:
+    """
+    Фоновый прогрев кэша поиска MovieAgent.
+
+    Раз в `interval` секунд проходит по списку наборов аргументов recommend_movies:
+    сначала самые частые запросы пользователей (record), затем заданные заранее.
+    Выдачи, которые истекут раньше чем через `refresh_ahead` секунд или отсутствуют,
+    запрашиваются заново (refresh=True), пока не израсходована квота `budget`
+    страниц Кинопоиска за проход. Остальное — до следующего прохода.
+    """
+
+    def __init__(
+        self,
+        movie_agent,
+        queries: Iterable[Dict] = (),
+        interval: float = CACHE_WARMER_INTERVAL,
+        budget: int = CACHE_WARMER_BUDGET,
+        traffic_top: int = CACHE_WARMER_TRAFFIC_TOP,
+        refresh_ahead: Optional[float] = None
+    ):
+        self.movie_agent = movie_agent
+        self.queries = list({make_cache_key(q): q for q in map(normalize_query, queries)}.values())
+        self.interval = interval
+        self.budget = budget
+        self.traffic_top = traffic_top
+        # Обновляем всё, что истечёт до следующего прохода (с запасом на его длительность)
+        self.refresh_ahead = min(interval * 1.5, SEARCH_CACHE_TTL / 2) if refresh_ahead is None else refresh_ahead
+        if interval >= SEARCH_CACHE_TTL:
+            logger.warning(
+                f"[CacheWarmer] Интервал {interval:g} с не меньше SEARCH_CACHE_TTL ({SEARCH_CACHE_TTL} с): "
+                f"записи будут истекать между проходами"
+            )
+
+        self._lock = threading.Lock()
+        self._traffic: Counter = Counter()
+        self._traffic_args: Dict[str, Dict] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.runs = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.deferred = 0
+        self.requests = 0
+        self.planned = 0
+        self.hot = 0
+        self.last_run_seconds = 0.0
+
+    def record(self, args: Dict):
+        """Запрос пользователя: частые наборы параметров попадают в план прогрева."""
+        query = normalize_query(args)
+        key = make_cache_key(query)
+        with self._lock:
+            self._traffic[key] += 1
+            self._traffic_args[key] = query
+            if len(self._traffic) > self.traffic_top * 10:
+                self._trim(self.traffic_top * 5)
+
+    def _trim(self, keep: int):
+        kept = dict(self._traffic.most_common(keep))
+        self._traffic = Counter(kept)
+        self._traffic_args = {key: self._traffic_args[key] for key in kept}
+
+    def plan(self) -> List[Dict]:
+        """Порядок прогрева: частые запросы пользователей, затем заданный список."""
+        with self._lock:
+            popular = [self._traffic_args[key] for key, _ in self._traffic.most_common(self.traffic_top)]
+        return list({make_cache_key(q): q for q in popular + self.queries}.values())
+
+    def _decay(self):
+        # Старый трафик постепенно забывается: счётчики делятся пополам на каждом проходе
+        with self._lock:
+            self._traffic = Counter({key: n // 2 for key, n in self._traffic.items() if n // 2})
+            self._traffic_args = {key: self._traffic_args[key] for key in self._traffic}
+
+    def run_once(self) -> Dict:
+        """Один проход прогрева; возвращает stats()."""
+        started = monotonic()
+        client = self.movie_agent.kinopoisk_client
+        pages_before = client.pass_rates.pages_fetched
+        plan = self.plan()
+        refreshed = failed = deferred = hot = 0
+        throttled = False
+        for query in plan:
+            if self._stop.is_set():
+                break
+            try:
+                with priority(WARMUP):
+                    remaining = self.movie_agent.search_expires_in(**query)
+                    if remaining is not None and remaining > self.refresh_ahead:
+                        hot += 1
+                        continue
+                    # Квота считается по страницам поиска процесса, включая запросы пользователей
+                    # за время прохода, — оценка сверху. Лимиты API важнее: их остаток — для чата
+                    throttled = throttled or not client.rate_limiter.available(WARMUP)
+                    if throttled or client.pass_rates.pages_fetched - pages_before >= self.budget:
+                        deferred += 1
+                        hot += remaining is not None
+                        continue
+                    result = self.movie_agent.recommend_movies(refresh=True, **query)
+                    if isinstance(result, dict) and 'error' in result:
+                        failed += 1
+                    else:
+                        refreshed += 1
+                    hot += self.movie_agent.search_expires_in(**query) is not None
+            except RateLimitExceeded as e:
+                logger.info(f"[CacheWarmer] Прогрев отложен: {e}")
+                throttled = True
+                deferred += 1
+            except Exception as e:
+                failed += 1
+                logger.error(f"[CacheWarmer] Ошибка прогрева {query}: {e}")
+        used = client.pass_rates.pages_fetched - pages_before
+        self._decay()
+
+        with self._lock:
+            self.runs += 1
+            self.refreshed += refreshed
+            self.failed += failed
+            self.deferred += deferred
+            self.requests += used
+            self.planned = len(plan)
+            self.hot = hot
+            self.last_run_seconds = monotonic() - started
+        logger.info(
+            f"[CacheWarmer] Проход: {len(plan)} запросов, обновлено {refreshed}, ошибок {failed}, "
+            f"отложено {deferred}, страниц API {used}, в кэше {hot}"
+        )
+        return self.stats()
+
+    def _loop(self):
+        # Случайная задержка первого прохода: воркеры gunicorn не идут в API одновременно
+        delay = random.uniform(0, min(self.interval, 30))
+        while not self._stop.wait(delay):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"[CacheWarmer] Проход прогрева упал: {e}", exc_info=True)
+            delay = self.interval
+
+    def start(self) -> 'CacheWarmer':
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='cache-warmer', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'queries': self.planned,
+                'hot': self.hot,
+                # Доля запросов плана, выдача которых была в кэше по итогам последнего прохода
+                'coverage': round(self.hot / self.planned, 3) if self.planned else 0.0,
+                'runs': self.runs,
+                'refreshed': self.refreshed,
+                'failed': self.failed,
+                'deferred': self.deferred,
+                'requests': self.requests,
+                'traffic_queries': len(self._traffic),
+                'last_run_seconds': round(self.last_run_seconds, 3)
+            }
+
+
+def create_cache_warmer(movie_agent, queries_path: Optional[str] = CACHE_WARMER_QUERIES_PATH) -> CacheWarmer:
+    """Прогрев по файлу CACHE_WARMER_QUERIES_PATH или по встроенному списку жанров и лет."""
+    queries = default_queries()
+    if queries_path:
+        try:
+            queries = load_queries(queries_path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"[CacheWarmer] Не удалось прочитать {queries_path}: {e}; используем встроенный список")
+    return CacheWarmer(movie_agent, queries)
@@ -0,0 +1,253 @@
+# src/client/async_kinopoisk_client.py
+import asyncio
+import logging
+from time import monotonic
+from typing import Optional, Dict, Iterable, List
+
+import aiohttp
+
+from config import (
+    KINOPOISK_API_KEY, KINOPOISK_URL, HTTP_POOL_SIZE,
+    SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, PERSON_INDEX_PATH,
+    KINOPOISK_MAX_IN_FLIGHT, KINOPOISK_CONNECT_TIMEOUT, KINOPOISK_READ_TIMEOUT, KINOPOISK_MAX_RETRIES
+)
+from src.cache import TTLCache, MISSING, Expiring, make_cache_key
+from src.client.person_index import PersonIndex
+from src.client.response_cache import get_response_cache
+from src.client.rate_limiter import RateLimiter, RateLimitExceeded
+from src.metrics import METRICS
+from src.client.kinopoisk_client import build_search_params, filter_docs, cache_search_result, min_ttl, PassRateTracker
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncKinopoiskClient:
+    """
+    Асинхронный вариант KinopoiskClient на aiohttp. Один пул keep-alive соединений
+    на клиент, не больше max_in_flight одновременных запросов к API.
+    Кэш поиска, индекс персон и планировщик лимитов можно разделить с синхронным клиентом.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = KINOPOISK_MAX_IN_FLIGHT,
+        timeout: float = KINOPOISK_READ_TIMEOUT,
+        search_cache: Optional[TTLCache] = None,
+        person_index: Optional[PersonIndex] = None,
+        pass_rates: Optional[PassRateTracker] = None,
+        rate_limiter: Optional[RateLimiter] = None
+    ):
+        self.api_key = KINOPOISK_API_KEY
+        self.base_url = f"{KINOPOISK_URL.rstrip('/')}/v1.4/movie"
+        self.person_search_url = f"{KINOPOISK_URL.rstrip('/')}/v1.4/person/search"
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.search_cache = search_cache if search_cache is not None else TTLCache(
+            maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL
+        )
+        self.person_index = person_index if person_index is not None else PersonIndex(PERSON_INDEX_PATH)
+        self.pass_rates = pass_rates if pass_rates is not None else PassRateTracker()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.response_cache = get_response_cache()
+        # Сессия и семафор привязаны к event loop — создаём при первом запросе
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_in_flight, limit_per_host=HTTP_POOL_SIZE)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={
+                    'X-API-KEY': self.api_key or '',
+                    'Content-Type': 'application/json'
+                }
+            )
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _get_json(
+        self,
+        endpoint: str,
+        url: str,
+        params: Optional[list] = None,
+        timeout: Optional[float] = None
+    ) -> dict:
+        return (await self._get_json_entry(endpoint, url, params, timeout)).value
+
+    async def _get_json_entry(
+        self,
+        endpoint: str,
+        url: str,
+        params: Optional[list] = None,
+        timeout: Optional[float] = None
+    ) -> Expiring:
+        # SQLite блокирует (до 5 с при занятой базе) — не на event loop
+        if self.response_cache is not None:
+            cached, remaining = await asyncio.to_thread(self.response_cache.get_with_ttl, 'kinopoisk', endpoint, url, params)
+            if cached is not MISSING:
+                return Expiring(cached, remaining)
+        session = self._get_session()
+        client_timeout = aiohttp.ClientTimeout(
+            total=timeout or self.timeout,
+            sock_connect=KINOPOISK_CONNECT_TIMEOUT
+        )
+        for attempt in range(KINOPOISK_MAX_RETRIES + 1):
+            await self.rate_limiter.acquire_async()
+            async with self._semaphore:
+                started = monotonic()
+                status = None
+                try:
+                    async with session.get(url, params=params, timeout=client_timeout) as response:
+                        status = response.status
+                        if status == 429:
+                            retry_after = response.headers.get('Retry-After')
+                        else:
+                            response.raise_for_status()
+                            data = await response.json()
+                            if self.response_cache is not None:
+                                await asyncio.to_thread(self.response_cache.set, 'kinopoisk', endpoint, url, params, data)
+                            return Expiring(data, None)
+                finally:
+                    METRICS.observe_http('kinopoisk', endpoint, monotonic() - started, status)
+            delay = self.rate_limiter.on_throttled(retry_after, attempt)
+        raise RateLimitExceeded(f"Кинопоиск ответил 429 на {endpoint}", retry_after=delay)
+
+    @staticmethod
+    def _query_items(params: dict) -> list:
+        # aiohttp не разворачивает списки, как requests: selectFields=id&selectFields=name...
+        items = []
+        for key, value in params.items():
+            if isinstance(value, (list, tuple)):
+                items.extend((key, str(v)) for v in value)
+            else:
+                items.append((key, str(value)))
+        return items
+
+    async def search_person_by_name(self, name: str, timeout: Optional[float] = None) -> Optional[dict]:
+        person = self.person_index.get(name)
+        if person is not MISSING:
+            return person
+        try:
+            data = await self._get_json(
+                '/person/search',
+                self.person_search_url,
+                params=self._query_items({'query': name, 'limit': 1}),
+                timeout=timeout
+            )
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка поиска персоны '{name}': {e!r}")
+            return None
+        docs = data.get('docs', [])
+        person = {'id': docs[0]['id'], 'name': docs[0]['name']} if docs else None
+        if person is None:
+            logger.warning(f"Персона не найдена: '{name}'")
+        # put пишет JSON-файл индекса — не блокируем event loop
+        await asyncio.to_thread(self.person_index.put, name, person)
+        return person
+
+    async def resolve_persons(self, names: Iterable[str]) -> Dict[str, Optional[dict]]:
+        names = list(dict.fromkeys(n for n in names if n))
+        persons = await asyncio.gather(*(self.search_person_by_name(n) for n in names), return_exceptions=True)
+        return {name: None if isinstance(p, Exception) else p for name, p in zip(names, persons)}
+
+    async def search_movies(
+        self,
+        genre: Optional[str] = None,
+        year: Optional[int] = None,
+        actor: Optional[str] = None,
+        imdb_rating_min: Optional[float] = None,
+        kp_rating_min: Optional[float] = None,
+        movie_type: str = 'movie',
+        query: Optional[str] = None,
+        country: Optional[str] = None,
+        limit: int = 50,
+        timeout: Optional[float] = None
+    ) -> Optional[dict]:
+        person_id = None
+        if actor:
+            person = await self.search_person_by_name(actor, timeout=timeout)
+            if person:
+                person_id = person['id']
+            else:
+                logger.warning(f"Актёр '{actor}' не найден.")
+
+        params = build_search_params(
+            genre=genre,
+            year=year,
+            person_id=person_id,
+            imdb_rating_min=imdb_rating_min,
+            kp_rating_min=kp_rating_min,
+            movie_type=movie_type,
+            query=query,
+            country=country,
+            limit=limit
+        )
+
+        logger.info(f"[AsyncKinopoiskClient] Запрос: {params}")
+
+        cache_key = make_cache_key(params)
+        cached = self.search_cache.get(cache_key)
+        if cached is not MISSING:
+            logger.info("[AsyncKinopoiskClient] Ответ из кэша")
+            return cached
+
+        signature = self.pass_rates.signature(params)
+        page_params = dict(params, limit=self.pass_rates.page_size(signature, limit))
+        docs: List[dict] = []
+        data: dict = {}
+        ttl: Optional[float] = None
+        try:
+            while True:
+                data, page_ttl = await self._get_json_entry(
+                    '/movie', self.base_url, params=self._query_items(page_params), timeout=timeout
+                )
+                ttl = min_ttl(ttl, page_ttl)
+                raw_docs = data.get('docs', [])
+                passed = filter_docs(raw_docs, imdb_rating_min, kp_rating_min)
+                self.pass_rates.record(signature, len(raw_docs), len(passed), page_params['page'])
+                docs.extend(passed)
+                if not self.pass_rates.should_fetch_more(len(docs), limit, data, page_params['page']):
+                    break
+                page_params['page'] += 1
+        except Exception as e:
+            logger.error(f"[AsyncKinopoiskClient] Ошибка поиска фильмов: {e!r}")
+            if isinstance(e, RateLimitExceeded) and not docs:
+                raise
+            # Неполный ответ отдаём, но не кэшируем
+            return dict(data, docs=docs[:limit]) if docs else None
+
+        return cache_search_result(self.search_cache, cache_key, data, docs, limit, ttl)
+
+    async def search_by_title(self, title: str, limit: int = 10, timeout: Optional[float] = None) -> List[dict]:
+        params = {'query': title, 'limit': limit, 'type': 'movie'}
+        try:
+            data = await self._get_json('/movie', self.base_url, params=self._query_items(params), timeout=timeout)
+        except aiohttp.ClientResponseError:
+            return []
+        return data.get('docs', [])
+
+    async def get_movie_details(self, movie_id: int, timeout: Optional[float] = None) -> Optional[dict]:
+        return (await self.get_movie_details_entry(movie_id, timeout)).value
+
+    async def get_movie_details_entry(self, movie_id: int, timeout: Optional[float] = None) -> Expiring:
+        url = f"{self.base_url}/{movie_id}"
+        try:
+            return await self._get_json_entry('/movie/{id}', url, timeout=timeout)
+        except Exception as e:
+            logger.error(f"Ошибка деталей фильма {movie_id}: {e!r}")
+            return Expiring(None, None)
@@ -1,40 +1,305 @@
 # src/client/kinopoisk_client.py
+import math
 import logging
+import threading
 import requests
-from typing import Optional
-from config import KINOPOISK_API_KEY, KINOPOISK_URL, MIN_VOTES_IMDB, MIN_VOTES_KP
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from requests.adapters import HTTPAdapter
+from typing import Optional, Dict, Iterable, List, Tuple
+from config import (
+    KINOPOISK_API_KEY, KINOPOISK_URL, MIN_VOTES_IMDB, MIN_VOTES_KP, HTTP_POOL_SIZE,
+    SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SEARCH_CACHE_NEGATIVE_TTL,
+    PERSON_INDEX_PATH, PERSON_LOOKUP_WORKERS, KINOPOISK_MAX_PAGES, KINOPOISK_DEFAULT_PASS_RATE,
+    KINOPOISK_MAX_RETRIES
+)
+from src.cache import TTLCache, MISSING, Expiring, SingleFlight, make_cache_key
+from src.client.person_index import PersonIndex
+from src.client.response_cache import get_response_cache
+from src.client.rate_limiter import BACKGROUND, RateLimiter, RateLimitExceeded, current_priority, priority
+from src.metrics import METRICS, span
 
 logger = logging.getLogger(__name__)
 
+SEARCH_SELECT_FIELDS = [
+    'id', 'name', 'alternativeName', 'year', 'genres', 'rating', 'votes',
+    'description', 'poster', 'persons', 'countries', 'type', 'externalId'
+]
+
+
+# Параметры, не влияющие на состав выдачи (для сигнатуры набора фильтров)
+_PAGING_PARAMS = {'limit', 'page', 'selectFields', 'sortField', 'sortType'}
+
+
+def build_search_params(
+    genre: Optional[str] = None,
+    year: Optional[int] = None,
+    person_id: Optional[int] = None,
+    imdb_rating_min: Optional[float] = None,
+    kp_rating_min: Optional[float] = None,
+    movie_type: str = 'movie',
+    query: Optional[str] = None,
+    country: Optional[str] = None,
+    limit: int = 50
+) -> dict:
+    params = {
+        'limit': min(limit, 250),
+        'page': 1,
+        'selectFields': list(SEARCH_SELECT_FIELDS),
+        'sortField': 'rating.imdb',
+        'sortType': -1,
+        'type': movie_type
+    }
+
+    if query:
+        params['query'] = query
+    if year:
+        params['year'] = year
+    if genre:
+        params['genres.name'] = genre
+    if person_id:
+        params['persons.id'] = person_id
+    if country:
+        params['countries.name'] = country
+    # Рейтинги — диапазоном: одно число API понимает как точное совпадение
+    if imdb_rating_min is not None:
+        params['rating.imdb'] = f"{imdb_rating_min:g}-10"
+    if kp_rating_min is not None:
+        params['rating.kp'] = f"{kp_rating_min:g}-10"
+    return params
+
+
+def filter_docs(
+    docs: List[dict],
+    imdb_rating_min: Optional[float] = None,
+    kp_rating_min: Optional[float] = None
+) -> List[dict]:
+    """
+    Отсекает фильмы с ненадёжным рейтингом. Условие «IMDb ИЛИ КП» через параметры
+    API не выразить, поэтому голоса проверяются здесь, после загрузки.
+    """
+    filtered_docs = []
+    for movie in docs:
+        rating = movie.get('rating') or {}
+        votes = movie.get('votes') or {}
+
+        # Используем значения из config
+        imdb_val = rating.get('imdb')
+        imdb_votes = votes.get('imdb') or 0
+        kp_val = rating.get('kp')
+        kp_votes = votes.get('kp') or 0
+
+        imdb_ok = (imdb_rating_min is None) or (imdb_val is not None and imdb_val >= imdb_rating_min)
+        kp_ok = (kp_rating_min is None) or (kp_val is not None and kp_val >= kp_rating_min)
+
+        # Проверка по количеству голосов
+        has_enough_imdb = imdb_votes >= MIN_VOTES_IMDB
+        has_enough_kp = kp_votes >= MIN_VOTES_KP
+
+        # Фильм проходит, если:
+        # - IMDb рейтинг надёжный И удовлетворяет min_rating, ИЛИ
+        # - KP рейтинг надёжный И удовлетворяет min_rating
+        passes_imdb = imdb_ok and has_enough_imdb
+        passes_kp = kp_ok and has_enough_kp
+
+        if passes_imdb or passes_kp:
+            filtered_docs.append(movie)
+    return filtered_docs
+
+
+def cache_search_result(
+    search_cache: TTLCache,
+    cache_key: str,
+    data: dict,
+    docs: List[dict],
+    limit: int,
+    ttl: Optional[float] = None
+) -> Optional[dict]:
+    """
+    Итог постраничного поиска; пустой результат кэшируется на SEARCH_CACHE_NEGATIVE_TTL.
+    ttl — остаток жизни страниц из дискового кэша: запись в памяти не переживёт их.
+    """
+    if not docs:
+        logger.info("[KinopoiskClient] Ни один фильм не прошёл фильтры")
+        search_cache.set(cache_key, None, ttl=min_ttl(SEARCH_CACHE_NEGATIVE_TTL, ttl))
+        return None
+    result = dict(data, docs=docs[:limit])
+    logger.info(f"[KinopoiskClient] Возвращаем {len(result['docs'])} фильмов")
+    search_cache.set(cache_key, result, ttl=None if ttl is None else min(ttl, search_cache.ttl))
+    return result
+
+
+def min_ttl(current: Optional[float], ttl: Optional[float]) -> Optional[float]:
+    """Меньший из остатков ttl; None — свежий ответ API (полный ttl)."""
+    if ttl is None:
+        return current
+    return ttl if current is None else min(current, ttl)
+
+
+class PassRateTracker:
+    """
+    Доля документов, переживающих filter_docs, по каждому набору фильтров (EWMA).
+    По ней выбирается размер страницы: чтобы после фильтрации осталось `limit`
+    фильмов с первой же страницы, но без многократного перезапроса.
+    """
+
+    def __init__(
+        self,
+        default_rate: float = KINOPOISK_DEFAULT_PASS_RATE,
+        alpha: float = 0.3,
+        min_rate: float = 0.05,
+        headroom: float = 1.2
+    ):
+        self.default_rate = default_rate
+        self.alpha = alpha
+        self.min_rate = min_rate
+        self.headroom = headroom
+        self._rates: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.pages_fetched = 0
+        self.extra_pages = 0
+
+    @staticmethod
+    def signature(params: dict) -> str:
+        keys = sorted(k for k in params if k not in _PAGING_PARAMS and k != 'type')
+        return f"{params.get('type')}:{','.join(keys)}"
+
+    def page_size(self, signature: str, limit: int) -> int:
+        rate = max(self._rates.get(signature, self.default_rate), self.min_rate)
+        return max(10, min(250, math.ceil(limit * self.headroom / rate)))
+
+    def record(self, signature: str, fetched: int, passed: int, page: int):
+        with self._lock:
+            self.pages_fetched += 1
+            if page > 1:
+                self.extra_pages += 1
+            if not fetched:
+                return
+            rate = passed / fetched
+            previous = self._rates.get(signature)
+            self._rates[signature] = rate if previous is None else previous + self.alpha * (rate - previous)
+
+    def should_fetch_more(self, found: int, limit: int, data: dict, page: int, max_pages: int = KINOPOISK_MAX_PAGES) -> bool:
+        return found < limit and bool(data.get('docs')) and page < min(data.get('pages') or 1, max_pages)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'pages_fetched': self.pages_fetched,
+                'extra_pages': self.extra_pages,
+                'pass_rates': {k: round(v, 3) for k, v in self._rates.items()}
+            }
+
+
 class KinopoiskClient:
     def __init__(self):
         self.api_key = KINOPOISK_API_KEY
         self.base_url = f"{KINOPOISK_URL.rstrip('/')}/v1.4/movie"
         self.person_search_url = f"{KINOPOISK_URL.rstrip('/')}/v1.4/person/search"
         self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE))
         self.session.headers.update({
             'X-API-KEY': self.api_key,
             'Content-Type': 'application/json'
         })
+        # Кэш ответов search_movies: одинаковые запросы разных пользователей не тратят квоту API
+        self.search_cache = TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+        # Актёры повторяются постоянно — id персоны берём из локального индекса
+        self.person_index = PersonIndex(PERSON_INDEX_PATH)
+        self.pass_rates = PassRateTracker()
+        # Лимиты тарифа: чат — в первую очередь, прогрев и фоновые обновления — по остатку
+        self.rate_limiter = RateLimiter()
+        # Сырые ответы API на диске: их переиспользуют другие воркеры и процесс после перезапуска
+        self.response_cache = get_response_cache()
+        # Одинаковые одновременные запросы (всплеск популярного запроса) уходят в API один раз
+        self.search_flight = SingleFlight()
+        self.details_flight = SingleFlight()
 
-    def search_person_by_name(self, name: str) -> Optional[dict]:
+    def _get(self, endpoint: str, url: str, **kwargs) -> requests.Response:
+        """GET через планировщик лимитов; на 429 — пауза и повтор, после KINOPOISK_MAX_RETRIES — RateLimitExceeded."""
+        for attempt in range(KINOPOISK_MAX_RETRIES + 1):
+            self.rate_limiter.acquire()
+            started = monotonic()
+            status = None
+            try:
+                response = self.session.get(url, **kwargs)
+                status = response.status_code
+            finally:
+                METRICS.observe_http('kinopoisk', endpoint, monotonic() - started, status)
+            if response.status_code != 429:
+                return response
+            delay = self.rate_limiter.on_throttled(response.headers.get('Retry-After'), attempt)
+        raise RateLimitExceeded(f"Кинопоиск ответил 429 на {endpoint}", retry_after=delay)
+
+    def _get_json(self, endpoint: str, url: str, params: Optional[dict] = None, refresh: bool = False) -> dict:
+        """
+        JSON успешного ответа. Ответы кэшируются на диске (общий кэш воркеров) и при
+        попадании не расходуют лимиты API; refresh=True идёт в API мимо кэша.
+        """
+        return self._get_json_entry(endpoint, url, params, refresh).value
+
+    def _get_json_entry(self, endpoint: str, url: str, params: Optional[dict] = None, refresh: bool = False) -> Expiring:
+        """Как _get_json, но с остатком жизни ответа из дискового кэша (None — ответ только что из API)."""
+        if self.response_cache is not None and not refresh:
+            cached, remaining = self.response_cache.get_with_ttl('kinopoisk', endpoint, url, params)
+            if cached is not MISSING:
+                return Expiring(cached, remaining)
+        response = self._get(endpoint, url, params=params, timeout=10)
+        response.raise_for_status()
+        data = response.json()
+        if self.response_cache is not None:
+            self.response_cache.set('kinopoisk', endpoint, url, params, data)
+        return Expiring(data, None)
+
+    def _fetch_person(self, name: str) -> Optional[dict]:
         params = {'query': name, 'limit': 1}
-        try:
-            response = self.session.get(self.person_search_url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            docs = data.get('docs', [])
-            if docs:
-                person = docs[0]
-                return {'id': person['id'], 'name': person['name']}
-            else:
+        docs = self._get_json('/person/search', self.person_search_url, params=params).get('docs', [])
+        if not docs:
+            return None
+        person = docs[0]
+        return {'id': person['id'], 'name': person['name']}
+
+    def search_person_by_name(self, name: str) -> Optional[dict]:
+        with span('search_person') as stage:
+            person = self.person_index.get(name)
+            if person is not MISSING:
+                stage['source'] = 'index'
+                return person
+            stage['source'] = 'api'
+            try:
+                person = self._fetch_person(name)
+            except RateLimitExceeded:
+                # Поиск без актёра дал бы не те фильмы — пусть вызывающий решает, что делать
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка поиска персоны '{name}': {e}")
+                return None
+            if person is None:
                 logger.warning(f"Персона не найдена: '{name}'")
+            self.person_index.put(name, person)
+            return person
+
+    def resolve_persons(self, names: Iterable[str], max_workers: int = PERSON_LOOKUP_WORKERS) -> Dict[str, Optional[dict]]:
+        """Параллельно разрешает список имён (прогрев индекса персон)."""
+        names = list(dict.fromkeys(n for n in names if n))
+        result = {name: self.person_index.get(name) for name in names}
+        pending = [name for name, person in result.items() if person is MISSING]
+        if pending:
+            logger.info(f"[KinopoiskClient] Прогрев индекса персон: {len(pending)} запросов к API")
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as pool:
+                for name, person in zip(pending, pool.map(self._resolve_in_background, pending)):
+                    result[name] = person
+        return result
+
+    def _resolve_in_background(self, name: str) -> Optional[dict]:
+        with priority(BACKGROUND):
+            try:
+                return self.search_person_by_name(name)
+            except RateLimitExceeded as e:
+                logger.warning(f"[KinopoiskClient] Персона '{name}' не разрешена: {e}")
                 return None
-        except Exception as e:
-            logger.error(f"Ошибка поиска персоны '{name}': {e}")
-            return None
 
-    def search_movies(
+    def _search_params(
         self,
         genre: Optional[str] = None,
         year: Optional[int] = None,
@@ -43,99 +308,133 @@ class KinopoiskClient:
         kp_rating_min: Optional[float] = None,
         movie_type: str = 'movie',
         query: Optional[str] = None,
-        limit: int = 50
-    ) -> Optional[dict]:
-        params = {
-            'limit': min(limit, 250),
-            'page': 1,
-            'selectFields': [
-                'id', 'name', 'year', 'genres', 'rating', 'votes',
-                'description', 'poster', 'persons', 'countries', 'type'
-            ],
-            'sortField': 'rating.imdb',
-            'sortType': -1,
-            'type': movie_type
-        }
-
-        if query:
-            params['query'] = query
-        if year:
-            params['year'] = year
-        if genre:
-            params['genres.name'] = genre
+        country: Optional[str] = None,
+        limit: int = 50,
+        person: object = MISSING
+    ) -> dict:
+        """person — уже найденная персона для actor (MISSING — искать через search_person_by_name)."""
+        person_id = None
         if actor:
-            person = self.search_person_by_name(actor)
+            if person is MISSING:
+                person = self.search_person_by_name(actor)
             if person:
-                params['persons.id'] = person['id']
+                person_id = person['id']
             else:
                 logger.warning(f"Актёр '{actor}' не найден.")
-        if imdb_rating_min is not None:
-            params['rating.imdb'] = str(imdb_rating_min)
-        if kp_rating_min is not None:
-            params['rating.kp'] = str(kp_rating_min)
-
-        logger.info(f"[KinopoiskClient] Запрос: {params}")
 
-        try:
-            response = self.session.get(self.base_url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            raw_docs = data.get('docs', [])
-
-            logger.info(f"[KinopoiskClient] Получено от API: {len(raw_docs)} фильмов")
+        return build_search_params(
+            genre=genre,
+            year=year,
+            person_id=person_id,
+            imdb_rating_min=imdb_rating_min,
+            kp_rating_min=kp_rating_min,
+            movie_type=movie_type,
+            query=query,
+            country=country,
+            limit=limit
+        )
 
-            if not raw_docs:
-                logger.info("[KinopoiskClient] API вернул пустой результат")
-                return None
+    def peek_search(self, **search_kwargs) -> Tuple[object, Optional[float]]:
+        """Закэшированный ответ search_movies и секунды до его истечения, без запроса к API."""
+        person = MISSING
+        if search_kwargs.get('actor'):
+            # Актёр только из индекса: не найден там — выдачи с ним в кэше тоже нет
+            person = self.person_index.get(search_kwargs['actor'])
+            if person is MISSING:
+                return MISSING, None
+        return self.search_cache.peek(make_cache_key(self._search_params(person=person, **search_kwargs)))
 
-            filtered_docs = []
-            for movie in raw_docs:
-                rating = movie.get('rating', {})
-                votes = movie.get('votes', {})
-
-                # Используем значения из config
-                imdb_val = rating.get('imdb')
-                imdb_votes = votes.get('imdb', 0)
-                kp_val = rating.get('kp')
-                kp_votes = votes.get('kp', 0)
+    def search_movies(
+        self,
+        genre: Optional[str] = None,
+        year: Optional[int] = None,
+        actor: Optional[str] = None,
+        imdb_rating_min: Optional[float] = None,
+        kp_rating_min: Optional[float] = None,
+        movie_type: str = 'movie',
+        query: Optional[str] = None,
+        country: Optional[str] = None,
+        limit: int = 50,
+        refresh: bool = False
+    ) -> Optional[dict]:
+        """refresh=True — запрос к API мимо кэша с перезаписью записи (прогрев кэша)."""
+        params = self._search_params(
+            genre=genre, year=year, actor=actor, imdb_rating_min=imdb_rating_min, kp_rating_min=kp_rating_min,
+            movie_type=movie_type, query=query, country=country, limit=limit
+        )
 
-                imdb_ok = (imdb_rating_min is None) or (imdb_val is not None and imdb_val >= imdb_rating_min)
-                kp_ok = (kp_rating_min is None) or (kp_val is not None and kp_val >= kp_rating_min)
+        logger.info(f"[KinopoiskClient] Запрос: {params}")
 
-                # Проверка по количеству голосов
-                has_enough_imdb = imdb_votes >= MIN_VOTES_IMDB
-                has_enough_kp = kp_votes >= MIN_VOTES_KP
+        cache_key = make_cache_key(params)
+        cached = MISSING if refresh else self.search_cache.get(cache_key)
+        if cached is not MISSING:
+            logger.info("[KinopoiskClient] Ответ из кэша")
+            return cached
 
-                # Фильм проходит, если:
-                # - IMDb рейтинг надёжный И удовлетворяет min_rating, ИЛИ
-                # - KP рейтинг надёжный И удовлетворяет min_rating
-                passes_imdb = imdb_ok and has_enough_imdb
-                passes_kp = kp_ok and has_enough_kp
+        # Такой же запрос уже выполняется в другом потоке — ждём его результат.
+        # Только запрос своего класса приоритета: фоновый лидер уступает чату в лимитере
+        # и может ждать токен до KINOPOISK_BACKGROUND_MAX_WAIT — пользователь ждать его не должен
+        return self.search_flight.do(
+            (current_priority(), cache_key),
+            lambda: self._fetch_search(params, cache_key, imdb_rating_min, kp_rating_min, limit, refresh)
+        )
 
-                if passes_imdb or passes_kp:
-                    filtered_docs.append(movie)
+    def _fetch_search(
+        self,
+        params: dict,
+        cache_key: str,
+        imdb_rating_min: Optional[float],
+        kp_rating_min: Optional[float],
+        limit: int,
+        refresh: bool = False
+    ) -> Optional[dict]:
+        signature = self.pass_rates.signature(params)
+        page_params = dict(params, limit=self.pass_rates.page_size(signature, limit))
+        docs: List[dict] = []
+        data: dict = {}
+        ttl: Optional[float] = None
+        try:
+            while True:
+                data, page_ttl = self._get_json_entry('/movie', self.base_url, params=page_params, refresh=refresh)
+                ttl = min_ttl(ttl, page_ttl)
+                raw_docs = data.get('docs', [])
+                passed = filter_docs(raw_docs, imdb_rating_min, kp_rating_min)
+                self.pass_rates.record(signature, len(raw_docs), len(passed), page_params['page'])
+                docs.extend(passed)
+                logger.info(
+                    f"[KinopoiskClient] Страница {page_params['page']}: {len(raw_docs)} фильмов, "
+                    f"после фильтрации по голосам {len(passed)}"
+                )
+                if not self.pass_rates.should_fetch_more(len(docs), limit, data, page_params['page']):
+                    break
+                page_params['page'] += 1
+        except Exception as e:
+            logger.error(f"[KinopoiskClient] Ошибка поиска фильмов: {e}")
+            if isinstance(e, RateLimitExceeded) and not docs:
+                raise
+            # Неполный ответ отдаём, но не кэшируем
+            return dict(data, docs=docs[:limit]) if docs else None
 
-            logger.info(f"[KinopoiskClient] После фильтрации по голосам осталось: {len(filtered_docs)} фильмов")
+        return cache_search_result(self.search_cache, cache_key, data, docs, limit, ttl)
 
-            if not filtered_docs:
-                logger.info("[KinopoiskClient] Все фильмы отфильтрованы — ни один не прошёл порог голосов")
-                return None
+    def search_by_title(self, title: str, limit: int = 10) -> List[dict]:
+        params = {'query': title, 'limit': limit, 'type': 'movie'}
+        try:
+            return self._get_json('/movie', self.base_url, params=params).get('docs', [])
+        except requests.HTTPError:
+            return []
 
-            result_docs = filtered_docs[:limit]
-            logger.info(f"[KinopoiskClient] Возвращаем {len(result_docs)} фильмов")
-            data['docs'] = result_docs
-            return data
+    def get_movie_details(self, movie_id: int) -> Optional[dict]:
+        return self.get_movie_details_entry(movie_id).value
 
-        except Exception as e:
-            logger.error(f"[KinopoiskClient] Ошибка поиска фильмов: {e}")
-            return None
+    def get_movie_details_entry(self, movie_id: int) -> Expiring:
+        """Карточка фильма (или None) и остаток её жизни в дисковом кэше — для кэша карточек MovieAgent."""
+        return self.details_flight.do((current_priority(), str(movie_id)), lambda: self._fetch_movie_details(movie_id))
 
-    def get_movie_details(self, movie_id: int) -> Optional[dict]:
+    def _fetch_movie_details(self, movie_id: int) -> Expiring:
         url = f"{self.base_url}/{movie_id}"
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            return response.json()
+            return self._get_json_entry('/movie/{id}', url)
         except Exception as e:
             logger.error(f"Ошибка деталей фильма {movie_id}: {e}")
-            return None
\ No newline at end of file
+            return Expiring(None, None)
\ No newline at end of file
@@ -1,5 +1,9 @@
 import requests
-from config import OMDB_API_KEY, OMDB_BASE_URL
+from time import monotonic
+from config import OMDB_API_KEY, OMDB_BASE_URL, OMDB_TIMEOUT
+from src.cache import MISSING
+from src.client.response_cache import get_response_cache
+from src.metrics import METRICS
 
 
 class OMDBClient:
@@ -7,25 +11,33 @@ class OMDBClient:
         self.api_key = OMDB_API_KEY
         self.base_url = OMDB_BASE_URL
         self.session = requests.Session()
+        self.response_cache = get_response_cache()
 
-    def search_movies(self, title=None, year=None, plot="short"):
-        """Поиск фильмов в OMDB API"""
-        params = {
-            'apikey': self.api_key,
-            'plot': plot
-        }
+    def _get(self, endpoint, params):
+        started = monotonic()
+        status = None
+        try:
+            response = self.session.get(self.base_url, params=params, timeout=OMDB_TIMEOUT)
+            status = response.status_code
+            return response
+        finally:
+            METRICS.observe_http('omdb', endpoint, monotonic() - started, status)
 
-        if title:
-            params['t'] = title
-        if year:
-            params['y'] = year
+    def _fetch(self, endpoint, params):
+        """Ответ OMDb или None; найденные фильмы кэшируются на диске (общий кэш воркеров)."""
+        if self.response_cache is not None:
+            cached = self.response_cache.get('omdb', endpoint, self.base_url, params)
+            if cached is not MISSING:
+                return cached
 
         try:
-            response = self.session.get(self.base_url, params=params)
+            response = self._get(endpoint, params)
             response.raise_for_status()
             data = response.json()
 
             if data.get('Response') == 'True':
+                if self.response_cache is not None:
+                    self.response_cache.set('omdb', endpoint, self.base_url, params, data)
                 return data
             else:
                 print(f"OMDB API error: {data.get('Error')}")
@@ -35,6 +47,20 @@ class OMDBClient:
             print(f"Ошибка при запросе к OMDB API: {e}")
             return None
 
+    def search_movies(self, title=None, year=None, plot="short"):
+        """Поиск фильмов в OMDB API"""
+        params = {
+            'apikey': self.api_key,
+            'plot': plot
+        }
+
+        if title:
+            params['t'] = title
+        if year:
+            params['y'] = year
+
+        return self._fetch('/?t', params)
+
     def get_movie_by_id(self, imdb_id):
         """Получение фильма по IMDB ID"""
         params = {
@@ -43,17 +69,4 @@ class OMDBClient:
             'plot': 'full'
         }
 
-        try:
-            response = self.session.get(self.base_url, params=params)
-            response.raise_for_status()
-            data = response.json()
-
-            if data.get('Response') == 'True':
-                return data
-            else:
-                print(f"OMDB API error: {data.get('Error')}")
-                return None
-
-        except requests.exceptions.RequestException as e:
-            print(f"Ошибка при запросе к OMDB API: {e}")
-            return None
\ No newline at end of file
+        return self._fetch('/?i', params)
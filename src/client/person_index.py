@@ -0,0 +1,100 @@
+# src/client/person_index.py
+import os
+import re
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Optional, Dict
+
+from src.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_NON_LETTERS = re.compile(r'[^\w\s]|_')
+
+
+def normalize_person_name(name: str) -> str:
+    """
+    Ключ для имени персоны, устойчивый к вариантам написания:
+    «Леонардо ДиКаприо», «ди Каприо, Леонардо» и «Леонардо Ди-Каприо»
+    дают один и тот же ключ.
+    """
+    if not name:
+        return ''
+    text = name.lower().replace('ё', 'е')
+    text = _NON_LETTERS.sub(' ', text)
+    tokens = sorted(text.split())
+    return ''.join(tokens)
+
+
+class PersonIndex:
+    """Индекс «имя → персона Кинопоиска», сохраняемый на диск между перезапусками."""
+
+    def __init__(self, path: Optional[Path] = None, negative_ttl: float = 3600):
+        self.path = Path(path) if path else None
+        self._persons: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        # Ненайденные имена помним недолго и только в памяти
+        self._not_found = TTLCache(maxsize=1024, ttl=negative_ttl)
+        self._load()
+
+    def _read_file(self) -> Dict[str, dict]:
+        if not self.path or not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"[PersonIndex] Не удалось прочитать {self.path}: {e}")
+            return {}
+
+    def _load(self):
+        self._persons = self._read_file()
+        if self._persons:
+            logger.info(f"[PersonIndex] Загружено {len(self._persons)} записей из {self.path}")
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Файл общий для воркеров gunicorn — не затираем чужие записи
+            for key, person in self._read_file().items():
+                self._persons.setdefault(key, person)
+            tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._persons, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"[PersonIndex] Не удалось сохранить {self.path}: {e}")
+
+    def get(self, name: str):
+        """Персона, None (известно, что не найдена) или MISSING (надо спросить API)."""
+        key = normalize_person_name(name)
+        if not key:
+            return None
+        with self._lock:
+            person = self._persons.get(key)
+        if person is not None:
+            return person
+        return self._not_found.get(key)
+
+    def put(self, name: str, person: Optional[dict]):
+        key = normalize_person_name(name)
+        if not key:
+            return
+        if person is None:
+            self._not_found.set(key, None)
+            return
+        with self._lock:
+            self._persons[key] = person
+            # Каноническое имя тоже ведёт на эту персону. Одну фамилию не сохраняем:
+            # однофамильцев (Крис и Лиам Хемсворт) различает только поиск в API
+            canonical_key = normalize_person_name(person.get('name', ''))
+            if canonical_key:
+                self._persons.setdefault(canonical_key, person)
+            self._save()
+
+    def __len__(self):
+        return len(self._persons)
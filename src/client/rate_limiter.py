@@ -0,0 +1,228 @@
+# src/client/rate_limiter.py
+import random
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic, sleep, time
+from typing import Callable, Dict, Iterator, Optional, TypeVar
+
+from config import (
+    KINOPOISK_RATE_PER_SECOND, KINOPOISK_BURST, KINOPOISK_DAILY_LIMIT, KINOPOISK_BACKGROUND_RESERVE,
+    KINOPOISK_MAX_WAIT, KINOPOISK_BACKGROUND_MAX_WAIT, KINOPOISK_MAX_BACKOFF
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Классы приоритета запросов к API: чат пользователя важнее прогрева кэша и фоновых обновлений
+INTERACTIVE = 'interactive'
+WARMUP = 'warmup'
+BACKGROUND = 'background'
+PRIORITIES = (INTERACTIVE, WARMUP, BACKGROUND)
+
+_priority: ContextVar[str] = ContextVar('kinopoisk_priority', default=INTERACTIVE)
+
+# Суточный лимит kinopoisk.dev обнуляется в полночь по Москве
+_MSK_OFFSET = 3 * 3600
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+@contextmanager
+def priority(name: str) -> Iterator[None]:
+    """Запросы к API внутри блока идут с приоритетом `name` (в этом потоке или задаче asyncio)."""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def with_priority(name: str, fn: Callable[[], T]) -> Callable[[], T]:
+    """fn, который выполнится с приоритетом `name` — для передачи в пулы потоков."""
+    def run() -> T:
+        with priority(name):
+            return fn()
+    return run
+
+
+class RateLimitExceeded(Exception):
+    """Квота API исчерпана или токен не освободился за допустимое время ожидания."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """
+    Планировщик запросов к Кинопоиску по лимитам тарифа.
+
+    Token bucket на `rate` запросов в секунду (с запасом `burst`) и счётчик суточного
+    лимита `daily_limit` (0 — без ограничения). Фоновые классы (прогрев, обновления)
+    не трогают долю `reserve` токенов и суточной квоты и пропускают вперёд ждущие
+    интерактивные запросы. Ответ 429 ставит на паузу все запросы на Retry-After
+    (или экспоненциальную задержку со случайным разбросом).
+
+    Счётчики — на процесс: при нескольких воркерах gunicorn лимиты стоит делить между ними.
+    """
+
+    def __init__(
+        self,
+        rate: float = KINOPOISK_RATE_PER_SECOND,
+        burst: Optional[float] = KINOPOISK_BURST,
+        daily_limit: int = KINOPOISK_DAILY_LIMIT,
+        reserve: float = KINOPOISK_BACKGROUND_RESERVE,
+        max_wait: float = KINOPOISK_MAX_WAIT,
+        background_max_wait: float = KINOPOISK_BACKGROUND_MAX_WAIT,
+        max_backoff: float = KINOPOISK_MAX_BACKOFF
+    ):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.daily_limit = daily_limit
+        self.reserve = reserve
+        self.max_wait = {INTERACTIVE: max_wait, WARMUP: background_max_wait, BACKGROUND: background_max_wait}
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._refilled_at = monotonic()
+        self._day = self._today()
+        self._day_used = 0
+        self._paused_until = 0.0
+        self._waiting = {name: 0 for name in PRIORITIES}
+
+        self.acquired = {name: 0 for name in PRIORITIES}
+        self.delayed = {name: 0 for name in PRIORITIES}
+        self.rejected = {name: 0 for name in PRIORITIES}
+        self.throttled = 0
+
+    @staticmethod
+    def _today() -> int:
+        return int((time() + _MSK_OFFSET) // 86400)
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+        today = self._today()
+        if today != self._day:
+            self._day, self._day_used = today, 0
+
+    def _seconds_to_next_day(self) -> float:
+        return (self._day + 1) * 86400 - (time() + _MSK_OFFSET)
+
+    def _try_acquire(self, name: str) -> float:
+        """0 — токен получен; иначе сколько подождать перед следующей попыткой (inf — до конца суток)."""
+        now = monotonic()
+        with self._lock:
+            self._refill(now)
+            if self._paused_until > now:
+                return self._paused_until - now
+            background = name != INTERACTIVE
+            if self.daily_limit:
+                allowed = self.daily_limit * (1 - self.reserve) if background else self.daily_limit
+                if self._day_used >= allowed:
+                    return float('inf')
+            if background and self._waiting[INTERACTIVE]:
+                return 0.05
+            # Резерв — не больше burst - 1 токена: иначе при burst = 1 (rate <= 1) фоновым не достанется ни одного
+            floor = min(self.burst * self.reserve, self.burst - 1) if background else 0.0
+            if self.rate <= 0 or self._tokens - 1 >= floor:
+                self._tokens -= 1
+                self._day_used += 1
+                self.acquired[name] += 1
+                return 0.0
+            return (floor + 1 - self._tokens) / self.rate
+
+    def _give_up(self, name: str, wait: float):
+        with self._lock:
+            self.rejected[name] += 1
+        retry_after = self._seconds_to_next_day() if wait == float('inf') else wait
+        reason = "суточный лимит исчерпан" if wait == float('inf') else f"нужно ждать {wait:.1f} с"
+        raise RateLimitExceeded(f"Лимит запросов к Кинопоиску ({name}): {reason}", retry_after=retry_after)
+
+    def acquire(self, name: Optional[str] = None):
+        """Ждёт токен не дольше max_wait для класса; иначе RateLimitExceeded."""
+        name = name or current_priority()
+        wait = self._try_acquire(name)
+        if not wait:
+            return
+        deadline = monotonic() + self.max_wait[name]
+        with self._lock:
+            self.delayed[name] += 1
+            self._waiting[name] += 1
+        try:
+            while wait:
+                if monotonic() + wait > deadline:
+                    self._give_up(name, wait)
+                sleep(wait)
+                wait = self._try_acquire(name)
+        finally:
+            with self._lock:
+                self._waiting[name] -= 1
+
+    async def acquire_async(self, name: Optional[str] = None):
+        name = name or current_priority()
+        wait = self._try_acquire(name)
+        if not wait:
+            return
+        deadline = monotonic() + self.max_wait[name]
+        with self._lock:
+            self.delayed[name] += 1
+            self._waiting[name] += 1
+        try:
+            while wait:
+                if monotonic() + wait > deadline:
+                    self._give_up(name, wait)
+                await asyncio.sleep(wait)
+                wait = self._try_acquire(name)
+        finally:
+            with self._lock:
+                self._waiting[name] -= 1
+
+    def available(self, name: str) -> bool:
+        """Есть ли у класса шанс получить токен без долгого ожидания (для планировщиков вроде CacheWarmer)."""
+        with self._lock:
+            self._refill(monotonic())
+            if self._paused_until > monotonic():
+                return False
+            if self.daily_limit and name != INTERACTIVE:
+                return self._day_used < self.daily_limit * (1 - self.reserve)
+            return not self.daily_limit or self._day_used < self.daily_limit
+
+    def on_throttled(self, retry_after: Optional[str], attempt: int) -> float:
+        """Ответ 429: пауза для всех запросов; возвращает её длительность в секундах."""
+        try:
+            delay = float(retry_after) if retry_after else None
+        except ValueError:
+            delay = None  # Retry-After датой HTTP встречается редко — считаем как без заголовка
+        if delay is None:
+            delay = min(self.max_backoff, 0.5 * 2 ** attempt)
+        # Разброс, чтобы потоки и воркеры не вернулись в API одновременно
+        delay = min(self.max_backoff, delay) * random.uniform(1.0, 1.5)
+        with self._lock:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, monotonic() + delay)
+            self._tokens = min(self._tokens, 0.0)
+        logger.warning(f"[RateLimiter] Кинопоиск ответил 429, пауза {delay:.1f} с")
+        return delay
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = monotonic()
+            self._refill(now)
+            return {
+                'tokens': round(max(self._tokens, 0.0), 2),
+                'daily_used': self._day_used,
+                'daily_remaining': max(self.daily_limit - self._day_used, 0) if self.daily_limit else None,
+                'paused_seconds': round(max(self._paused_until - now, 0.0), 2),
+                'throttled': self.throttled,
+                'acquired': dict(self.acquired),
+                'delayed': dict(self.delayed),
+                'rejected': dict(self.rejected)
+            }
@@ -0,0 +1,196 @@
+# src/client/response_cache.py
+import os
+import json
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+from time import time
+from typing import Any, Dict, Optional, Tuple, Union
+
+from src.cache import MISSING
+from config import RESPONSE_CACHE_PATH, RESPONSE_CACHE_MAX_MB, RESPONSE_CACHE_TTLS
+
+logger = logging.getLogger(__name__)
+
+# Ключи API в параметрах не должны попадать в ключ кэша (и различать одинаковые запросы)
+SECRET_PARAMS = {'apikey', 'api_key'}
+
+Params = Union[Dict[str, Any], list, None]
+
+
+class ResponseCache:
+    """
+    Кэш JSON-ответов внешних API в SQLite-файле (WAL): общий для воркеров gunicorn
+    и переживает перезапуск. Тела хранятся сжатыми (zlib), TTL задаётся по
+    «сервис эндпоинт» или по сервису целиком (0 — не кэшировать). Когда файл
+    перерастает max_bytes, вытесняются давно не читавшиеся записи.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = 3600,
+        prune_every: int = 200,
+        touch_interval: float = 300
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self.prune_every = prune_every
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_pid: Optional[int] = None
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Соединение, открытое до fork, в воркере не используем
+        if self._db is None or self._db_pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS responses '
+                '(key TEXT PRIMARY KEY, endpoint TEXT NOT NULL, body BLOB NOT NULL, size INTEGER NOT NULL, '
+                'expires_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)')
+            db.commit()
+            self._db, self._db_pid = db, os.getpid()
+        return self._db
+
+    @staticmethod
+    def make_key(service: str, url: str, params: Params = None) -> str:
+        # dict (requests) и список пар (aiohttp) с одинаковыми параметрами дают один ключ
+        pairs = []
+        items = params.items() if isinstance(params, dict) else (params or [])
+        for name, value in items:
+            if name in SECRET_PARAMS or value is None:
+                continue
+            values = value if isinstance(value, (list, tuple)) else [value]
+            pairs.extend((str(name), str(v)) for v in values)
+        raw = json.dumps([service, url, sorted(pairs)], ensure_ascii=False)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def ttl_for(self, service: str, endpoint: str) -> float:
+        return self.ttls.get(f"{service} {endpoint}", self.ttls.get(service, self.default_ttl))
+
+    def get(self, service: str, endpoint: str, url: str, params: Params = None) -> Any:
+        """Разобранный JSON или MISSING."""
+        return self.get_with_ttl(service, endpoint, url, params)[0]
+
+    def get_with_ttl(self, service: str, endpoint: str, url: str, params: Params = None) -> Tuple[Any, Optional[float]]:
+        """(разобранный JSON, секунд до истечения) или (MISSING, None) — для кэшей в памяти поверх этого."""
+        if not self.ttl_for(service, endpoint):
+            return MISSING, None
+        key = self.make_key(service, url, params)
+        now = time()
+        try:
+            with self._lock:
+                db = self._connection()
+                row = db.execute(
+                    'SELECT body, expires_at, accessed_at FROM responses WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None and row[1] > now and now - row[2] > self.touch_interval:
+                    # Время чтения — для вытеснения; обновляем не чаще touch_interval
+                    db.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+                    db.commit()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"[ResponseCache] Ошибка чтения: {e}")
+            return MISSING, None
+        if row is None or row[1] <= now:
+            self.misses += 1
+            return MISSING, None
+        try:
+            value = json.loads(zlib.decompress(row[0]))
+        except (zlib.error, ValueError) as e:
+            self.errors += 1
+            logger.warning(f"[ResponseCache] Повреждённая запись {endpoint}: {e}")
+            return MISSING, None
+        self.hits += 1
+        return value, row[1] - now
+
+    def set(self, service: str, endpoint: str, url: str, params: Params, data: Any):
+        ttl = self.ttl_for(service, endpoint)
+        if not ttl:
+            return
+        body = zlib.compress(json.dumps(data, ensure_ascii=False).encode('utf-8'), 6)
+        now = time()
+        try:
+            with self._lock:
+                db = self._connection()
+                db.execute(
+                    'INSERT OR REPLACE INTO responses (key, endpoint, body, size, expires_at, accessed_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (self.make_key(service, url, params), f"{service} {endpoint}", body, len(body), now + ttl, now)
+                )
+                self._writes += 1
+                if self._writes % self.prune_every == 0:
+                    self._prune(db, now)
+                db.commit()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"[ResponseCache] Ошибка записи: {e}")
+
+    def _prune(self, db: sqlite3.Connection, now: float):
+        removed = db.execute('DELETE FROM responses WHERE expires_at <= ?', (now,)).rowcount
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total > self.max_bytes:
+            # Оставляем недавно читавшиеся записи на 90% лимита, чтобы не чистить на каждой записи
+            removed += db.execute(
+                'DELETE FROM responses WHERE key IN ('
+                'SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS kept '
+                'FROM responses) WHERE kept > ?)',
+                (int(self.max_bytes * 0.9),)
+            ).rowcount
+        self.evictions += removed
+
+    def stats(self) -> Dict[str, int]:
+        try:
+            with self._lock:
+                count, size = self._connection().execute(
+                    'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses'
+                ).fetchone()
+        except sqlite3.Error:
+            count, size = None, None
+        return {
+            'size': count,
+            'bytes': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'errors': self.errors
+        }
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Один кэш на процесс для всех клиентов; None — RESPONSE_CACHE_PATH не задан."""
+    global _cache
+    if not RESPONSE_CACHE_PATH:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    RESPONSE_CACHE_PATH,
+                    max_bytes=int(RESPONSE_CACHE_MAX_MB * 1024 * 1024),
+                    ttls=RESPONSE_CACHE_TTLS
+                )
+    return _cache
@@ -1,6 +1,12 @@
 # src/client/tmdb_client.py
-import os
+import re
 import requests
+from time import monotonic
+
+from config import TMDB_API_KEY, TMDB_BASE_URL
+from src.cache import MISSING
+from src.client.response_cache import get_response_cache
+from src.metrics import METRICS
 
 class TMDBClient:
     def __init__(self, proxies=None):
@@ -8,9 +14,10 @@ class TMDBClient:
         Инициализация клиента TMDB
         :param proxies: словарь прокси вида {'http': '...', 'https': '...'}, опционально
         """
-        self.api_key = os.getenv("TMDB_API_KEY")
-        self.base_url = "https://api.themoviedb.org/3"
+        self.api_key = TMDB_API_KEY
+        self.base_url = TMDB_BASE_URL
         self.proxies = proxies  # сохраняем прокси, если переданы
+        self.response_cache = get_response_cache()
 
     def _make_request(self, url, params=None):
         """
@@ -18,7 +25,16 @@ class TMDBClient:
         """
         params = params or {}
         params['api_key'] = self.api_key
+        endpoint = re.sub(r'/\d+', '/{id}', url[len(self.base_url):] if url.startswith(self.base_url) else url)
+
+        # Ответы TMDB меняются редко — берём из общего кэша воркеров на диске
+        if self.response_cache is not None:
+            cached = self.response_cache.get('tmdb', endpoint, url, params)
+            if cached is not MISSING:
+                return cached
 
+        started = monotonic()
+        status = None
         try:
             # 👇 Используем прокси, если они переданы
             response = requests.get(
@@ -27,11 +43,17 @@ class TMDBClient:
                 proxies=self.proxies,
                 timeout=(20, 30)
             )
+            status = response.status_code
             response.raise_for_status()
-            return response.json()
+            data = response.json()
         except Exception as e:
             print(f"Ошибка TMDB API: {e}")
             return None
+        finally:
+            METRICS.observe_http('tmdb', endpoint, monotonic() - started, status)
+        if self.response_cache is not None:
+            self.response_cache.set('tmdb', endpoint, url, params, data)
+        return data
 
     def get_genres(self):
         """
@@ -62,4 +84,16 @@ class TMDBClient:
         Получение детальной информации о фильме
         """
         url = f"{self.base_url}/movie/{movie_id}"
-        return self._make_request(url, {"language": "ru-RU"})
\ No newline at end of file
+        return self._make_request(url, {"language": "ru-RU"})
+
+    def search_movie(self, title, year=None):
+        """
+        Первый результат поиска фильма по названию (и году)
+        """
+        url = f"{self.base_url}/search/movie"
+        params = {"query": title, "language": "ru-RU"}
+        if year:
+            params["year"] = year
+        data = self._make_request(url, params)
+        results = data.get("results", []) if data else []
+        return results[0] if results else None
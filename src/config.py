@@ -6,9 +6,148 @@ load_dotenv()
 TMDB_API_KEY = os.getenv('TMDB_API_KEY')
 OMDB_API_KEY = os.getenv('OMDB_API_KEY')
 KINOPOISK_API_KEY = os.getenv('KINOPOISK_API_KEY')
-TMDB_BASE_URL = 'https://api.themoviedb.org/3'
-OMDB_BASE_URL = 'http://www.omdbapi.com/'
-KINOPOISK_URL = 'https://api.kinopoisk.dev'
+TMDB_BASE_URL = os.getenv('TMDB_BASE_URL', 'https://api.themoviedb.org/3')
+TMDB_IMAGE_URL = os.getenv('TMDB_IMAGE_URL', 'https://image.tmdb.org/t/p/w342')
+OMDB_BASE_URL = os.getenv('OMDB_BASE_URL', 'http://www.omdbapi.com/')
+# Таймаут запросов к OMDb (секунды)
+OMDB_TIMEOUT = float(os.getenv("OMDB_TIMEOUT", 5))
+KINOPOISK_URL = os.getenv('KINOPOISK_URL', 'https://api.kinopoisk.dev')
 
 MIN_VOTES_IMDB = int(os.getenv("MIN_VOTES_IMDB", 2000))
-MIN_VOTES_KP = int(os.getenv("MIN_VOTES_KP", 500))
\ No newline at end of file
+MIN_VOTES_KP = int(os.getenv("MIN_VOTES_KP", 500))
+
+# Размер пула keep-alive соединений на хост (для потоковых воркеров gunicorn)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))
+
+# Кэш результатов KinopoiskClient.search_movies (TTL в секундах)
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 512))
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 3600))
+SEARCH_CACHE_NEGATIVE_TTL = int(os.getenv("SEARCH_CACHE_NEGATIVE_TTL", 300))
+
+# Индекс «имя актёра → id персоны Кинопоиска», переживает перезапуски
+PERSON_INDEX_PATH = os.getenv(
+    "PERSON_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "cache", "person_index.json")
+)
+PERSON_LOOKUP_WORKERS = int(os.getenv("PERSON_LOOKUP_WORKERS", 8))
+
+# Кэш карточек фильмов MovieAgent.get_movie_by_id (stale-while-revalidate)
+DETAILS_CACHE_SIZE = int(os.getenv("DETAILS_CACHE_SIZE", 2048))
+DETAILS_CACHE_TTL = int(os.getenv("DETAILS_CACHE_TTL", 6 * 3600))
+DETAILS_CACHE_MAX_STALE = int(os.getenv("DETAILS_CACHE_MAX_STALE", 7 * 24 * 3600))
+
+# Асинхронный клиент Кинопоиска: одновременные запросы и таймауты (секунды)
+KINOPOISK_MAX_IN_FLIGHT = int(os.getenv("KINOPOISK_MAX_IN_FLIGHT", 20))
+KINOPOISK_CONNECT_TIMEOUT = float(os.getenv("KINOPOISK_CONNECT_TIMEOUT", 3))
+KINOPOISK_READ_TIMEOUT = float(os.getenv("KINOPOISK_READ_TIMEOUT", 10))
+
+# Лимиты тарифа kinopoisk.dev: запросов в секунду (0 — без ограничения) с запасом BURST и в сутки
+# (0 — без ограничения; сутки — по Москве). Прогрев кэша и фоновые обновления не трогают
+# долю KINOPOISK_BACKGROUND_RESERVE квоты — она остаётся чату. Сколько секунд запрос ждёт
+# токен (интерактивный / фоновый) и сколько раз повторяется после 429. Счётчики — на процесс.
+KINOPOISK_RATE_PER_SECOND = float(os.getenv("KINOPOISK_RATE_PER_SECOND", 10))
+KINOPOISK_BURST = float(os.getenv("KINOPOISK_BURST", 0)) or None
+KINOPOISK_DAILY_LIMIT = int(os.getenv("KINOPOISK_DAILY_LIMIT", 0))
+KINOPOISK_BACKGROUND_RESERVE = float(os.getenv("KINOPOISK_BACKGROUND_RESERVE", 0.2))
+KINOPOISK_MAX_WAIT = float(os.getenv("KINOPOISK_MAX_WAIT", 3))
+KINOPOISK_BACKGROUND_MAX_WAIT = float(os.getenv("KINOPOISK_BACKGROUND_MAX_WAIT", 30))
+KINOPOISK_MAX_RETRIES = int(os.getenv("KINOPOISK_MAX_RETRIES", 2))
+KINOPOISK_MAX_BACKOFF = float(os.getenv("KINOPOISK_MAX_BACKOFF", 30))
+
+# Постраничный поиск фильмов: размер страницы подбирается по доле документов, проходящих
+# фильтр голосов (для каждого набора фильтров); больше KINOPOISK_MAX_PAGES страниц не запрашиваем
+KINOPOISK_MAX_PAGES = int(os.getenv("KINOPOISK_MAX_PAGES", 3))
+KINOPOISK_DEFAULT_PASS_RATE = float(os.getenv("KINOPOISK_DEFAULT_PASS_RATE", 0.25))
+
+# Telegram-бот: сколько диалогов обрабатывается одновременно
+TELEGRAM_WORKERS = int(os.getenv("TELEGRAM_WORKERS", 8))
+
+# Кэш параметров, извлечённых LLM из сообщений (PARAMS_CACHE_PATH — SQLite-файл, если нужен на диске)
+PARAMS_CACHE_SIZE = int(os.getenv("PARAMS_CACHE_SIZE", 2048))
+PARAMS_CACHE_TTL = int(os.getenv("PARAMS_CACHE_TTL", 7 * 24 * 3600))
+PARAMS_CACHE_PATH = os.getenv("PARAMS_CACHE_PATH") or None
+
+# Разбор простых запросов без LLM (жанр, год, количество, настроение)
+FAST_EXTRACTOR_ENABLED = os.getenv("FAST_EXTRACTOR_ENABLED", "true").lower() == "true"
+
+# GigaChat: таймауты completions, заблаговременное обновление токена и (опционально)
+# файл, через который токен делят воркеры gunicorn
+GIGACHAT_CONNECT_TIMEOUT = float(os.getenv("GIGACHAT_CONNECT_TIMEOUT", 5))
+GIGACHAT_READ_TIMEOUT = float(os.getenv("GIGACHAT_READ_TIMEOUT", 60))
+GIGACHAT_TOKEN_REFRESH_AHEAD = int(os.getenv("GIGACHAT_TOKEN_REFRESH_AHEAD", 300))
+GIGACHAT_TOKEN_CACHE_PATH = os.getenv("GIGACHAT_TOKEN_CACHE_PATH") or None
+# Адреса OAuth и completions (переопределяются, например, для локальных заглушек в benchmarks/)
+GIGACHAT_AUTH_URL = os.getenv("GIGACHAT_AUTH_URL", "https://ngw.devices.sberbank.ru:9443/api/v2/oauth")
+GIGACHAT_API_URL = os.getenv("GIGACHAT_API_URL", "https://gigachat.devices.sberbank.ru/api/v1/chat/completions")
+
+# LLMRouter: circuit breaker (ошибок подряд / секунд паузы) и хеджирование медленных ответов
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", 3))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 30))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", 0.5))
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", 3))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+
+# «Похожие фильмы» по локальному каталогу MovieLens вместо запроса к API
+SIMILARITY_ENABLED = os.getenv("SIMILARITY_ENABLED", "true").lower() == "true"
+
+# Короткие описания фильмов в подборках: off | batch (один запрос к LLM на всю подборку) |
+# concurrent (запросы по каждому фильму параллельно, не больше LIST_DESCRIPTIONS_WORKERS)
+LIST_DESCRIPTIONS_MODE = os.getenv("LIST_DESCRIPTIONS_MODE", "off").lower()
+LIST_DESCRIPTIONS_WORKERS = int(os.getenv("LIST_DESCRIPTIONS_WORKERS", 4))
+
+# Состояние диалога веб-чата хранится на сервере, в cookie — только id сессии.
+# sqlite — файл SESSION_DB_PATH, общий для воркеров gunicorn; memory — в памяти воркера,
+# годится только для одного воркера (иначе следующий ход диалога может попасть к другому и потерять контекст)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite").lower()
+SESSION_DB_PATH = os.getenv(
+    "SESSION_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "cache", "sessions.sqlite3")
+)
+SESSION_MAX = int(os.getenv("SESSION_MAX", 10000))
+SESSION_TTL = int(os.getenv("SESSION_TTL", 24 * 3600))
+
+# Спекулятивный поиск по догадке локальных эвристик, пока LLM извлекает параметры
+SPECULATION_ENABLED = os.getenv("SPECULATION_ENABLED", "true").lower() == "true"
+SPECULATION_WORKERS = int(os.getenv("SPECULATION_WORKERS", 4))
+
+# Фоновый прогрев кэша поиска: популярные наборы параметров recommend_movies (жанры из
+# MOOD_TO_GENRE × последние годы × «топ», плюс частые запросы пользователей) обновляются
+# раньше, чем истекут. Квота — запросов к Кинопоиску за один проход; у каждого воркера
+# gunicorn свой кэш и свой прогрев. CACHE_WARMER_QUERIES_PATH — JSON-список наборов
+# аргументов recommend_movies вместо встроенного (ключ "mood" раскрывается в жанры).
+CACHE_WARMER_ENABLED = os.getenv("CACHE_WARMER_ENABLED", "false").lower() == "true"
+CACHE_WARMER_INTERVAL = float(os.getenv("CACHE_WARMER_INTERVAL", 600))
+CACHE_WARMER_BUDGET = int(os.getenv("CACHE_WARMER_BUDGET", 100))
+CACHE_WARMER_YEARS = int(os.getenv("CACHE_WARMER_YEARS", 3))
+CACHE_WARMER_TRAFFIC_TOP = int(os.getenv("CACHE_WARMER_TRAFFIC_TOP", 50))
+CACHE_WARMER_QUERIES_PATH = os.getenv("CACHE_WARMER_QUERIES_PATH") or None
+
+# Кэш ответов внешних API на диске (SQLite, WAL): общий для воркеров gunicorn и переживает
+# перезапуск. Пустой RESPONSE_CACHE_PATH отключает кэш. TTL (секунды) — по «сервис эндпоинт»
+# или сервису; RESPONSE_CACHE_TTLS="omdb=86400,kinopoisk /movie=600" переопределяет значения, 0 — не кэшировать
+RESPONSE_CACHE_PATH = os.getenv(
+    "RESPONSE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "cache", "responses.sqlite3")
+) or None
+RESPONSE_CACHE_MAX_MB = float(os.getenv("RESPONSE_CACHE_MAX_MB", 256))
+RESPONSE_CACHE_TTLS = {
+    'kinopoisk /movie': SEARCH_CACHE_TTL,
+    'kinopoisk /movie/{id}': DETAILS_CACHE_TTL,
+    'kinopoisk /person/search': 7 * 24 * 3600,
+    'omdb': 7 * 24 * 3600,
+    'tmdb': 24 * 3600,
+}
+RESPONSE_CACHE_TTLS.update({
+    name.strip(): float(ttl)
+    for name, _, ttl in (item.rpartition('=') for item in os.getenv("RESPONSE_CACHE_TTLS", "").split(',') if '=' in item)
+})
+
+# Обогащение карточек данными OMDb (Metascore, Rotten Tomatoes) и TMDB (постер, популярность):
+# запросы к источникам параллельны, ответ ждёт их не дольше ENRICHMENT_DEADLINE секунд.
+# Опоздавшие ответы дописываются в кэш и пригодятся в следующий раз. Источник без ключа API пропускается
+ENRICHMENT_ENABLED = os.getenv("ENRICHMENT_ENABLED", "true").lower() == "true"
+ENRICHMENT_DEADLINE = float(os.getenv("ENRICHMENT_DEADLINE", 0.8))
+ENRICHMENT_WORKERS = int(os.getenv("ENRICHMENT_WORKERS", 8))
+ENRICHMENT_CACHE_SIZE = int(os.getenv("ENRICHMENT_CACHE_SIZE", 4096))
+ENRICHMENT_CACHE_TTL = int(os.getenv("ENRICHMENT_CACHE_TTL", 24 * 3600))
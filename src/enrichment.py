@@ -0,0 +1,182 @@
+# src/enrichment.py
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from src.cache import TTLCache, MISSING
+from config import (
+    OMDB_API_KEY, TMDB_API_KEY, TMDB_IMAGE_URL, ENRICHMENT_DEADLINE, ENRICHMENT_WORKERS,
+    ENRICHMENT_CACHE_SIZE, ENRICHMENT_CACHE_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+# Пустой ответ бывает и при ошибке сети (клиенты возвращают None) — его кэшируем ненадолго
+EMPTY_RESULT_TTL = 600
+
+
+def omdb_fields(data: Optional[Dict]) -> Dict[str, Any]:
+    """Metascore и Rotten Tomatoes из ответа OMDb ('N/A' — нет данных)."""
+    if not data:
+        return {}
+    ratings = {r.get('Source'): r.get('Value') for r in data.get('Ratings') or []}
+    fields = {
+        'metascore': data.get('Metascore'),
+        'rotten_tomatoes': ratings.get('Rotten Tomatoes'),
+        'imdb_id': data.get('imdbID')
+    }
+    return {k: v for k, v in fields.items() if v and v != 'N/A'}
+
+
+def tmdb_fields(data: Optional[Dict]) -> Dict[str, Any]:
+    """Постер и популярность из ответа TMDB (карточка или результат поиска)."""
+    if not data:
+        return {}
+    fields = {
+        'poster': f"{TMDB_IMAGE_URL}{data['poster_path']}" if data.get('poster_path') else None,
+        'popularity': round(data['popularity'], 1) if data.get('popularity') else None
+    }
+    return {k: v for k, v in fields.items() if v}
+
+
+class EnrichmentJob:
+    """Запущенное обогащение подборки; result() ждёт источники до общего дедлайна."""
+
+    def __init__(self, enricher: 'MovieEnricher', movies: List[Dict], extras: List[Dict], pending: Dict[Future, int], deadline: float):
+        self.enricher = enricher
+        self.movies = movies
+        self.extras = extras
+        self.pending = pending
+        self.deadline_at = monotonic() + deadline
+
+    def result(self) -> List[Dict]:
+        """Копии карточек с полями, пришедшими до дедлайна; остальные источники дорабатывают в фоне."""
+        if self.pending:
+            done, not_done = wait(self.pending, timeout=max(0.0, self.deadline_at - monotonic()))
+            for future in done:
+                if future.exception() is None:
+                    self.extras[self.pending[future]].update(future.result())
+            self.enricher.count(merged=len(done), late=len(not_done))
+        return [dict(movie, **extra) if extra else movie for movie, extra in zip(self.movies, self.extras)]
+
+
+class MovieEnricher:
+    """
+    Дополняет карточки MovieAgent данными OMDb (Metascore, Rotten Tomatoes) и TMDB
+    (постер, популярность). Запросы ко всем источникам по всем фильмам идут параллельно,
+    но ответ ждёт их не дольше дедлайна: что не успело — не показывается сейчас,
+    а попадает в кэш по завершении. Фильм ищется по imdb/tmdb id из Кинопоиска,
+    иначе по оригинальному названию и году.
+    """
+
+    def __init__(
+        self,
+        omdb_client=None,
+        tmdb_client=None,
+        deadline: float = ENRICHMENT_DEADLINE,
+        workers: int = ENRICHMENT_WORKERS,
+        cache_size: int = ENRICHMENT_CACHE_SIZE,
+        cache_ttl: float = ENRICHMENT_CACHE_TTL
+    ):
+        self.deadline = deadline
+        self.sources: Dict[str, Callable[[Dict], Dict[str, Any]]] = {}
+        if omdb_client is not None:
+            self.omdb = omdb_client
+            self.sources['omdb'] = self._from_omdb
+        if tmdb_client is not None:
+            self.tmdb = tmdb_client
+            self.sources['tmdb'] = self._from_tmdb
+        # Результат по (источник, фильм); {} — источник фильма не знает или не ответил
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='enrich')
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.merged = 0
+        self.late = 0
+        self.failed = 0
+
+    @staticmethod
+    def _movie_key(movie: Dict) -> Optional[Hashable]:
+        if movie.get('id') is not None:
+            return movie['id']
+        title = movie.get('original_title') or movie.get('title')
+        return (title.lower(), movie.get('year')) if title else None
+
+    def _from_omdb(self, movie: Dict) -> Dict[str, Any]:
+        if movie.get('imdb_id'):
+            return omdb_fields(self.omdb.get_movie_by_id(movie['imdb_id']))
+        # OMDb знает только оригинальные (английские) названия
+        if movie.get('original_title'):
+            return omdb_fields(self.omdb.search_movies(title=movie['original_title'], year=movie.get('year')))
+        return {}
+
+    def _from_tmdb(self, movie: Dict) -> Dict[str, Any]:
+        if movie.get('tmdb_id'):
+            return tmdb_fields(self.tmdb.get_movie_details(movie['tmdb_id']))
+        title = movie.get('original_title') or movie.get('title')
+        return tmdb_fields(self.tmdb.search_movie(title, movie.get('year'))) if title else {}
+
+    def _run(self, key: Hashable, source: str, movie: Dict) -> Dict[str, Any]:
+        try:
+            result = self.sources[source](movie)
+            self.cache.set(key, result, ttl=None if result else min(EMPTY_RESULT_TTL, self.cache.ttl))
+            return result
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logger.warning(f"[Enrichment] {source}: не удалось обогатить «{movie.get('title')}»: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def start(self, movies: List[Dict], deadline: Optional[float] = None) -> EnrichmentJob:
+        """Запускает запросы к источникам и сразу возвращается; ждать — EnrichmentJob.result()."""
+        extras: List[Dict] = [{} for _ in movies]
+        pending: Dict[Future, int] = {}
+        for i, movie in enumerate(movies):
+            movie_key = self._movie_key(movie)
+            if movie_key is None:
+                continue
+            for source in self.sources:
+                key = (source, movie_key)
+                cached = self.cache.get(key)
+                if cached is not MISSING:
+                    extras[i].update(cached)
+                    continue
+                with self._lock:
+                    # Тот же фильм уже запрошен другим пользователем — ждём тот же запрос
+                    future = self._inflight.get(key)
+                    if future is None:
+                        future = self._inflight[key] = self._executor.submit(self._run, key, source, movie)
+                pending[future] = i
+        return EnrichmentJob(self, movies, extras, pending, self.deadline if deadline is None else deadline)
+
+    def enrich(self, movies: List[Dict], deadline: Optional[float] = None) -> List[Dict]:
+        return self.start(movies, deadline).result()
+
+    def count(self, merged: int = 0, late: int = 0):
+        with self._lock:
+            self.merged += merged
+            self.late += late
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'merged': self.merged,
+                'late': self.late,
+                'failed': self.failed,
+                'in_flight': len(self._inflight)
+            }
+
+
+def create_enricher() -> MovieEnricher:
+    """Источники — только с ключами API (OMDB_API_KEY, TMDB_API_KEY)."""
+    from src.client.omdb_client import OMDBClient
+    from src.client.tmdb_client import TMDBClient
+    return MovieEnricher(
+        omdb_client=OMDBClient() if OMDB_API_KEY else None,
+        tmdb_client=TMDBClient() if TMDB_API_KEY else None
+    )
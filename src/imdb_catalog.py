@@ -0,0 +1,180 @@
+# src/imdb_catalog.py
+import logging
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Жанры Кинопоиска (их возвращает LLM) → жанры IMDb из CSV
+RU_TO_IMDB_GENRE = {
+    "комедия": "comedy",
+    "драма": "drama",
+    "боевик": "action",
+    "триллер": "thriller",
+    "ужасы": "horror",
+    "фантастика": "sci-fi",
+    "мелодрама": "romance",
+    "романтика": "romance",
+    "детектив": "mystery",
+    "мистика": "mystery",
+    "приключения": "adventure",
+    "мультфильм": "animation",
+    "семейный": "family",
+    "биография": "biography",
+    "военный": "war",
+    "история": "history",
+    "исторический": "history",
+    "криминал": "crime",
+    "мюзикл": "musical",
+    "музыка": "music",
+    "фэнтези": "fantasy",
+    "вестерн": "western",
+    "спорт": "sport",
+    "фильм-нуар": "film-noir",
+}
+
+
+def _person_keys(name: str) -> List[str]:
+    # «Christopher Nolan» ищется и по полному имени, и по фамилии
+    name = (name or '').strip().lower()
+    if not name:
+        return []
+    parts = name.split()
+    return [name, parts[-1]] if len(parts) > 1 else [name]
+
+
+class ImdbCatalog:
+    """
+    Колоночный индекс imdb_top_1000.csv: CSV читается один раз, жанры хранятся
+    битовыми масками, год и рейтинг — типизированными массивами NumPy,
+    режиссёры и актёры — инвертированными индексами. Фильтры — векторные маски.
+    """
+
+    def __init__(self, path: Path):
+        df = pd.read_csv(path)
+        n = len(df)
+
+        self.titles = df['Series_Title'].str.title().to_numpy(dtype=object)
+        self.years = pd.to_numeric(df['Released_Year'], errors='coerce').fillna(-1).astype(np.int32).to_numpy()
+        self.ratings = pd.to_numeric(df['IMDB_Rating'], errors='coerce').fillna(0).astype(np.float32).to_numpy()
+
+        genre_lists = [
+            [g.strip().lower() for g in str(value).split(',') if g.strip()]
+            for value in df['Genre'].fillna('')
+        ]
+        self.genre_names = sorted({g for genres in genre_lists for g in genres})
+        self.genre_bits = {g: np.uint64(1) << np.uint64(i) for i, g in enumerate(self.genre_names)}
+        self.genre_masks = np.zeros(n, dtype=np.uint64)
+        for row, genres in enumerate(genre_lists):
+            for g in genres:
+                self.genre_masks[row] |= self.genre_bits[g]
+
+        self.director_index = self._build_person_index(df[['Director']])
+        self.star_index = self._build_person_index(df[['Star1', 'Star2', 'Star3', 'Star4']])
+
+        # Готовые записи в формате MovieAgent (остальные колонки CSV сохраняются как были)
+        self.records: List[Dict] = []
+        for row, raw in enumerate(df.to_dict('records')):
+            raw.pop('Series_Title', None)
+            raw.pop('Genre', None)
+            raw.update({
+                'id': None,
+                'title': self.titles[row],
+                'year': int(self.years[row]) if self.years[row] >= 0 else None,
+                'Released_Year': int(self.years[row]) if self.years[row] >= 0 else None,
+                'genre': ', '.join(g.title() for g in genre_lists[row]) or '—',
+                'country': 'США',
+                'rating_imdb': raw.get('IMDB_Rating'),
+                'rating_kp': None,
+                'rating': raw.get('IMDB_Rating', '—'),
+                'description': 'Описание недоступно в CSV.'
+            })
+            self.records.append(raw)
+
+        logger.info(f"[ImdbCatalog] Загружено {n} фильмов, {len(self.genre_names)} жанров")
+
+    @staticmethod
+    def _build_person_index(columns: pd.DataFrame) -> Dict[str, np.ndarray]:
+        index = defaultdict(list)
+        for row, names in enumerate(columns.itertuples(index=False)):
+            for name in names:
+                if isinstance(name, str):
+                    for key in _person_keys(name):
+                        index[key].append(row)
+        return {key: np.unique(np.array(rows, dtype=np.int32)) for key, rows in index.items()}
+
+    def _genre_bit(self, genre_name: str) -> np.uint64:
+        name = genre_name.strip().lower()
+        name = RU_TO_IMDB_GENRE.get(name, name)
+        bit = np.uint64(0)
+        # Как и str.contains раньше: «sci» найдёт «sci-fi»
+        for g, g_bit in self.genre_bits.items():
+            if name in g:
+                bit |= g_bit
+        return bit
+
+    def _person_mask(self, index: Dict[str, np.ndarray], name: str) -> Optional[np.ndarray]:
+        """Маска фильмов персоны; None — имени нет в индексе (например, LLM дала его по-русски, а в CSV — английские)."""
+        for key in _person_keys(name):
+            rows = index.get(key)
+            if rows is not None:
+                mask = np.zeros(len(self.records), dtype=bool)
+                mask[rows] = True
+                return mask
+        return None
+
+    def filter(
+        self,
+        genre_name: Optional[str] = None,
+        year: Optional[int] = None,
+        min_rating: Optional[float] = None,
+        director: Optional[str] = None,
+        star: Optional[str] = None
+    ) -> np.ndarray:
+        """Индексы строк, прошедших все фильтры."""
+        mask = np.ones(len(self.records), dtype=bool)
+        if genre_name:
+            mask &= (self.genre_masks & self._genre_bit(genre_name)) != 0
+        if year:
+            mask &= self.years == int(year)
+        if min_rating is not None:
+            mask &= self.ratings >= float(min_rating)
+        # Неизвестную каталогу персону не учитываем, как и до индекса: лучше фильмы по жанру и году, чем ничего
+        for role, index, name in (('режиссёр', self.director_index, director), ('актёр', self.star_index, star)):
+            if not name:
+                continue
+            person_mask = self._person_mask(index, name)
+            if person_mask is None:
+                logger.info(f"[ImdbCatalog] {role} «{name}» не найден в CSV, фильтр по нему пропущен")
+            else:
+                mask &= person_mask
+        return np.flatnonzero(mask)
+
+    def sample(self, rows: np.ndarray, limit: int, rng: Optional[np.random.Generator] = None) -> List[Dict]:
+        if len(rows) == 0:
+            return []
+        rng = rng or np.random.default_rng()
+        chosen = rng.choice(rows, size=min(limit, len(rows)), replace=False)
+        return [dict(self.records[i]) for i in chosen]
+
+
+_catalogs: Dict[Path, ImdbCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_imdb_catalog(path: Path) -> ImdbCatalog:
+    """Каталог строится один раз на процесс для каждого файла."""
+    path = Path(path)
+    catalog = _catalogs.get(path)
+    if catalog is None:
+        with _catalogs_lock:
+            catalog = _catalogs.get(path)
+            if catalog is None:
+                catalog = ImdbCatalog(path)
+                _catalogs[path] = catalog
+    return catalog
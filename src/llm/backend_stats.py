@@ -0,0 +1,95 @@
+# src/llm/backend_stats.py
+import threading
+from collections import deque
+from time import monotonic
+from typing import Dict, Optional
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class BackendStats:
+    """
+    Задержки, ошибки и circuit breaker одного LLM-бэкенда.
+
+    После failure_threshold ошибок подряд бэкенд «выключается» на cooldown секунд,
+    затем пропускается один пробный запрос (half-open): успех закрывает цепь,
+    ошибка снова открывает её.
+    """
+
+    def __init__(self, name: str, window: int = 100, failure_threshold: int = 3, cooldown: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self.successes = 0
+        self.failures = 0
+        self.skipped = 0
+        self._probe_in_flight = False
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.skipped += 1
+            return False
+
+    def record_success(self, latency: Optional[float]):
+        """latency=None — успех без замера (окно задержек — только для полных ответов)."""
+        with self._lock:
+            if latency is not None:
+                self._latencies.append(latency)
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.state = CLOSED
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    print(f"[LLM] ⚡ {self.name}: circuit breaker открыт на {self.cooldown:.0f} с")
+                self.state = OPEN
+                self.opened_at = monotonic()
+
+    def release_probe(self):
+        """Пробный запрос прерван без результата (клиент ушёл) — следующий может пробовать снова."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self._latencies:
+                return None
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+        return ordered[index]
+
+    def sample_count(self) -> int:
+        return len(self._latencies)
+
+    def snapshot(self) -> Dict:
+        total = self.successes + self.failures
+        return {
+            'state': self.state,
+            'successes': self.successes,
+            'failures': self.failures,
+            'skipped': self.skipped,
+            'error_rate': round(self.failures / total, 3) if total else 0.0,
+            'latency_p50': self.percentile(0.5),
+            'latency_p95': self.percentile(0.95),
+            'samples': self.sample_count()
+        }
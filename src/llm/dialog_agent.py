@@ -3,11 +3,30 @@ import re
 import os
 import json
 import random
-from typing import Dict, Any, List, Optional
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, MutableMapping, Iterator, Callable
 from html import escape
-from flask import session
 from .llm_router import LLMRouter
+from .params_cache import ParamsCache, normalize_message
+from .fast_extractor import FastParameterExtractor
+from .vocabulary import MOOD_TO_GENRE
+from .speculation import Speculation, SpeculativeRunner
 from src.movie_agent import MovieAgent
+from src.similarity import get_similarity_engine
+from src.metrics import METRICS, span, cache_samples
+from src.session_store import compact_movies
+from src.cache import SingleFlight, make_cache_key
+from src.title_index import normalize_title
+from src.cache_warmer import create_cache_warmer
+from src.enrichment import create_enricher
+from config import (
+    PARAMS_CACHE_SIZE, PARAMS_CACHE_TTL, PARAMS_CACHE_PATH, FAST_EXTRACTOR_ENABLED, SIMILARITY_ENABLED,
+    LIST_DESCRIPTIONS_MODE, LIST_DESCRIPTIONS_WORKERS, SPECULATION_ENABLED, SPECULATION_WORKERS,
+    CACHE_WARMER_ENABLED, ENRICHMENT_ENABLED
+)
+
+logger = logging.getLogger(__name__)
 
 
 class DialogMovieAgent:
@@ -15,21 +34,160 @@ class DialogMovieAgent:
         self.llm_router = LLMRouter()
         self.movie_agent = MovieAgent(use_api=True)
         self.prompts_dir = os.path.join(os.path.dirname(__file__), '..', 'prompts')
+        # Частые запросы («комедия», «что посмотреть») не ходят в LLM повторно
+        self.params_cache = ParamsCache(
+            maxsize=PARAMS_CACHE_SIZE,
+            ttl=PARAMS_CACHE_TTL,
+            path=PARAMS_CACHE_PATH
+        )
+        # Одно и то же сообщение от многих пользователей сразу разбирается одним вызовом LLM
+        self.params_flight = SingleFlight()
+        # Простые запросы («комедия 2010», «топ 5 боевиков») разбираем без LLM
+        self.fast_extractor = FastParameterExtractor() if FAST_EXTRACTOR_ENABLED else None
+        # Описания для подборок: одним запросом (batch) или параллельно по фильму (concurrent)
+        self.list_descriptions_mode = LIST_DESCRIPTIONS_MODE
+        self._describe_executor = (
+            ThreadPoolExecutor(max_workers=LIST_DESCRIPTIONS_WORKERS, thread_name_prefix='describe')
+            if LIST_DESCRIPTIONS_MODE == 'concurrent' else None
+        )
+        # Пока LLM разбирает сообщение, поиск по догадке эвристик уже идёт
+        self.speculation = SpeculativeRunner(SPECULATION_WORKERS) if SPECULATION_ENABLED and self.fast_extractor else None
+        # Популярные выдачи обновляются в фоне до истечения, чтобы пик нагрузки шёл из кэша
+        self.cache_warmer = create_cache_warmer(self.movie_agent).start() if CACHE_WARMER_ENABLED else None
+        # Metascore, Rotten Tomatoes, постеры — из OMDb и TMDB, не дольше ENRICHMENT_DEADLINE на ответ
+        self.enricher = create_enricher() if ENRICHMENT_ENABLED else None
+
+    def metrics_samples(self) -> List[tuple]:
+        """Текущие показатели кэшей, индексов и LLM-бэкендов для /metrics."""
+        samples = cache_samples('params', self.params_cache.stats())
+        if self.fast_extractor:
+            samples += cache_samples('fast_extractor', self.fast_extractor.stats())
+        samples += cache_samples('movie_details', self.movie_agent.details_cache.stats())
+        samples += cache_samples('title_index', self.movie_agent.title_index.stats())
+        client = self.movie_agent.kinopoisk_client
+        if client:
+            samples += cache_samples('kinopoisk_search', client.search_cache.stats())
+            if client.response_cache is not None:
+                samples += cache_samples('http_responses', client.response_cache.stats())
+            paging = client.pass_rates.stats()
+            samples.append(('kinopoisk_pages_total', 'counter', 'Страницы выдачи, запрошенные у Кинопоиска',
+                            {'kind': 'all'}, paging['pages_fetched']))
+            samples.append(('kinopoisk_pages_total', 'counter', 'Страницы выдачи, запрошенные у Кинопоиска',
+                            {'kind': 'extra'}, paging['extra_pages']))
+            for signature, rate in paging['pass_rates'].items():
+                samples.append(('kinopoisk_pass_rate', 'gauge', 'Доля фильмов, прошедших фильтр голосов',
+                                {'filters': signature}, rate))
+            limits = client.rate_limiter.stats()
+            samples.append(('kinopoisk_budget_remaining', 'gauge', 'Остаток лимитов Кинопоиска: токены в секунду и запросы на сутки',
+                            {'window': 'second'}, limits['tokens']))
+            samples.append(('kinopoisk_budget_remaining', 'gauge', 'Остаток лимитов Кинопоиска: токены в секунду и запросы на сутки',
+                            {'window': 'day'}, limits['daily_remaining']))
+            samples.append(('kinopoisk_paused_seconds', 'gauge', 'Сколько ещё длится пауза после ответа 429',
+                            {}, limits['paused_seconds']))
+            samples.append(('kinopoisk_throttled_total', 'counter', 'Ответы 429 от Кинопоиска', {}, limits['throttled']))
+            for outcome in ('acquired', 'delayed', 'rejected'):
+                for priority_class, value in limits[outcome].items():
+                    samples.append(('kinopoisk_rate_limiter_total', 'counter',
+                                    'Запросы через планировщик лимитов: пропущены сразу, после ожидания, отклонены',
+                                    {'priority': priority_class, 'outcome': outcome}, value))
+        router = self.llm_router.stats()
+        for backend, snapshot in router['backends'].items():
+            samples.append(('llm_breaker_open', 'gauge', 'Circuit breaker LLM-бэкенда открыт (1) или нет',
+                            {'backend': backend}, 0 if snapshot['state'] == 'closed' else 1))
+            for q in ('p50', 'p95'):
+                samples.append(('llm_latency_seconds', 'gauge', 'Задержка LLM-бэкенда по последним запросам',
+                                {'backend': backend, 'quantile': q}, snapshot[f'latency_{q}']))
+        if self.speculation:
+            speculation = self.speculation.stats()
+            for outcome in ('hits', 'misses'):
+                samples.append(('speculation_total', 'counter', 'Спекулятивные запросы: угаданные и отброшенные',
+                                {'outcome': outcome}, speculation[outcome]))
+            samples.append(('speculation_hit_rate', 'gauge', 'Доля угаданных спекулятивных запросов',
+                            {}, speculation['hit_rate']))
+        flights = {'extract_parameters': self.params_flight}
+        if client:
+            flights.update(kinopoisk_search=client.search_flight, kinopoisk_details=client.details_flight)
+        for call, flight in flights.items():
+            flight_stats = flight.stats()
+            samples.append(('singleflight_calls_total', 'counter', 'Вызовы, ушедшие во внешний API',
+                            {'call': call}, flight_stats['calls']))
+            samples.append(('singleflight_collapsed_total', 'counter',
+                            'Вызовы, склеенные с уже выполняющимся таким же запросом',
+                            {'call': call}, flight_stats['collapsed']))
+        if self.cache_warmer:
+            warmer = self.cache_warmer.stats()
+            samples.append(('cache_warmer_coverage', 'gauge', 'Доля запросов плана прогрева, выдача которых в кэше',
+                            {}, warmer['coverage']))
+            samples.append(('cache_warmer_queries', 'gauge', 'Запросов в плане прогрева кэша', {}, warmer['queries']))
+            for outcome in ('refreshed', 'failed', 'deferred'):
+                samples.append(('cache_warmer_refreshes_total', 'counter',
+                                'Обновления выдач прогревом: выполненные, с ошибкой, отложенные из-за квоты',
+                                {'outcome': outcome}, warmer[outcome]))
+            samples.append(('cache_warmer_pages_total', 'counter', 'Страницы Кинопоиска, запрошенные прогревом',
+                            {}, warmer['requests']))
+        if self.enricher:
+            enrichment = self.enricher.stats()
+            samples += cache_samples('enrichment', self.enricher.cache.stats())
+            for outcome in ('merged', 'late', 'failed'):
+                samples.append(('enrichment_requests_total', 'counter',
+                                'Запросы к OMDb/TMDB для карточек: успели к дедлайну, опоздали, с ошибкой',
+                                {'outcome': outcome}, enrichment[outcome]))
+        samples.append(('llm_hedged_requests_total', 'counter', 'Продублированные (хеджированные) запросы к LLM',
+                        {}, router['hedged_requests']))
+        samples.append(('llm_hedge_wins_total', 'counter', 'Хеджированные запросы, где первым ответил дубль',
+                        {}, router['hedge_wins']))
+        return samples
 
     def _load_prompt(self, filename: str) -> str:
         path = os.path.join(self.prompts_dir, filename)
         with open(path, 'r', encoding='utf-8') as f:
             return f.read().strip()
 
-    def _extract_parameters(self, user_message: str) -> Dict[str, Any]:
+    def _extract_parameters(self, user_message: str, before_llm: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+        with span('extract_parameters') as stage:
+            params, stage['source'] = self._extract_parameters_from(user_message, before_llm)
+        return params
+
+    def _extract_parameters_from(self, user_message: str, before_llm: Optional[Callable[[], None]] = None):
+        """
+        (параметры, источник): fast — без LLM, cache — из кэша, llm, llm_failed.
+        before_llm вызывается, только если параметры придётся ждать от LLM.
+        """
+        if self.fast_extractor:
+            params = self.fast_extractor.extract(user_message)
+            if params is not None:
+                logger.info(f"[DialogAgent] Параметры без LLM: {params}")
+                return params, 'fast'
+
+        cached = self.params_cache.get(user_message)
+        if cached is not None:
+            return cached, 'cache'
+
+        if before_llm:
+            before_llm()
+
+        params = self.params_flight.do(normalize_message(user_message), lambda: self._llm_parameters(user_message))
+        if params is None:
+            return self._empty_params(), 'llm_failed'
+        # Копия: ожидающие того же вызова получают один и тот же словарь
+        return dict(params), 'llm'
+
+    def _llm_parameters(self, user_message: str) -> Optional[Dict[str, Any]]:
         system_prompt = self._load_prompt('parameter_extraction_prompt.txt')
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_message}
         ]
         response = self.llm_router.call_llm(messages, max_tokens=250)
+        params = self._parse_parameters(response)
+        if params is not None:
+            # Кэшируем только успешный разбор — сбой LLM не должен «залипать»
+            self.params_cache.set(user_message, params)
+        return params
+
+    def _parse_parameters(self, response: Optional[str]) -> Optional[Dict[str, Any]]:
         if not response:
-            return self._empty_params()
+            return None
         json_match = re.search(r'\{.*\}', response, re.DOTALL)
         json_str = json_match.group(0) if json_match else response.strip()
         try:
@@ -58,8 +216,8 @@ class DialogMovieAgent:
             if "intent" not in params:
                 params["intent"] = "initial"
             return params
-        except (json.JSONDecodeError, TypeError):
-            return self._empty_params()
+        except (json.JSONDecodeError, TypeError, AttributeError):
+            return None
 
     def _empty_params(self):
         return {
@@ -79,32 +237,164 @@ class DialogMovieAgent:
     def _is_tv_series_request(self, user_message: str) -> bool:
         return any(w in user_message.lower() for w in ["сериал", "сезон", "эпизод"])
 
-    def _generate_single(self, movie: Dict[str, Any]) -> str:
+    def _single_messages(self, movie: Dict[str, Any]) -> List[Dict[str, str]]:
         prompt_template = self._load_prompt('response_generation_prompt.txt')
         prompt = prompt_template.format(
             title=movie.get('title', '—'),
             year=movie.get('year', '—'),
             genre=movie.get('genre', '—'),
-            rating=movie.get('rating', '—'),
+            rating=self._rating_text(movie),
             description=movie.get('description', 'Описание отсутствует.')
         )
-        messages = [{"role": "user", "content": prompt}]
-        response = self.llm_router.call_llm(messages, max_tokens=300)
-        if response:
-            return response.strip()
+        return [{"role": "user", "content": prompt}]
+
+    @staticmethod
+    def _rating_text(movie: Dict[str, Any], default: str = '—') -> str:
+        """Рейтинг Кинопоиска/IMDb и, если обогащение успело, Metascore и Rotten Tomatoes."""
+        parts = [str(movie.get('rating', default))]
+        if movie.get('metascore'):
+            parts.append(f"Metascore {movie['metascore']}")
+        if movie.get('rotten_tomatoes'):
+            parts.append(f"🍅 {movie['rotten_tomatoes']}")
+        return ' · '.join(p for p in parts if p)
+
+    def _movie_header(self, movie: Dict[str, Any]) -> str:
         title = escape(movie.get('title', '—'))
         year = escape(str(movie.get('year', '—')))
-        rating = escape(str(movie.get('rating', '—')))
-        return f'🎬 <strong>{title}</strong> ({year}) — ⭐ {rating}'
+        rating = escape(self._rating_text(movie))
+        header = f'🎬 <strong>{title}</strong> ({year}) — ⭐ {rating}'
+        if movie.get('poster'):
+            header = (
+                f'<img class="movie-poster" src="{escape(movie["poster"])}" alt="{title}" '
+                f'style="max-width: 160px; display: block; margin-bottom: 6px;">' + header
+            )
+        return header
+
+    def enrich_movies(self, movies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Копии карточек с данными OMDb/TMDB, пришедшими до дедлайна (без ключей API — как есть)."""
+        if not self.enricher or not movies:
+            return movies
+        with span('enrich'):
+            return self.enricher.enrich(movies)
+
+    def _generate_single(self, movie: Dict[str, Any]) -> str:
+        with span('generate_single') as stage:
+            response = self.llm_router.call_llm(self._single_messages(movie), max_tokens=300)
+            if response:
+                return response.strip()
+            stage['fallback'] = 'header'
+            self._count_fallback('plain_description')
+            return self._movie_header(movie)
+
+    @staticmethod
+    def _count_fallback(kind: str, value: int = 1):
+        METRICS.inc('fallbacks_total', value, help='Срабатывания запасных путей', kind=kind)
+
+    def stream_single(self, movie: Dict[str, Any]) -> Iterator[str]:
+        """Описание фильма фрагментами по мере генерации LLM (пусто, если LLM недоступны)."""
+        yield from self.llm_router.call_llm_stream(self._single_messages(movie), max_tokens=300)
+
+    def _similar_locally(self, target_movie: Optional[Dict[str, Any]], target_title: Optional[str]) -> List[Dict[str, Any]]:
+        if not SIMILARITY_ENABLED or not (target_movie or target_title):
+            return []
+        try:
+            engine = get_similarity_engine()
+        except Exception as e:
+            logger.warning(f"[DialogAgent] Движок похожих фильмов недоступен: {e}")
+            return []
+        if target_movie:
+            genres = [g.strip() for g in (target_movie.get('genre') or '').split(',') if g.strip()]
+            return engine.similar(
+                title=target_movie.get('title'),
+                original_title=target_movie.get('original_title'),
+                year=target_movie.get('year'),
+                genres=genres,
+                k=5
+            )
+        return engine.similar(title=target_title, k=5)
+
+    def _describe_batch(self, movies: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """Короткие описания нескольких фильмов одним запросом к LLM; None — для неудавшихся."""
+        lines = []
+        for i, m in enumerate(movies, 1):
+            lines.append(
+                f"{i}. {m.get('title', '—')} ({m.get('year', '—')}); жанр: {m.get('genre', '—')}; "
+                f"описание: {m.get('description') or 'Описание отсутствует.'}"
+            )
+        prompt = self._load_prompt('list_descriptions_prompt.txt').format(movies="\n".join(lines))
+        response = self.llm_router.call_llm(
+            [{"role": "user", "content": prompt}],
+            max_tokens=80 * len(movies) + 50
+        )
+        descriptions: List[Optional[str]] = [None] * len(movies)
+        json_match = re.search(r'\{.*\}', response or '', re.DOTALL)
+        if not json_match:
+            return descriptions
+        try:
+            parsed = json.loads(json_match.group(0))
+        except json.JSONDecodeError:
+            return descriptions
+        if not isinstance(parsed, dict):
+            return descriptions
+        for key, text in parsed.items():
+            try:
+                index = int(key) - 1
+            except (TypeError, ValueError):
+                continue
+            if 0 <= index < len(movies) and isinstance(text, str) and text.strip():
+                descriptions[index] = text.strip()
+        return descriptions
+
+    def _describe_one(self, movie: Dict[str, Any]) -> Optional[str]:
+        try:
+            return self._describe_batch([movie])[0]
+        except Exception as e:
+            logger.warning(f"[DialogAgent] Не удалось описать «{movie.get('title')}»: {e}")
+            return None
+
+    def _describe_many(self, movies: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """
+        Описания для подборки за одну задержку LLM, а не за N.
+        Фильм без описания (ошибка, пропуск в ответе) показывается обычной строкой.
+        """
+        if not movies or self.list_descriptions_mode not in ('batch', 'concurrent'):
+            return [None] * len(movies)
+        if self._describe_executor is not None:
+            return list(self._describe_executor.map(self._describe_one, movies))
+        try:
+            return self._describe_batch(movies)
+        except Exception as e:
+            logger.warning(f"[DialogAgent] Пакетная генерация описаний не удалась: {e}")
+            return [None] * len(movies)
 
-    def _generate_list(self, movies: List[Dict[str, Any]], clickable: bool = False) -> str:
+    def _list_response(self, movies: List[Dict[str, Any]]) -> str:
+        movies = movies[:10]
+        # OMDb/TMDB запрашиваются, пока LLM пишет описания, — обычно это не добавляет задержки
+        enrichment = self.enricher.start(movies) if self.enricher else None
+        with span('generate_list', mode=self.list_descriptions_mode):
+            descriptions = self._describe_many(movies)
+        if enrichment:
+            with span('enrich'):
+                movies = enrichment.result()
+        if self.list_descriptions_mode in ('batch', 'concurrent'):
+            missing = sum(1 for d in descriptions if not d)
+            if missing:
+                self._count_fallback('list_description', missing)
+        return self._generate_list(movies, clickable=True, descriptions=descriptions)
+
+    def _generate_list(
+            self,
+            movies: List[Dict[str, Any]],
+            clickable: bool = False,
+            descriptions: Optional[List[Optional[str]]] = None
+    ) -> str:
         if not movies:
             return "<p>Ничего не найдено 😔</p>"
         items = []
         for i, m in enumerate(movies[:10], 1):
             title = escape(m.get('title', ''))
             year = escape(str(m.get('year', '')))
-            rating = escape(str(m.get('rating', '')))
+            rating = escape(self._rating_text(m, default=''))
             movie_id = m.get('id') or f"title_{i}"
             if clickable:
                 item = (
@@ -116,13 +406,39 @@ class DialogMovieAgent:
             else:
                 item = f'{i}. <strong>{title}</strong> ({year}) — ⭐ {rating}'
                 item = f'<div class="movie-item">{item}</div>'
+            description = descriptions[i - 1] if descriptions and i <= len(descriptions) else None
+            if description:
+                item += f'<div class="movie-description">{escape(description)}</div>'
             items.append(item)
         items_html = "\n".join(items)
         return f'<div class="movie-list">🍿 Подборка:<br>{items_html}</div>'
 
-    def chat(self, user_message: str, history: Optional[List[Dict[str, str]]] = None) -> dict:
-        params = self._extract_parameters(user_message)
+    def chat(
+            self,
+            user_message: str,
+            history: Optional[List[Dict[str, str]]] = None,
+            state: Optional[MutableMapping[str, Any]] = None,
+            generate: bool = True
+    ) -> dict:
+        # state — состояние диалога из хранилища сессий (веб и бот); без него — разовый запрос.
+        # generate=False: описание одного фильма не генерируется (его стримит вызывающий),
+        # в "response" — только заголовок карточки, в "movie" — фильм.
+        if state is None:
+            state = {}
+        speculation: List[Speculation] = []
+        params = self._extract_parameters(
+            user_message,
+            before_llm=lambda: speculation.extend(self._speculate(user_message))
+        )
+        self._apply_rating_default(params, user_message)
+        try:
+            return self._respond(user_message, params, state, generate, speculation[0] if speculation else None)
+        finally:
+            if self.speculation and speculation:
+                self.speculation.discard(speculation[0])
 
+    @staticmethod
+    def _apply_rating_default(params: Dict[str, Any], user_message: str):
         # Автоустановка min_rating = 6.0 для "лучших", "топ" и т.п.
         user_message_lower = user_message.lower()
         if params.get("min_rating") is None:
@@ -131,16 +447,72 @@ class DialogMovieAgent:
             ]):
                 params["min_rating"] = 6.0
 
+    def _search_request(self, params: Dict[str, Any], user_message: str) -> Dict[str, Any]:
+        """Аргументы recommend_movies для обычного поиска по извлечённым параметрам."""
+        genre = params.get("genre")
+        mood = params.get("mood")
+        if mood and not genre:
+            # Жанр по настроению выбирается детерминированно от текста сообщения: иначе спекулятивный
+            # поиск и _respond вытянули бы разные жанры и догадка никогда не совпала бы по ключу
+            rng = random.Random(f"{mood.lower()}|{normalize_message(user_message)}")
+            genre = rng.choice(MOOD_TO_GENRE.get(mood.lower(), []) or [None])
+        return {
+            'genre_name': genre,
+            'year': params.get("year"),
+            'actor': params.get("actor"),
+            'director': params.get("director"),
+            'studio': params.get("studio"),
+            'country': params.get("country"),
+            'min_imdb_rating': params.get("min_rating"),
+            'limit': params.get("count") or 1,
+            'movie_type': 'tv-series' if self._is_tv_series_request(user_message) else 'movie'
+        }
+
+    def _speculate(self, user_message: str) -> List[Speculation]:
+        """Запускает поиск по догадке эвристик (название или жанр/год); [] — догадки нет."""
+        if not self.speculation:
+            return []
+        guess = self.fast_extractor.guess(user_message)
+        if guess is None:
+            return []
+        if guess["intent"] == "info":
+            title = guess["target_movie"]
+            key = ('title', normalize_title(title))
+            return [self.speculation.launch(key, lambda: self.movie_agent.search_by_title(title))]
+        self._apply_rating_default(guess, user_message)
+        search = self._search_request(guess, user_message)
+        key = ('search', make_cache_key(search))
+        return [self.speculation.launch(key, lambda: self.movie_agent.recommend_movies(**search))]
+
+    def _resolve(self, speculation: Optional[Speculation], key: tuple, fn: Callable[[], Any]) -> Any:
+        if not self.speculation:
+            return fn()
+        return self.speculation.resolve(speculation, key, fn)
+
+    def _respond(
+            self,
+            user_message: str,
+            params: Dict[str, Any],
+            state: MutableMapping[str, Any],
+            generate: bool,
+            speculation: Optional[Speculation]
+    ) -> dict:
         intent = params.get("intent")
         target_movie_title = params.get("target_movie")
 
 
         # 1. Запрос информации о конкретном фильме
         if intent == "info" and target_movie_title:
-            found = self.movie_agent.search_by_title(target_movie_title)
+            with span('search_by_title'):
+                found = self._resolve(
+                    speculation,
+                    ('title', normalize_title(target_movie_title)),
+                    lambda: self.movie_agent.search_by_title(target_movie_title)
+                )
             movie = found[0] if found else None
             if movie:
-                response_text = self._generate_single(movie)
+                movie = self.enrich_movies([movie])[0]
+                response_text = self._generate_single(movie) if generate else self._movie_header(movie)
                 return {
                     "response": response_text,
                     "needs_clarification": False,
@@ -157,19 +529,34 @@ class DialogMovieAgent:
 
         # 2. Похожие фильмы
         if intent == "similar":
-            last_movies = session.get('last_movies', [])
+            last_movies = state.get('last_movies', [])
             target_movie = None
             if target_movie_title:
                 for m in last_movies:
                     if target_movie_title.lower() in m.get('title', '').lower():
                         target_movie = m
                         break
-                if not target_movie:
-                    found = self.movie_agent.search_by_title(target_movie_title)
-                    target_movie = found[0] if found else None
             elif last_movies:
                 target_movie = last_movies[0]
 
+            # Сначала — локальный поиск по каталогу MovieLens, без запросов к API
+            with span('similar_local') as stage:
+                movies = self._similar_locally(target_movie, target_movie_title)
+                stage['found'] = '1' if movies else '0'
+            if movies:
+                return {
+                    "response": self._list_response(movies),
+                    "needs_clarification": False,
+                    "parameters": params,
+                    "movies_list": movies
+                }
+
+            self._count_fallback('similar_api')
+            if target_movie_title and not target_movie:
+                with span('search_by_title'):
+                    found = self.movie_agent.search_by_title(target_movie_title)
+                target_movie = found[0] if found else None
+
             if target_movie:
                 genres = target_movie.get('genre', '')
                 genre_list = [g.strip() for g in genres.split(',') if g.strip()]
@@ -178,15 +565,16 @@ class DialogMovieAgent:
                 min_rating = max(0.0, float(rating) - 1.0) if rating else None
                 country = target_movie.get('country', 'США')
 
-                movies = self.movie_agent.recommend_movies(
-                    genre_name=primary_genre,
-                    min_imdb_rating=min_rating,
-                    country=country,
-                    limit=5,
-                    movie_type='movie'
-                )
+                with span('recommend_movies', intent='similar'):
+                    movies = self.movie_agent.recommend_movies(
+                        genre_name=primary_genre,
+                        min_imdb_rating=min_rating,
+                        country=country,
+                        limit=5,
+                        movie_type='movie'
+                    )
                 if movies and not (isinstance(movies, dict) and "error" in movies):
-                    response_text = self._generate_list(movies, clickable=True)
+                    response_text = self._list_response(movies)
                     return {
                         "response": response_text,
                         "needs_clarification": False,
@@ -195,41 +583,18 @@ class DialogMovieAgent:
                     }
 
         # 3. Обычный поиск
-        genre = params.get("genre")
-        year = params.get("year")
-        actor = params.get("actor")
-        director = params.get("director")
-        studio = params.get("studio")
-        country = params.get("country")
-        mood = params.get("mood")
-        count = params.get("count") or 1
-        min_rating = params.get("min_rating")
-
-        MOOD_TO_GENRE = {
-            "лёгкий": ["комедия", "мелодрама", "мультфильм", "семейный"],
-            "серьёзный": ["драма", "биография", "военный", "исторический"],
-            "адреналин": ["боевик", "триллер", "приключения", "фантастика"],
-            "для поднятия настроения": ["комедия", "мюзикл", "романтика"],
-            "страшный": ["ужасы", "триллер", "мистика"],
-            "умный": ["драма", "биография", "детектив", "фантастика"]
-        }
+        search = self._search_request(params, user_message)
+        if self.cache_warmer:
+            self.cache_warmer.record(search)
+        actor = search['actor']
+        count = search['limit']
 
-        if mood and not genre:
-            genre = random.choice(MOOD_TO_GENRE.get(mood.lower(), []) or [None])
-
-        movie_type = 'tv-series' if self._is_tv_series_request(user_message) else 'movie'
-
-        movies = self.movie_agent.recommend_movies(
-            genre_name=genre,
-            year=year,
-            actor=actor,
-            director=director,
-            studio=studio,
-            country=country,
-            min_imdb_rating=min_rating,
-            limit=count,
-            movie_type=movie_type
-        )
+        with span('recommend_movies', intent='search'):
+            movies = self._resolve(
+                speculation,
+                ('search', make_cache_key(search)),
+                lambda: self.movie_agent.recommend_movies(**search)
+            )
 
         if not movies or (isinstance(movies, dict) and "error" in movies):
             return {
@@ -239,21 +604,22 @@ class DialogMovieAgent:
             }
 
         if actor:
-            session['last_actor'] = actor
-        session['last_movies'] = movies
-        session['last_params'] = params
+            state['last_actor'] = actor
+        state['last_movies'] = compact_movies(movies)
+        state['last_params'] = params
 
         if count == 1 and len(movies) == 1:
-            response_text = self._generate_single(movies[0])
+            movie = self.enrich_movies(movies)[0]
+            response_text = self._generate_single(movie) if generate else self._movie_header(movie)
             return {
                 "response": response_text,
                 "needs_clarification": False,
                 "parameters": params,
-                "movie": movies[0],
+                "movie": movie,
                 "movies_list": None
             }
         else:
-            response_text = self._generate_list(movies, clickable=True)
+            response_text = self._list_response(movies)
             return {
                 "response": response_text,
                 "needs_clarification": False,
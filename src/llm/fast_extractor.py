@@ -0,0 +1,127 @@
+# src/llm/fast_extractor.py
+import re
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from .params_cache import normalize_message
+from .vocabulary import (
+    GENRE_STEMS, MOOD_STEMS, MOOD_PHRASES, COUNTRY_STEMS, COUNT_WORDS,
+    TOP_STEMS, SERIES_STEMS, FILLER_WORDS
+)
+
+logger = logging.getLogger(__name__)
+
+_YEAR = re.compile(r'^(19[0-9]{2}|20[0-9]{2})$')
+_NUMBER = re.compile(r'^[0-9]{1,2}$')
+# «расскажи про фильм титаник», «что за фильм начало» — запрос информации о фильме
+_INFO_REQUEST = re.compile(
+    r'^(?:расскажи\w*\s+(?:про|о|об)\s+|что за\s+|(?:про|о|об)\s+|информаци\w+\s+(?:о|об|про)\s+)'
+    r'(?:фильм\w*|кино)\s+(.+)$'
+)
+
+
+def _match_stem(token: str, stems: Dict[str, str]) -> Optional[str]:
+    for stem, value in stems.items():
+        if token.startswith(stem):
+            return value
+    return None
+
+
+class FastParameterExtractor:
+    """
+    Разбор простых запросов («лучшие боевики 2005», «5 комедий», «лёгкое кино»)
+    без LLM. Возвращает параметры в той же схеме, что и DialogMovieAgent._extract_parameters,
+    только если распознано каждое слово сообщения; иначе None — решает LLM.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def extract(self, user_message: str) -> Optional[Dict[str, Any]]:
+        params = self._parse(normalize_message(user_message))
+        with self._lock:
+            if params is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return params
+
+    def guess(self, user_message: str) -> Optional[Dict[str, Any]]:
+        """
+        Догадка для спекулятивного запроса, пока параметры извлекает LLM:
+        название фильма для «расскажи про фильм …» или жанр/год/страна из узнанных
+        слов (остальные слова пропускаются). None — угадывать нечего.
+        """
+        text = normalize_message(user_message)
+        info = _INFO_REQUEST.match(text)
+        if info:
+            params = self._empty()
+            params.update(intent="info", target_movie=info.group(1))
+            return params
+        params = self._parse(text, strict=False)
+        if params is None or params["genre"] is None:
+            return None
+        return params
+
+    @staticmethod
+    def _empty() -> Dict[str, Any]:
+        return {
+            "intent": "initial", "target_movie": None, "genre": None, "year": None,
+            "actor": None, "director": None, "studio": None, "country": None,
+            "mood": None, "count": None, "min_rating": None
+        }
+
+    def _parse(self, text: str, strict: bool = True) -> Optional[Dict[str, Any]]:
+        if not text:
+            return None
+
+        found = {"genre": None, "year": None, "country": None, "mood": None, "count": None}
+
+        def assign(field: str, value) -> bool:
+            # Два разных значения одного поля — неоднозначно, отдаём LLM
+            if found[field] is not None and found[field] != value:
+                return False
+            found[field] = value
+            return True
+
+        for phrase, mood in MOOD_PHRASES.items():
+            if f" {phrase} " in f" {text} ":
+                if not assign("mood", mood):
+                    return None
+                text = f" {text} ".replace(f" {phrase} ", " ")
+
+        for token in text.split():
+            if token in FILLER_WORDS or token.startswith(TOP_STEMS) or token.startswith(SERIES_STEMS):
+                continue
+            if _YEAR.match(token):
+                ok = assign("year", int(token))
+            elif _NUMBER.match(token):
+                ok = 0 < int(token) <= 50 and assign("count", int(token))
+            elif token in COUNT_WORDS:
+                ok = assign("count", COUNT_WORDS[token])
+            elif _match_stem(token, GENRE_STEMS):
+                ok = assign("genre", _match_stem(token, GENRE_STEMS))
+            elif _match_stem(token, COUNTRY_STEMS):
+                ok = assign("country", _match_stem(token, COUNTRY_STEMS))
+            elif _match_stem(token, MOOD_STEMS):
+                ok = assign("mood", _match_stem(token, MOOD_STEMS))
+            else:
+                ok = not strict
+            if not ok:
+                return None
+
+        params = self._empty()
+        params.update(found)
+        return params
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
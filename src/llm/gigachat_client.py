@@ -1,8 +1,16 @@
 # src/llm/gigachat_client.py
 import os
+import json
 import requests
-import uuid
-from time import time
+from time import monotonic
+from typing import Iterator
+from requests.adapters import HTTPAdapter
+from .token_manager import get_token_manager
+from src.metrics import METRICS
+from config import (
+    HTTP_POOL_SIZE, GIGACHAT_CONNECT_TIMEOUT, GIGACHAT_READ_TIMEOUT,
+    GIGACHAT_TOKEN_REFRESH_AHEAD, GIGACHAT_TOKEN_CACHE_PATH, GIGACHAT_AUTH_URL, GIGACHAT_API_URL
+)
 
 class GigaChatClient:
     def __init__(self):
@@ -10,61 +18,61 @@ class GigaChatClient:
         if not self.auth_key:
             raise ValueError("GIGACHAT_AUTH_KEY не указан в .env")
 
-        self.auth_url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
-        self.api_url = "https://gigachat.devices.sberbank.ru/api/v1/chat/completions"
-
-        self.access_token = None
-        self.token_expires_at = 0
+        self.auth_url = GIGACHAT_AUTH_URL
+        self.api_url = GIGACHAT_API_URL
+
+        # Токен общий для всех клиентов воркера (и, при GIGACHAT_TOKEN_CACHE_PATH, для всех воркеров)
+        self.tokens = get_token_manager(
+            self.auth_key,
+            self.auth_url,
+            refresh_ahead=GIGACHAT_TOKEN_REFRESH_AHEAD,
+            cache_path=GIGACHAT_TOKEN_CACHE_PATH
+        )
+        self.timeout = (GIGACHAT_CONNECT_TIMEOUT, GIGACHAT_READ_TIMEOUT)
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE))
+        # ⚠️ verify=False — временно, для обхода SSL-ошибок (Sber использует самоподписанные сертификаты)
+        self.session.verify = False
 
     def _get_token(self):
-        # Возвращаем токен, если он ещё действителен
-        if self.access_token and time() < self.token_expires_at:
-            return self.access_token
-
-        RqUID = str(uuid.uuid4())
-
-        headers = {
-            'RqUID': RqUID,
-            'Content-Type': 'application/x-www-form-urlencoded',
-            'Accept': 'application/json',
-            'Authorization': f'Basic {self.auth_key}'
-        }
-
-        data = {
-            'scope': 'GIGACHAT_API_PERS'
-        }
+        return self.tokens.get_token()
 
-        try:
-            # ⚠️ verify=False — временно, для обхода SSL-ошибок (Sber использует самоподписанные сертификаты)
-            response = requests.post(
-                self.auth_url,
-                headers=headers,
-                data=data,
-                verify=False
-            )
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            error_detail = response.text if 'response' in locals() else 'N/A'
-            raise Exception(f"Ошибка получения токена GigaChat: {e}\nОтвет сервера: {error_detail}")
-
-        token_data = response.json()
-        self.access_token = token_data['access_token']
-        expires_in = token_data.get('expires_in', 1800)  # по умолчанию 30 минут
-        self.token_expires_at = time() + expires_in - 60  # обновляем за минуту до истечения
-
-        print(f"[GigaChat] ✅ Получен новый access_token (действует {expires_in//60} мин)")
-
-        return self.access_token
-
-    def chat_completions_create(self, model: str, messages: list, max_tokens: int = 500, temperature: float = 0.7):
+    def _post(self, payload: dict, accept: str, stream: bool = False) -> requests.Response:
         token = self._get_token()
+        for attempt in range(2):
+            headers = {
+                'Authorization': f'Bearer {token}',
+                'Content-Type': 'application/json',
+                'Accept': accept
+            }
+            started = monotonic()
+            status = None
+            try:
+                response = self.session.post(
+                    self.api_url,
+                    headers=headers,
+                    json=payload,
+                    timeout=self.timeout,
+                    stream=stream
+                )
+                status = response.status_code
+                if response.status_code == 401 and attempt == 0:
+                    # Токен отозван раньше срока — получаем новый и повторяем один раз
+                    response.close()
+                    self.tokens.invalidate(token)
+                    token = self._get_token()
+                    continue
+                response.raise_for_status()
+                return response
+            except requests.exceptions.RequestException as e:
+                error_detail = response.text if 'response' in locals() and not stream else 'N/A'
+                raise Exception(f"Ошибка вызова GigaChat API: {e}\nОтвет сервера: {error_detail}")
+            finally:
+                # Для стрима — время до заголовков ответа
+                endpoint = '/chat/completions (stream)' if stream else '/chat/completions'
+                METRICS.observe_http('gigachat', endpoint, monotonic() - started, status)
 
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        }
-
+    def chat_completions_create(self, model: str, messages: list, max_tokens: int = 500, temperature: float = 0.7):
         payload = {
             "model": model,
             "messages": messages,
@@ -73,17 +81,31 @@ class GigaChatClient:
             "stream": False
         }
 
-        try:
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                verify=False
-            )
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            error_detail = response.text if 'response' in locals() else 'N/A'
-            raise Exception(f"Ошибка вызова GigaChat API: {e}\nОтвет сервера: {error_detail}")
-
+        response = self._post(payload, accept='application/json')
         result = response.json()
-        return result['choices'][0]['message']['content'].strip()
\ No newline at end of file
+        return result['choices'][0]['message']['content'].strip()
+
+    def chat_completions_stream(self, model: str, messages: list, max_tokens: int = 500, temperature: float = 0.7) -> Iterator[str]:
+        """Потоковый ответ (SSE): отдаёт фрагменты текста по мере генерации."""
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+
+        response = self._post(payload, accept='text/event-stream', stream=True)
+
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                chunk = json.loads(data)
+                for choice in chunk.get('choices', []):
+                    content = choice.get('delta', {}).get('content')
+                    if content:
+                        yield content
@@ -1,7 +1,16 @@
 # src/llm/llm_router.py
 import os
-from typing import Optional, List, Dict
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import monotonic
+from typing import Optional, List, Dict, Iterator
 from .gigachat_client import GigaChatClient
+from .backend_stats import BackendStats
+from src.metrics import METRICS
+from config import (
+    LLM_BREAKER_THRESHOLD, LLM_BREAKER_COOLDOWN, LLM_HEDGE_ENABLED,
+    LLM_HEDGE_MIN_DELAY, LLM_HEDGE_DEFAULT_DELAY, LLM_HEDGE_MIN_SAMPLES
+)
 
 class LLMRouter:
     def __init__(self):
@@ -43,32 +52,217 @@ class LLMRouter:
         if not self.models:
             raise ValueError("Не указаны ключи API для GigaChat (GIGACHAT_API_KEY) или DeepSeek (если включён)")
 
-    def call_llm(self, messages: List[Dict[str, str]], max_tokens: int = 500) -> Optional[str]:
+        # Задержки, ошибки и circuit breaker по каждому бэкенду
+        self.backend_stats = {
+            model["name"]: BackendStats(
+                model["name"],
+                failure_threshold=LLM_BREAKER_THRESHOLD,
+                cooldown=LLM_BREAKER_COOLDOWN
+            )
+            for model in self.models
+        }
+        self.hedge_enabled = LLM_HEDGE_ENABLED and len(self.models) > 1
+        # Счётчики хеджирования обновляются из потоков разных запросов
+        self._stats_lock = threading.Lock()
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='llm') if self.hedge_enabled else None
+
+    def _call_model(self, model: dict, messages: List[Dict[str, str]], max_tokens: int) -> str:
+        if model["type"] == "gigachat":
+            return model["client"].chat_completions_create(
+                model="GigaChat",
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0.3
+            )
+        # openai-совместимый (DeepSeek, если включён)
+        response = model["client"].chat.completions.create(
+            model="deepseek-chat",
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=0.3,
+            timeout=30
+        )
+        return response.choices[0].message.content.strip()
+
+    def _timed_call(self, model: dict, messages: List[Dict[str, str]], max_tokens: int) -> str:
+        stats = self.backend_stats[model["name"]]
+        started = monotonic()
+        try:
+            result = self._call_model(model, messages, max_tokens)
+        except Exception:
+            stats.record_failure()
+            self._count(model["name"], 'error')
+            raise
+        stats.record_success(monotonic() - started)
+        self._count(model["name"], 'success')
+        return result
+
+    @staticmethod
+    def _count(backend: str, outcome: str, mode: str = 'call'):
+        METRICS.inc(
+            'llm_requests_total',
+            help='Запросы к LLM по бэкендам и исходам (success, error, skipped)',
+            backend=backend, outcome=outcome, mode=mode
+        )
+
+    @staticmethod
+    def _count_unavailable():
+        METRICS.inc('fallbacks_total', help='Срабатывания запасных путей', kind='llm_unavailable')
+
+    def _allowed_models(self) -> Iterator[dict]:
+        # allow_request() проверяем лениво: в half-open он резервирует пробный запрос
         for model in self.models:
+            if self.backend_stats[model["name"]].allow_request():
+                yield model
+            else:
+                self._count(model["name"], 'skipped')
+                print(f"[LLM] ⏭ {model['name']} пропущен (circuit breaker открыт)")
+
+    def _hedge_delay(self, model: dict) -> float:
+        stats = self.backend_stats[model["name"]]
+        p95 = stats.percentile(0.95)
+        if p95 is None or stats.sample_count() < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DEFAULT_DELAY
+        return max(LLM_HEDGE_MIN_DELAY, p95)
+
+    def call_llm(self, messages: List[Dict[str, str]], max_tokens: int = 500) -> Optional[str]:
+        if self.hedge_enabled:
+            return self._call_hedged(messages, max_tokens)
+
+        for model in self._allowed_models():
             try:
                 print(f"[LLM] Пробуем {model['name']}...")
+                result = self._timed_call(model, messages, max_tokens)
+                print(f"[LLM] ✅ Успешный ответ от {model['name']}")
+                return result
+            except Exception as e:
+                print(f"[LLM] ❌ {model['name']} недоступен: {e}")
+                continue
+
+        self._count_unavailable()
+        print("[LLM] ❌ Все LLM недоступны")
+        return None
+
+    def _call_hedged(self, messages: List[Dict[str, str]], max_tokens: int) -> Optional[str]:
+        """
+        Запрос к первому доступному бэкенду; если он не ответил за свой p95 (или упал) —
+        параллельно идём к следующему. Возвращается первый успешный ответ.
+        """
+        pending = {}
+        candidates = self._allowed_models()
+        first_model = None
+
+        def launch() -> bool:
+            nonlocal first_model
+            model = next(candidates, None)
+            if model is None:
+                return False
+            first_model = first_model or model
+            print(f"[LLM] Пробуем {model['name']}...")
+            pending[self._executor.submit(self._timed_call, model, messages, max_tokens)] = model
+            return True
+
+        launch()
+        has_more = True
+        while pending:
+            timeout = self._hedge_delay(next(iter(pending.values()))) if has_more else None
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # Медленный ответ — хеджируем следующим бэкендом
+                has_more = launch()
+                if has_more:
+                    with self._stats_lock:
+                        self.hedged_requests += 1
+                    print(f"[LLM] ⏱ Нет ответа за {timeout:.1f} с — дублируем запрос")
+                continue
+            for future in done:
+                model = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"[LLM] ❌ {model['name']} недоступен: {e}")
+                    if not pending:
+                        has_more = launch()
+                    continue
+                if model is not first_model:
+                    with self._stats_lock:
+                        self.hedge_wins += 1
+                print(f"[LLM] ✅ Успешный ответ от {model['name']}")
+                return result
+
+        self._count_unavailable()
+        print("[LLM] ❌ Все LLM недоступны")
+        return None
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            hedged_requests, hedge_wins = self.hedged_requests, self.hedge_wins
+        return {
+            'backends': {name: stats.snapshot() for name, stats in self.backend_stats.items()},
+            'hedged_requests': hedged_requests,
+            'hedge_wins': hedge_wins
+        }
+
+    def call_llm_stream(self, messages: List[Dict[str, str]], max_tokens: int = 500) -> Iterator[str]:
+        """
+        Потоковый вариант call_llm: фрагменты текста по мере генерации.
+        На следующую модель переключаемся, только если текущая упала до первого фрагмента.
+        """
+        for model in self._allowed_models():
+            stats = self.backend_stats[model["name"]]
+            started = False
+            request_started = monotonic()
+            try:
+                print(f"[LLM] Пробуем {model['name']} (stream)...")
                 if model["type"] == "gigachat":
-                    result = model["client"].chat_completions_create(
+                    chunks = model["client"].chat_completions_stream(
                         model="GigaChat",
                         messages=messages,
                         max_tokens=max_tokens,
                         temperature=0.3
                     )
                 else:  # openai-совместимый (DeepSeek, если включён)
-                    response = model["client"].chat.completions.create(
+                    stream = model["client"].chat.completions.create(
                         model="deepseek-chat",
                         messages=messages,
                         max_tokens=max_tokens,
                         temperature=0.3,
-                        timeout=30
+                        timeout=30,
+                        stream=True
                     )
-                    result = response.choices[0].message.content.strip()
+                    chunks = (c.choices[0].delta.content for c in stream if c.choices and c.choices[0].delta.content)
 
-                print(f"[LLM] ✅ Успешный ответ от {model['name']}")
-                return result
+                for chunk in chunks:
+                    if not started:
+                        # Задержка до первого фрагмента — только в своей гистограмме:
+                        # окно BackendStats (по нему считается задержка хеджирования) — для полных ответов
+                        stats.record_success(None)
+                        self._count(model["name"], 'success', mode='stream')
+                        METRICS.observe(
+                            'llm_first_chunk_seconds', monotonic() - request_started,
+                            help='Задержка до первого фрагмента потокового ответа LLM',
+                            backend=model["name"]
+                        )
+                    started = True
+                    yield chunk
+
+                if not started:
+                    raise ValueError("пустой потоковый ответ")
+                print(f"[LLM] ✅ Потоковый ответ от {model['name']} завершён")
+                return
             except Exception as e:
                 print(f"[LLM] ❌ {model['name']} недоступен: {e}")
+                if started:
+                    return
+                stats.record_failure()
+                self._count(model["name"], 'error', mode='stream')
                 continue
+            finally:
+                if not started:
+                    # Стрим закрыт до первого фрагмента (клиент ушёл): пробный запрос half-open не должен зависнуть
+                    stats.release_probe()
 
+        self._count_unavailable()
         print("[LLM] ❌ Все LLM недоступны")
-        return None
\ No newline at end of file
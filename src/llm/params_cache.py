@@ -0,0 +1,105 @@
+# src/llm/params_cache.py
+import re
+import json
+import sqlite3
+import logging
+import threading
+from time import time
+from typing import Any, Dict, Optional
+
+from src.cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r'[^\w\s]|_')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_message(text: str) -> str:
+    """«Комедия!», « комедия » и «КОМЕДИЯ» — один и тот же запрос."""
+    text = (text or '').lower().replace('ё', 'е')
+    text = _PUNCTUATION.sub(' ', text)
+    return _SPACES.sub(' ', text).strip()
+
+
+class ParamsCache:
+    """
+    Кэш параметров, извлечённых LLM из сообщения пользователя.
+    LRU в памяти плюс (опционально) SQLite-файл, чтобы кэш переживал перезапуски
+    и был общим для воркеров.
+    """
+
+    def __init__(self, maxsize: int = 2048, ttl: float = 7 * 24 * 3600, path: Optional[str] = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.path = path
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS params_cache '
+                    '(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)'
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"[ParamsCache] SQLite недоступен ({path}): {e}")
+                self._db = None
+
+    def get(self, message: str) -> Optional[Dict[str, Any]]:
+        key = normalize_message(message)
+        if not key:
+            return None
+        params = self.memory.get(key)
+        if params is MISSING and self._db is not None:
+            params = self._db_get(key)
+            if params is not MISSING:
+                self.memory.set(key, params)
+        if params is MISSING:
+            return None
+        # Копия: chat() дополняет параметры (min_rating и т.п.)
+        return dict(params)
+
+    def set(self, message: str, params: Dict[str, Any]):
+        key = normalize_message(message)
+        if not key:
+            return
+        self.memory.set(key, dict(params))
+        if self._db is not None:
+            self._db_set(key, params)
+
+    def _db_get(self, key: str):
+        try:
+            with self._db_lock:
+                row = self._db.execute(
+                    'SELECT value, created FROM params_cache WHERE key = ?', (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"[ParamsCache] Ошибка чтения: {e}")
+            return MISSING
+        if row is None or row[1] + self.ttl < time():
+            return MISSING
+        return json.loads(row[0])
+
+    def _db_set(self, key: str, params: Dict[str, Any]):
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO params_cache (key, value, created) VALUES (?, ?, ?)',
+                    (key, json.dumps(params, ensure_ascii=False), time())
+                )
+                # Держим файл в пределах maxsize: удаляем самые старые записи
+                self._db.execute(
+                    'DELETE FROM params_cache WHERE key IN ('
+                    'SELECT key FROM params_cache ORDER BY created DESC LIMIT -1 OFFSET ?)',
+                    (self.maxsize,)
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"[ParamsCache] Ошибка записи: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return self.memory.stats()
@@ -0,0 +1,77 @@
+# src/llm/speculation.py
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Speculation:
+    def __init__(self, key: Hashable, future: Future):
+        self.key = key
+        self.future = future
+        self.settled = False
+
+
+class SpeculativeRunner:
+    """
+    Запросы «наугад», пока LLM ещё извлекает параметры: по догадке локальных
+    эвристик поиск стартует сразу. Когда параметры известны, результат берётся,
+    только если ключ запроса совпал с ключом догадки; иначе он отбрасывается.
+    """
+
+    def __init__(self, workers: int = 4):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='speculate')
+        self._lock = threading.Lock()
+        self.launched = 0
+        self.hits = 0
+        self.misses = 0
+
+    def launch(self, key: Hashable, fn: Callable[[], Any]) -> Speculation:
+        with self._lock:
+            self.launched += 1
+        return Speculation(key, self._executor.submit(fn))
+
+    def resolve(self, speculation: Optional[Speculation], key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Результат по точным параметрам: из догадки, если она верна, иначе — вызовом fn."""
+        if speculation is not None and not speculation.settled and speculation.key == key:
+            speculation.settled = True
+            # Догадка ещё ждёт в очереди пула (чужие спекуляции под нагрузкой) —
+            # быстрее выполнить запрос сразу, чем ждать очереди
+            if speculation.future.cancel():
+                with self._lock:
+                    self.misses += 1
+                return fn()
+            try:
+                result = speculation.future.result()
+            except Exception as e:
+                logger.warning(f"[Speculation] Спекулятивный запрос упал: {e}")
+            else:
+                with self._lock:
+                    self.hits += 1
+                return result
+            with self._lock:
+                self.misses += 1
+            return fn()
+        self.discard(speculation)
+        return fn()
+
+    def discard(self, speculation: Optional[Speculation]):
+        if speculation is None or speculation.settled:
+            return
+        speculation.settled = True
+        # Ещё не начатый запрос отменяем; начатый доработает и прогреет кэши
+        speculation.future.cancel()
+        with self._lock:
+            self.misses += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            settled = self.hits + self.misses
+            return {
+                'launched': self.launched,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / settled, 3) if settled else 0.0
+            }
@@ -0,0 +1,210 @@
+# src/llm/token_manager.py
+import os
+import json
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from time import time, monotonic
+from typing import Dict, Iterator, Optional, Tuple
+
+import requests
+
+from src.metrics import METRICS
+
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессная блокировка недоступна
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class GigaChatTokenManager:
+    """
+    OAuth-токен GigaChat, общий для всех клиентов процесса.
+
+    - Пока до истечения больше refresh_ahead секунд — токен отдаётся без блокировок.
+    - В окне refresh_ahead токен обновляет ровно один поток, остальные продолжают
+      работать со старым, ещё действующим токеном (single-flight).
+    - Если задан cache_path, токен хранится в файле и делится между воркерами;
+      запрос к OAuth выполняет тот процесс, который первым взял flock.
+    """
+
+    def __init__(
+        self,
+        auth_key: str,
+        auth_url: str,
+        scope: str = 'GIGACHAT_API_PERS',
+        refresh_ahead: float = 300,
+        timeout: Tuple[float, float] = (5, 15),
+        cache_path: Optional[str] = None
+    ):
+        self.auth_key = auth_key
+        self.auth_url = auth_url
+        self.scope = scope
+        self.refresh_ahead = refresh_ahead
+        self.timeout = timeout
+        self.cache_path = cache_path
+        self.session = requests.Session()
+        # ⚠️ verify=False — временно, для обхода SSL-ошибок (Sber использует самоподписанные сертификаты)
+        self.session.verify = False
+
+        self.access_token: Optional[str] = None
+        self.expires_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        # Токен, отклонённый API (401): из файла-кэша его больше не берём
+        self._revoked: Optional[str] = None
+        self.refreshes = 0
+
+    def get_token(self) -> str:
+        now = time()
+        token, expires_at = self.access_token, self.expires_at
+        if token and now < expires_at - self.refresh_ahead:
+            return token
+
+        if token and now < expires_at:
+            # Токен ещё действует: обновляет один поток, остальные не ждут
+            with self._lock:
+                if self._refreshing or self.expires_at - self.refresh_ahead > now:
+                    return self.access_token
+                self._refreshing = True
+            try:
+                return self._refresh()
+            except Exception as e:
+                logger.warning(f"[GigaChat] Не удалось заранее обновить токен: {e}")
+                return token
+            finally:
+                self._refreshing = False
+
+        # Токена нет или он истёк — ждут все, запрос к OAuth один
+        with self._lock:
+            if self.access_token and time() < self.expires_at:
+                return self.access_token
+            self._refreshing = True
+            try:
+                return self._refresh()
+            finally:
+                self._refreshing = False
+
+    def invalidate(self, token: Optional[str] = None):
+        """Сбрасывает токен (например, после 401), если он не был уже заменён."""
+        with self._lock:
+            token = token or self.access_token
+            if token is None:
+                return
+            self._revoked = token
+            if token == self.access_token:
+                self.access_token = None
+                self.expires_at = 0.0
+        if self.cache_path:
+            # Другие воркеры тоже не должны брать этот токен из файла
+            with self._file_lock():
+                cached = self._read_cache()
+                if cached and cached[0] == token:
+                    try:
+                        os.remove(self.cache_path)
+                    except OSError as e:
+                        logger.warning(f"[GigaChat] Не удалось удалить токен из {self.cache_path}: {e}")
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        with open(f"{self.cache_path}.lock", 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self) -> str:
+        if not self.cache_path:
+            return self._store(*self._request_token())
+
+        with self._file_lock():
+            # Пока ждали блокировку, токен мог получить другой воркер
+            cached = self._read_cache()
+            if cached and cached[0] != self._revoked and time() < cached[1] - self.refresh_ahead:
+                return self._store(*cached)
+            token, expires_at = self._request_token()
+            self._write_cache(token, expires_at)
+            return self._store(token, expires_at)
+
+    def _store(self, token: str, expires_at: float) -> str:
+        self.access_token = token
+        self.expires_at = expires_at
+        return token
+
+    def _request_token(self) -> Tuple[str, float]:
+        headers = {
+            'RqUID': str(uuid.uuid4()),
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept': 'application/json',
+            'Authorization': f'Basic {self.auth_key}'
+        }
+
+        started = monotonic()
+        status = None
+        try:
+            response = self.session.post(
+                self.auth_url,
+                headers=headers,
+                data={'scope': self.scope},
+                timeout=self.timeout
+            )
+            status = response.status_code
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            error_detail = response.text if 'response' in locals() else 'N/A'
+            raise Exception(f"Ошибка получения токена GigaChat: {e}\nОтвет сервера: {error_detail}")
+        finally:
+            METRICS.observe_http('gigachat', '/oauth', monotonic() - started, status)
+
+        token_data = response.json()
+        if token_data.get('expires_at'):
+            # GigaChat отдаёт момент истечения в миллисекундах
+            expires_at = float(token_data['expires_at'])
+            if expires_at > 1e12:
+                expires_at /= 1000
+        else:
+            expires_at = time() + token_data.get('expires_in', 1800)  # по умолчанию 30 минут
+
+        self.refreshes += 1
+        print(f"[GigaChat] ✅ Получен новый access_token (действует {int(expires_at - time()) // 60} мин)")
+        return token_data['access_token'], expires_at
+
+    def _read_cache(self) -> Optional[Tuple[str, float]]:
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data['access_token'], float(data['expires_at'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_cache(self, token: str, expires_at: float):
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            # Файл с токеном — только для владельца
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'access_token': token, 'expires_at': expires_at}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"[GigaChat] Не удалось сохранить токен в {self.cache_path}: {e}")
+
+
+_managers: Dict[Tuple[str, str], GigaChatTokenManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_token_manager(auth_key: str, auth_url: str, **kwargs) -> GigaChatTokenManager:
+    """Один менеджер токена на пару (ключ, OAuth URL) в процессе."""
+    key = (auth_key, auth_url)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = GigaChatTokenManager(auth_key, auth_url, **kwargs)
+            _managers[key] = manager
+        return manager
@@ -0,0 +1,108 @@
+# src/llm/vocabulary.py
+# Словари для разбора запросов без LLM (см. fast_extractor.py)
+
+MOOD_TO_GENRE = {
+    "лёгкий": ["комедия", "мелодрама", "мультфильм", "семейный"],
+    "серьёзный": ["драма", "биография", "военный", "исторический"],
+    "адреналин": ["боевик", "триллер", "приключения", "фантастика"],
+    "для поднятия настроения": ["комедия", "мюзикл", "романтика"],
+    "страшный": ["ужасы", "триллер", "мистика"],
+    "умный": ["драма", "биография", "детектив", "фантастика"]
+}
+
+# Основа слова → жанр Кинопоиска. Основы покрывают падежи и число:
+# «комедия», «комедии», «комедий», «комедию» → «комедия»
+GENRE_STEMS = {
+    "комеди": "комедия",
+    "комедийн": "комедия",
+    "мелодрам": "мелодрама",
+    "драм": "драма",
+    "боевик": "боевик",
+    "экшн": "боевик",
+    "триллер": "триллер",
+    "ужас": "ужасы",
+    "хоррор": "ужасы",
+    "фантастик": "фантастика",
+    "фантастическ": "фантастика",
+    "научно": "фантастика",
+    "фэнтези": "фэнтези",
+    "фентези": "фэнтези",
+    "детектив": "детектив",
+    "приключен": "приключения",
+    "мультфильм": "мультфильм",
+    "мультик": "мультфильм",
+    "мультипликационн": "мультфильм",
+    "анимационн": "мультфильм",
+    "семейн": "семейный",
+    "биограф": "биография",
+    "военн": "военный",
+    "историческ": "история",
+    "криминал": "криминал",
+    "мюзикл": "мюзикл",
+    "вестерн": "вестерн",
+    "документальн": "документальный",
+    "аниме": "аниме",
+    "спортивн": "спорт",
+}
+
+# Основа → ключ MOOD_TO_GENRE
+MOOD_STEMS = {
+    "легк": "лёгкий",
+    "легон": "лёгкий",
+    "серьезн": "серьёзный",
+    "адреналин": "адреналин",
+    "страшн": "страшный",
+    "жутк": "страшный",
+    "умн": "умный",
+}
+
+# Многословные настроения (после нормализации сообщения)
+MOOD_PHRASES = {
+    "для поднятия настроения": "для поднятия настроения",
+    "поднять настроение": "для поднятия настроения",
+    "для настроения": "для поднятия настроения",
+}
+
+COUNTRY_STEMS = {
+    "американск": "США",
+    "голливудск": "США",
+    "французск": "Франция",
+    "российск": "Россия",
+    "русск": "Россия",
+    "отечественн": "Россия",
+    "советск": "СССР",
+    "японск": "Япония",
+    "корейск": "Корея Южная",
+    "британск": "Великобритания",
+    "английск": "Великобритания",
+    "итальянск": "Италия",
+    "немецк": "Германия",
+    "испанск": "Испания",
+    "индийск": "Индия",
+    "китайск": "Китай",
+}
+
+COUNT_WORDS = {
+    "один": 1, "одну": 1, "два": 2, "две": 2, "три": 3, "четыре": 4, "пять": 5,
+    "шесть": 6, "семь": 7, "восемь": 8, "девять": 9, "десять": 10,
+    "пятнадцать": 15, "двадцать": 20,
+}
+
+# «Лучшие»/«топ»: min_rating выставляет DialogMovieAgent.chat
+TOP_STEMS = ("лучш", "топ", "top", "best", "рейтингов")
+
+# Сериалы: тип выбирает DialogMovieAgent._is_tv_series_request
+SERIES_STEMS = ("сериал", "сезон", "эпизод")
+
+# Слова, не несущие параметров поиска
+FILLER_WORDS = frozenset({
+    "посоветуй", "посоветуйте", "порекомендуй", "порекомендуйте", "подбери", "подберите",
+    "покажи", "покажите", "найди", "найдите", "предложи", "хочу", "хочется", "хотим",
+    "дай", "дайте", "давай", "мне", "нам", "что", "чтонибудь", "нибудь", "то", "бы",
+    "посмотреть", "глянуть", "фильм", "фильмы", "фильма", "фильмов", "фильмец", "кино",
+    "кинчик", "картину", "картины", "какой", "какие", "какую", "какойнибудь", "самые",
+    "самых", "самый", "года", "год", "году", "годов", "г", "из", "за", "в", "во", "на",
+    "и", "а", "про", "жанр", "жанра", "жанре", "пожалуйста", "плиз", "please", "несколько",
+    "штук", "вечер", "вечером", "сегодня", "список", "подборку", "подборка", "есть",
+    "можно", "нужен", "нужна", "нужно", "ну", "привет", "movie", "movies",
+})
@@ -0,0 +1,195 @@
+# src/metrics.py
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import monotonic
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Границы корзин гистограмм задержек, секунды: от локальных кэшей до долгих ответов LLM
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+# (имя, тип, описание, метки, значение) — строка, которую отдаёт сборщик
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    parts = []
+    for key, value in labels:
+        value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Счётчики и гистограммы в памяти процесса, вывод — в текстовом формате Prometheus.
+    У gunicorn с несколькими воркерами у каждого воркера свои значения
+    (Prometheus различает их по instance/pod или суммирует).
+
+    Кроме накопленных значений, при выводе опрашиваются сборщики — функции,
+    которые возвращают текущие показатели (размеры и счётчики кэшей, состояние LLM).
+    """
+
+    def __init__(self, prefix: str = 'kinobot'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def _name(self, name: str) -> str:
+        return f"{self.prefix}_{name}"
+
+    def inc(self, name: str, value: float = 1, help: str = '', **labels):
+        name = self._name(name)
+        key = _label_key(labels)
+        with self._lock:
+            self._help.setdefault(name, ('counter', help))
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, help: str = '', **labels):
+        name = self._name(name)
+        key = _label_key(labels)
+        with self._lock:
+            self._help.setdefault(name, ('histogram', help))
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, stage: str, **labels) -> Iterator[Dict[str, object]]:
+        """
+        Замер этапа: kinobot_stage_seconds{stage=...}. Через возвращаемый словарь
+        можно дописать метки по ходу (например, откуда взялся результат).
+        Этап, завершившийся исключением, получает метку error="1".
+        """
+        extra: Dict[str, object] = {}
+        started = monotonic()
+        try:
+            yield extra
+        except BaseException:
+            extra['error'] = '1'
+            raise
+        finally:
+            self.observe(
+                'stage_seconds', monotonic() - started,
+                help='Длительность этапов обработки запроса',
+                **{**labels, **extra, 'stage': stage}
+            )
+
+    def observe_http(self, service: str, endpoint: str, seconds: float, status: Optional[object]):
+        """Исходящий HTTP-запрос; status=None — ответа не было (таймаут, обрыв соединения)."""
+        self.observe(
+            'http_request_seconds', seconds,
+            help='Длительность исходящих HTTP-запросов',
+            service=service, endpoint=endpoint, status=status if status is not None else 'error'
+        )
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: {key: (list(h.counts), h.sum, h.count, h.buckets) for key, h in series.items()}
+                for name, series in self._histograms.items()
+            }
+            described = dict(self._help)
+            collectors = list(self._collectors)
+
+        for name, series in sorted(counters.items()):
+            kind, help_text = described[name]
+            lines.append(f"# HELP {name} {help_text or name}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+        for name, series in sorted(histograms.items()):
+            kind, help_text = described[name]
+            lines.append(f"# HELP {name} {help_text or name}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, (counts, total, count, buckets) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(key + (('le', _format_value(bound)),))
+                    lines.append(f"{name}_bucket{labels} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+
+        # Сборщики: значения на момент запроса
+        collected: Dict[str, Tuple[str, str, List[Tuple[LabelKey, float]]]] = {}
+        for collector in collectors:
+            try:
+                samples = list(collector())
+            except Exception:
+                continue
+            for name, kind, help_text, labels, value in samples:
+                if value is None:
+                    continue
+                entry = collected.setdefault(self._name(name), (kind, help_text, []))
+                entry[2].append((_label_key(labels), float(value)))
+        for name, (kind, help_text, samples) in sorted(collected.items()):
+            lines.append(f"# HELP {name} {help_text or name}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(samples):
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+        return '\n'.join(lines) + '\n'
+
+
+# Один реестр на процесс
+METRICS = MetricsRegistry()
+
+
+def span(stage: str, **labels):
+    return METRICS.span(stage, **labels)
+
+
+def inc(name: str, value: float = 1, help: str = '', **labels):
+    METRICS.inc(name, value, help=help, **labels)
+
+
+def cache_samples(cache_name: str, stats: Dict[str, float]) -> List[Sample]:
+    """Показатели TTLCache / StaleWhileRevalidateCache.stats() как метрики kinobot_cache_*."""
+    samples: List[Sample] = []
+    for field, value in stats.items():
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            continue
+        if field in ('size', 'maxsize', 'movies', 'bytes', 'hit_rate'):
+            samples.append((f"cache_{field}", 'gauge', 'Размер и доля попаданий кэшей', {'cache': cache_name}, value))
+        else:
+            samples.append(('cache_events_total', 'counter', 'События кэшей (попадания, промахи, вытеснения)',
+                            {'cache': cache_name, 'event': field}, value))
+    return samples
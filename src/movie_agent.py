@@ -1,14 +1,18 @@
 # src/movie_agent.py
 import os
 import logging
+from functools import partial
 from pathlib import Path
 from typing import Optional, List, Dict, Union
 
-import pandas as pd
 from dotenv import load_dotenv
 
 from src.client.kinopoisk_client import KinopoiskClient
-from config import MIN_VOTES_IMDB, MIN_VOTES_KP
+from src.client.rate_limiter import BACKGROUND, RateLimitExceeded, with_priority
+from src.cache import StaleWhileRevalidateCache, MISSING, Expiring
+from src.imdb_catalog import get_imdb_catalog
+from src.title_index import get_title_index
+from config import MIN_VOTES_IMDB, MIN_VOTES_KP, DETAILS_CACHE_SIZE, DETAILS_CACHE_TTL, DETAILS_CACHE_MAX_STALE
 
 logger = logging.getLogger(__name__)
 load_dotenv()
@@ -19,13 +23,15 @@ class MovieAgent:
         self.use_api = use_api
         self.data_path = Path(__file__).parent.parent / "data" / "processed" / "imdb" / "imdb_top_1000.csv"
         self.kinopoisk_client = KinopoiskClient() if use_api else None
-
-    def _load_data_from_csv(self):
-        df = pd.read_csv(self.data_path)
-        df['Genre'] = df['Genre'].str.lower()
-        df['Series_Title'] = df['Series_Title'].str.title()
-        df['Released_Year'] = pd.to_numeric(df['Released_Year'], errors='coerce')
-        return df
+        self.async_kinopoisk_client = None
+        # Названия всех фильмов, уже полученных от Кинопоиска, + локальные CSV
+        self.title_index = get_title_index()
+        # Карточки фильмов по id: заполняется из выдачи search_movies, устаревшие записи обновляются в фоне
+        self.details_cache = StaleWhileRevalidateCache(
+            maxsize=DETAILS_CACHE_SIZE,
+            ttl=DETAILS_CACHE_TTL,
+            max_stale=DETAILS_CACHE_MAX_STALE
+        )
 
     def recommend_movies(
             self,
@@ -38,176 +44,312 @@ class MovieAgent:
             min_imdb_rating: Optional[float] = None,
             limit: int = 5,
             movie_type: str = 'movie',
-            query: Optional[str] = None
+            query: Optional[str] = None,
+            refresh: bool = False
     ) -> Union[List[Dict], Dict]:
+        """refresh=True — выдача запрашивается у API заново, даже если она есть в кэше (см. CacheWarmer)."""
         try:
             if self.use_api and self.kinopoisk_client:
-                effective_country = country if country else "США"
-
-                # Запрашиваем с запасом: чтобы после фильтрации осталось хотя бы `limit`
-                api_limit = max(limit * 4, 20)
-
-                movies_data = self.kinopoisk_client.search_movies(
-                    genre=genre_name,
-                    year=year,
-                    actor=actor,
-                    imdb_rating_min=min_imdb_rating,
-                    movie_type=movie_type,
-                    query=query,
-                    limit=api_limit
-                )
-
-                if not movies_data:
-                    return []
-
-                # Фильтрация по стране
-                filtered_by_country = []
-                for movie in movies_data['docs']:
-                    countries = [c.get('name') for c in movie.get('countries', []) if c.get('name')]
-                    if effective_country in countries:
-                        filtered_by_country.append(movie)
-                    elif effective_country == "США" and "Соединённые Штаты" in countries:
-                        filtered_by_country.append(movie)
-
-                final_list = filtered_by_country if filtered_by_country else movies_data['docs']
-
-                # Преобразуем в единый формат, но не больше `limit`
-                result = []
-                for m in final_list[:limit]:
-                    genres = ', '.join([g['name'] for g in m.get('genres', []) if g.get('name')])
-                    countries = ', '.join([c['name'] for c in m.get('countries', []) if c.get('name')])
-                    rating_imdb = m.get('rating', {}).get('imdb')
-                    rating_kp = m.get('rating', {}).get('kp')
-                    result.append({
-                        'id': m.get('id'),
-                        'title': m.get('name') or '—',
-                        'year': m.get('year'),
-                        'genre': genres,
-                        'country': countries,
-                        'rating': rating_imdb or rating_kp or '—',
-                        'rating_imdb': rating_imdb,
-                        'rating_kp': rating_kp,
-                        'description': (m.get('description') or '')[:500]
-                    })
-                return result
-
+                search_kwargs = self._search_kwargs(genre_name, year, actor, country, min_imdb_rating, limit, movie_type, query)
+                movies_data = self.kinopoisk_client.search_movies(refresh=refresh, **search_kwargs)
+                if not movies_data and search_kwargs['country']:
+                    # Фильмов этой страны нет — как и раньше, берём выдачу без фильтра по стране
+                    movies_data = self.kinopoisk_client.search_movies(refresh=refresh, **dict(search_kwargs, country=None))
+                return self._select_movies(movies_data, country, limit)
             else:
-                # fallback на CSV
-                df = self._load_data_from_csv()
-                filtered = df.copy()
-                if genre_name:
-                    filtered = filtered[filtered['Genre'].str.contains(genre_name.lower(), na=False)]
-                if year:
-                    filtered = filtered[filtered['Released_Year'] == year]
-                if filtered.empty:
-                    return []
-                sample = filtered.sample(min(limit, len(filtered)))
-                records = sample.to_dict('records')
-                for r in records:
-                    r.update({
-                        'id': None,
-                        'title': r.pop('Series_Title', '—'),
-                        'genre': r.pop('Genre', '—').title(),
-                        'country': 'США',
-                        'rating_imdb': r.get('IMDB_Rating'),
-                        'rating_kp': None,
-                        'rating': r.get('IMDB_Rating', '—'),
-                        'description': 'Описание недоступно в CSV.'
-                    })
-                return records
+                return self._recommend_from_csv(
+                    genre_name, year, limit,
+                    actor=actor, director=director, min_imdb_rating=min_imdb_rating
+                )
 
+        except RateLimitExceeded as e:
+            if refresh:
+                raise
+            # Квота Кинопоиска на исходе — подборка из локального каталога вместо ошибки
+            logger.warning(f"{e}; подборка из локального каталога")
+            return self._recommend_from_csv(
+                genre_name, year, limit,
+                actor=actor, director=director, min_imdb_rating=min_imdb_rating
+            )
         except Exception as e:
             logger.error(f"Ошибка в recommend_movies: {e}", exc_info=True)
             return {"error": str(e)}
 
+    async def recommend_movies_async(
+            self,
+            genre_name: Optional[str] = None,
+            year: Optional[int] = None,
+            actor: Optional[str] = None,
+            director: Optional[str] = None,
+            studio: Optional[str] = None,
+            country: Optional[str] = None,
+            min_imdb_rating: Optional[float] = None,
+            limit: int = 5,
+            movie_type: str = 'movie',
+            query: Optional[str] = None
+    ) -> Union[List[Dict], Dict]:
+        if not self.use_api or not self.kinopoisk_client:
+            return self.recommend_movies(
+                genre_name=genre_name, year=year, actor=actor, director=director,
+                min_imdb_rating=min_imdb_rating, limit=limit, movie_type=movie_type
+            )
+        try:
+            client = self._get_async_client()
+            search_kwargs = self._search_kwargs(genre_name, year, actor, country, min_imdb_rating, limit, movie_type, query)
+            movies_data = await client.search_movies(**search_kwargs)
+            if not movies_data and search_kwargs['country']:
+                movies_data = await client.search_movies(**dict(search_kwargs, country=None))
+            return self._select_movies(movies_data, country, limit)
+        except RateLimitExceeded as e:
+            logger.warning(f"{e}; подборка из локального каталога")
+            return self._recommend_from_csv(
+                genre_name, year, limit,
+                actor=actor, director=director, min_imdb_rating=min_imdb_rating
+            )
+        except Exception as e:
+            logger.error(f"Ошибка в recommend_movies_async: {e}", exc_info=True)
+            return {"error": str(e)}
+
+    def search_expires_in(
+            self,
+            genre_name: Optional[str] = None,
+            year: Optional[int] = None,
+            actor: Optional[str] = None,
+            director: Optional[str] = None,
+            studio: Optional[str] = None,
+            country: Optional[str] = None,
+            min_imdb_rating: Optional[float] = None,
+            limit: int = 5,
+            movie_type: str = 'movie',
+            query: Optional[str] = None
+    ) -> Optional[float]:
+        """Через сколько секунд истечёт выдача recommend_movies с этими аргументами в кэше; None — её там нет."""
+        if not self.use_api or not self.kinopoisk_client:
+            return None
+        search_kwargs = self._search_kwargs(genre_name, year, actor, country, min_imdb_rating, limit, movie_type, query)
+        cached, remaining = self.kinopoisk_client.peek_search(**search_kwargs)
+        if cached is None and remaining is not None and search_kwargs['country']:
+            # Пустой ответ по стране — recommend_movies берёт выдачу без страны, она тоже должна быть в кэше
+            _, fallback_remaining = self.kinopoisk_client.peek_search(**dict(search_kwargs, country=None))
+            remaining = None if fallback_remaining is None else min(remaining, fallback_remaining)
+        return remaining
+
+    def _get_async_client(self):
+        if self.async_kinopoisk_client is None:
+            from src.client.async_kinopoisk_client import AsyncKinopoiskClient
+            # Кэш поиска, индекс персон и лимиты API общие с синхронным клиентом
+            self.async_kinopoisk_client = AsyncKinopoiskClient(
+                search_cache=self.kinopoisk_client.search_cache,
+                person_index=self.kinopoisk_client.person_index,
+                pass_rates=self.kinopoisk_client.pass_rates,
+                rate_limiter=self.kinopoisk_client.rate_limiter
+            )
+        return self.async_kinopoisk_client
+
+    @staticmethod
+    def _search_kwargs(genre_name, year, actor, country, min_imdb_rating, limit, movie_type, query) -> Dict:
+        # Страна фильтруется на стороне API; по умолчанию, как и раньше, — США.
+        # Из «США, Великобритания» (страны фильма-образца) берём первую;
+        # «—» в карточке без стран — это отсутствие страны, а не её название.
+        if country and country.strip() == '—':
+            country = None
+        effective_country = (country or "США").split(',')[0].strip()
+        return {
+            'genre': genre_name,
+            'year': year,
+            'actor': actor,
+            'country': effective_country or None,
+            'imdb_rating_min': min_imdb_rating,
+            'movie_type': movie_type,
+            'query': query,
+            # Сколько страниц и какого размера запросить, решает клиент по доле прошедших фильтр
+            'limit': limit
+        }
+
+    def _select_movies(self, movies_data: Optional[dict], country: Optional[str], limit: int) -> List[Dict]:
+        if not movies_data:
+            return []
+
+        effective_country = country if country else "США"
+
+        # Клик по фильму из подборки обслуживается из кэша без запроса к API.
+        # Уже закэшированную карточку (возможно, полную из /movie/{id}) не трогаем —
+        # иначе выдачи из кэша поиска бесконечно продлевали бы ей жизнь
+        for doc in movies_data['docs']:
+            if doc.get('id') is not None:
+                self.details_cache.put_if_absent(int(doc['id']), self._details_to_movie(doc))
+        self.title_index.add_movies(self._doc_to_movie(doc) for doc in movies_data['docs'])
+
+        # Фильтрация по стране
+        filtered_by_country = []
+        for movie in movies_data['docs']:
+            countries = [c.get('name') for c in movie.get('countries', []) if c.get('name')]
+            if effective_country in countries:
+                filtered_by_country.append(movie)
+            elif effective_country == "США" and "Соединённые Штаты" in countries:
+                filtered_by_country.append(movie)
+
+        final_list = filtered_by_country if filtered_by_country else movies_data['docs']
+
+        # Преобразуем в единый формат, но не больше `limit`
+        return [self._doc_to_movie(m) for m in final_list[:limit]]
+
+    @staticmethod
+    def _doc_to_movie(m: Dict) -> Dict:
+        genres = ', '.join([g['name'] for g in m.get('genres', []) if g.get('name')])
+        countries = ', '.join([c['name'] for c in m.get('countries', []) if c.get('name')])
+        rating_imdb = m.get('rating', {}).get('imdb')
+        rating_kp = m.get('rating', {}).get('kp')
+        return {
+            'id': m.get('id'),
+            'title': m.get('name') or '—',
+            'original_title': m.get('alternativeName'),
+            'year': m.get('year'),
+            'genre': genres,
+            'country': countries,
+            'rating': rating_imdb or rating_kp or '—',
+            'rating_imdb': rating_imdb,
+            'rating_kp': rating_kp,
+            'description': (m.get('description') or '')[:500],
+            'imdb_id': (m.get('externalId') or {}).get('imdb'),
+            'tmdb_id': (m.get('externalId') or {}).get('tmdb')
+        }
+
+    def _recommend_from_csv(
+            self,
+            genre_name: Optional[str],
+            year: Optional[int],
+            limit: int,
+            actor: Optional[str] = None,
+            director: Optional[str] = None,
+            min_imdb_rating: Optional[float] = None
+    ) -> List[Dict]:
+        # Индекс строится один раз на процесс — без чтения CSV на каждый запрос
+        catalog = get_imdb_catalog(self.data_path)
+        rows = catalog.filter(
+            genre_name=genre_name,
+            year=year,
+            min_rating=min_imdb_rating,
+            director=director,
+            star=actor
+        )
+        return catalog.sample(rows, limit)
+
+    @staticmethod
+    def _details_to_movie(details: Dict) -> Dict:
+        rating_kp = details.get('rating', {}).get('kp')
+        rating_imdb = details.get('rating', {}).get('imdb')
+        genres_list = [g.get('name') for g in details.get('genres', []) if g.get('name')]
+        countries_list = [c.get('name') for c in details.get('countries', []) if c.get('name')]
+        return {
+            'id': details.get('id'),
+            'title': details.get('name') or 'Без названия',
+            'original_title': details.get('alternativeName'),
+            'year': details.get('year'),
+            'genre': ', '.join(genres_list) if genres_list else '—',
+            'country': ', '.join(countries_list) if countries_list else '—',
+            'rating': rating_imdb or rating_kp or '—',
+            'rating_imdb': rating_imdb,
+            'rating_kp': rating_kp,
+            'description': (details.get('description') or 'Описание отсутствует.')[:500],
+            'imdb_id': (details.get('externalId') or {}).get('imdb'),
+            'tmdb_id': (details.get('externalId') or {}).get('tmdb')
+        }
+
+    def _load_movie_details(self, movie_id: int) -> Expiring:
+        # Карточка из дискового кэша живёт в памяти не дольше, чем осталось ей на диске
+        details, ttl = self.kinopoisk_client.get_movie_details_entry(movie_id)
+        return Expiring(self._details_to_movie(details) if details else None, ttl)
+
     def get_movie_by_id(self, movie_id: str) -> Optional[Dict]:
         if not self.use_api or not self.kinopoisk_client:
             return None
         try:
             movie_id_int = int(movie_id)
-            details = self.kinopoisk_client.get_movie_details(movie_id_int)
+            load = partial(self._load_movie_details, movie_id_int)
+            # Обновление устаревшей карточки идёт в фоне и уступает квоту запросам пользователей
+            return self.details_cache.get_or_load(movie_id_int, load, refresher=with_priority(BACKGROUND, load))
+        except Exception as e:
+            logger.error(f"Ошибка получения фильма по ID {movie_id}: {e}", exc_info=True)
+        return None
+
+
+    async def get_movie_by_id_async(self, movie_id: str) -> Optional[Dict]:
+        if not self.use_api or not self.kinopoisk_client:
+            return None
+        try:
+            movie_id_int = int(movie_id)
+            cached = self.details_cache.get(
+                movie_id_int, with_priority(BACKGROUND, lambda: self._load_movie_details(movie_id_int))
+            )
+            if cached is not MISSING:
+                return cached
+            details, ttl = await self._get_async_client().get_movie_details_entry(movie_id_int)
             if details:
-                rating_kp = details.get('rating', {}).get('kp')
-                rating_imdb = details.get('rating', {}).get('imdb')
-                genres_list = [g.get('name') for g in details.get('genres', []) if g.get('name')]
-                countries_list = [c.get('name') for c in details.get('countries', []) if c.get('name')]
-                return {
-                    'id': details.get('id'),
-                    'title': details.get('name') or 'Без названия',
-                    'year': details.get('year'),
-                    'genre': ', '.join(genres_list) if genres_list else '—',
-                    'country': ', '.join(countries_list) if countries_list else '—',
-                    'rating': rating_imdb or rating_kp or '—',
-                    'rating_imdb': rating_imdb,
-                    'rating_kp': rating_kp,
-                    'description': (details.get('description') or 'Описание отсутствует.')[:500]
-                }
+                movie = self._details_to_movie(details)
+                self.details_cache.put(movie_id_int, movie, ttl)
+                return movie
         except Exception as e:
             logger.error(f"Ошибка получения фильма по ID {movie_id}: {e}", exc_info=True)
         return None
 
+    def _local_title_lookup(self, title: str):
+        """(найденный фильм, название для запроса к API)."""
+        matches = self.title_index.lookup(title)
+        if not matches:
+            return None, title
+        best = matches[0]
+        if best.movie and best.score >= 0.95:
+            logger.info(f"[MovieAgent] «{title}» найден локально: {best.title} ({best.score:.2f})")
+            return best.movie, title
+        if not best.movie and best.score >= 0.8:
+            # Фильм есть в CSV — ищем в API по исправленному (без опечаток) названию
+            return None, best.title
+        return None, title
 
     def search_by_title(self, title: str) -> List[Dict]:
         if not self.use_api or not self.kinopoisk_client:
             return []
 
-    # Используем search_movies с query + фильтрацией по типу "movie"
-    # и дополнительной проверкой на точное совпадение названия
         try:
-        # Сначала пробуем точный поиск через API
-            base_url = f"{self.kinopoisk_client.base_url.split('/v1.4')[0]}/v1.4/movie"
-            params = {
-                'query': title,
-                'limit': 10,  # запрашиваем больше, чтобы отфильтровать
-                'type': 'movie'
-            }
-            resp = self.kinopoisk_client.session.get(base_url, params=params, timeout=10)
-            if resp.ok:
-                data = resp.json()
-                docs = data.get('docs', [])
-
-            # Ищем точное или близкое совпадение по названию (регистронезависимо)
-                for movie in docs:
-                    name = movie.get('name', '').lower()
-                    alt_names = [n.lower() for n in movie.get('alternativeName', []) if n]
-                    all_names = [name] + alt_names
-                    if any(title.lower().strip() in n or n in title.lower().strip() for n in all_names):
-                        # Нашли подходящий фильм
-                        genres = ', '.join([g['name'] for g in movie.get('genres', []) if g.get('name')])
-                        countries = ', '.join([c['name'] for c in movie.get('countries', []) if c.get('name')])
-                        rating_imdb = movie.get('rating', {}).get('imdb')
-                        rating_kp = movie.get('rating', {}).get('kp')
-                        return [{
-                            'id': movie.get('id'),
-                            'title': movie.get('name') or '—',
-                            'year': movie.get('year'),
-                            'genre': genres,
-                            'country': countries,
-                            'rating': rating_imdb or rating_kp or '—',
-                            'rating_imdb': rating_imdb,
-                            'rating_kp': rating_kp,
-                            'description': (movie.get('description') or '')[:500]
-                        }]
-
-                # Если точного совпадения нет — возвращаем первый фильм (как fallback)
-                if docs:
-                    m = docs[0]
-                    genres = ', '.join([g['name'] for g in m.get('genres', []) if g.get('name')])
-                    countries = ', '.join([c['name'] for c in m.get('countries', []) if c.get('name')])
-                    rating_imdb = m.get('rating', {}).get('imdb')
-                    rating_kp = m.get('rating', {}).get('kp')
-                    return [{
-                        'id': m.get('id'),
-                        'title': m.get('name') or '—',
-                        'year': m.get('year'),
-                        'genre': genres,
-                        'country': countries,
-                        'rating': rating_imdb or rating_kp or '—',
-                        'rating_imdb': rating_imdb,
-                        'rating_kp': rating_kp,
-                        'description': (m.get('description') or '')[:500]
-                    }]
-            return []
+            movie, query = self._local_title_lookup(title)
+            if movie:
+                return [movie]
+            # запрашиваем больше, чтобы отфильтровать
+            docs = self.kinopoisk_client.search_by_title(query, limit=10)
+            self.title_index.add_movies(self._doc_to_movie(doc) for doc in docs)
+            return self._pick_title_match(docs, query)
         except Exception as e:
             logger.warning(f"Ошибка поиска по названию '{title}': {e}")
             return []
+
+    async def search_by_title_async(self, title: str) -> List[Dict]:
+        if not self.use_api or not self.kinopoisk_client:
+            return []
+
+        try:
+            movie, query = self._local_title_lookup(title)
+            if movie:
+                return [movie]
+            docs = await self._get_async_client().search_by_title(query, limit=10)
+            self.title_index.add_movies(self._doc_to_movie(doc) for doc in docs)
+            return self._pick_title_match(docs, query)
+        except Exception as e:
+            logger.warning(f"Ошибка поиска по названию '{title}': {e!r}")
+            return []
+
+    def _pick_title_match(self, docs: List[Dict], title: str) -> List[Dict]:
+        # Ищем точное или близкое совпадение по названию (регистронезависимо)
+        for movie in docs:
+            name = (movie.get('name') or '').lower()
+            # alternativeName в API v1.4 — строка, а не список
+            alt_name = (movie.get('alternativeName') or '').lower()
+            all_names = [n for n in (name, alt_name) if n]
+            if any(title.lower().strip() in n or n in title.lower().strip() for n in all_names):
+                # Нашли подходящий фильм
+                return [self._doc_to_movie(movie)]
+
+        # Если точного совпадения нет — возвращаем первый фильм (как fallback)
+        if docs:
+            return [self._doc_to_movie(docs[0])]
+        return []
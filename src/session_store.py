@@ -0,0 +1,156 @@
+# src/session_store.py
+import os
+import copy
+import json
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from time import monotonic, time
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Поля фильма, которые нужны диалогу дальше («похожие», клик по фильму) — без описаний
+MOVIE_REF_FIELDS = ('id', 'title', 'original_title', 'year', 'genre', 'country', 'rating_imdb', 'rating_kp')
+
+
+def compact_movies(movies: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Компактные ссылки на фильмы для состояния диалога."""
+    return [{field: m.get(field) for field in MOVIE_REF_FIELDS} for m in movies]
+
+
+class InMemorySessionStore:
+    """
+    Состояние диалога (last_movies, last_params, last_actor) по id сессии/чата.
+    LRU с TTL, потокобезопасно, живёт в памяти одного процесса.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 24 * 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id: Hashable) -> Dict[str, Any]:
+        with self._lock:
+            item = self._data.get(session_id)
+            if item is None:
+                return {}
+            expires_at, state = item
+            if expires_at <= monotonic():
+                del self._data[session_id]
+                return {}
+            self._data.move_to_end(session_id)
+            # Копия: вызывающий меняет состояние и сохраняет его через save()
+            return copy.deepcopy(state)
+
+    def save(self, session_id: Hashable, state: Dict[str, Any]):
+        with self._lock:
+            self._data[session_id] = (monotonic() + self.ttl, copy.deepcopy(dict(state)))
+            self._data.move_to_end(session_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, session_id: Hashable):
+        with self._lock:
+            self._data.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteSessionStore:
+    """
+    То же хранилище в SQLite-файле (WAL): общее для всех воркеров gunicorn и
+    переживает перезапуск. Состояние хранится JSON-ом; просроченные и лишние
+    (сверх maxsize) сессии чистятся раз в prune_every сохранений.
+    """
+
+    def __init__(self, path: str, maxsize: int = 100000, ttl: float = 24 * 3600, prune_every: int = 200):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_pid: Optional[int] = None
+        self._saves = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Соединение, открытое до fork, в воркере не используем
+        if self._db is None or self._db_pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS sessions '
+                '(id TEXT PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            db.commit()
+            self._db, self._db_pid = db, os.getpid()
+        return self._db
+
+    def load(self, session_id: Hashable) -> Dict[str, Any]:
+        try:
+            with self._lock:
+                row = self._connection().execute(
+                    'SELECT state, expires_at FROM sessions WHERE id = ?', (str(session_id),)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"[SessionStore] Ошибка чтения сессии: {e}")
+            return {}
+        if row is None or row[1] <= time():
+            return {}
+        return json.loads(row[0])
+
+    def save(self, session_id: Hashable, state: Dict[str, Any]):
+        try:
+            with self._lock:
+                db = self._connection()
+                db.execute(
+                    'INSERT OR REPLACE INTO sessions (id, state, expires_at) VALUES (?, ?, ?)',
+                    (str(session_id), json.dumps(dict(state), ensure_ascii=False, default=str), time() + self.ttl)
+                )
+                self._saves += 1
+                if self._saves % self.prune_every == 0:
+                    self._prune(db)
+                db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"[SessionStore] Ошибка записи сессии: {e}")
+
+    def _prune(self, db: sqlite3.Connection):
+        db.execute('DELETE FROM sessions WHERE expires_at <= ?', (time(),))
+        db.execute(
+            'DELETE FROM sessions WHERE id IN ('
+            'SELECT id FROM sessions ORDER BY expires_at DESC LIMIT -1 OFFSET ?)',
+            (self.maxsize,)
+        )
+
+    def delete(self, session_id: Hashable):
+        try:
+            with self._lock:
+                db = self._connection()
+                db.execute('DELETE FROM sessions WHERE id = ?', (str(session_id),))
+                db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"[SessionStore] Ошибка удаления сессии: {e}")
+
+    def __len__(self):
+        with self._lock:
+            return self._connection().execute(
+                'SELECT COUNT(*) FROM sessions WHERE expires_at > ?', (time(),)
+            ).fetchone()[0]
+
+
+def create_session_store(backend: str, path: Optional[str] = None, maxsize: int = 10000, ttl: float = 24 * 3600):
+    """memory — в памяти процесса; sqlite — общий файл для нескольких воркеров."""
+    if backend == 'sqlite':
+        if not path:
+            raise ValueError("Для SESSION_BACKEND=sqlite нужен SESSION_DB_PATH")
+        return SQLiteSessionStore(path, maxsize=maxsize, ttl=ttl)
+    if backend != 'memory':
+        logger.warning(f"[SessionStore] Неизвестный бэкенд '{backend}', используем memory")
+    return InMemorySessionStore(maxsize=maxsize, ttl=ttl)
@@ -0,0 +1,268 @@
+# src/similarity.py
+import re
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.cache import TTLCache, MISSING
+from src.imdb_catalog import get_imdb_catalog
+
+logger = logging.getLogger(__name__)
+
+# Жанры Кинопоиска → жанры MovieLens
+RU_TO_MOVIELENS_GENRE = {
+    "комедия": ["Comedy"],
+    "драма": ["Drama"],
+    "боевик": ["Action"],
+    "триллер": ["Thriller"],
+    "ужасы": ["Horror"],
+    "фантастика": ["Sci-Fi"],
+    "мелодрама": ["Romance", "Drama"],
+    "детектив": ["Mystery", "Crime"],
+    "приключения": ["Adventure"],
+    "мультфильм": ["Animation"],
+    "аниме": ["Animation"],
+    "семейный": ["Children"],
+    "детский": ["Children"],
+    "криминал": ["Crime"],
+    "мюзикл": ["Musical"],
+    "фэнтези": ["Fantasy"],
+    "вестерн": ["Western"],
+    "военный": ["War"],
+    "документальный": ["Documentary"],
+    "фильм-нуар": ["Film-Noir"],
+}
+
+_YEAR_SUFFIX = re.compile(r'\s*\((\d{4})(?:[-–]\d{0,4})?\)\s*$')
+_ALT_TITLE = re.compile(r'\s*\(([^()]*)\)\s*$')
+_ARTICLE = re.compile(r'^(.*), (The|A|An|Les|La|Le|Il|Der|Die|Das|El)$')
+_NON_WORD = re.compile(r'[^\w]+')
+
+DECADE_MIN = 1900
+DECADE_MAX = 2020
+# Строк популярных фильмов за один шаг предрасчёта соседей: блок оценок 16 × 62 тыс.
+# (float32 и индексы argpartition) — около 12 МБ
+PRECOMPUTE_CHUNK = 16
+
+
+def _normalize_title(title: str) -> str:
+    return _NON_WORD.sub(' ', (title or '').lower().replace('ё', 'е')).strip()
+
+
+def split_movielens_title(raw: str):
+    """'American President, The (1995)' → ('The American President', 1995, [алиасы])."""
+    year = None
+    match = _YEAR_SUFFIX.search(raw)
+    if match:
+        year = int(match.group(1))
+        raw = raw[:match.start()]
+    aliases = []
+    alt = _ALT_TITLE.search(raw)
+    if alt and alt.start() > 0:
+        aliases.append(alt.group(1))
+        raw = raw[:alt.start()]
+    article = _ARTICLE.match(raw)
+    if article:
+        raw = f"{article.group(2)} {article.group(1)}"
+    return raw.strip(), year, aliases
+
+
+class SimilarityEngine:
+    """
+    Похожие фильмы по каталогу MovieLens без обращения к API.
+
+    Признаки фильма — мультихот жанров плюс «мягкий» год: вес распределяется между
+    двумя соседними десятилетиями, так что 1999 и 2001 близки. Векторы нормированы,
+    поэтому косинусная близость — это одно умножение матрицы на вектор.
+    Соседи популярных фильмов (тех, что есть в IMDb top-1000) считаются заранее.
+    """
+
+    def __init__(
+        self,
+        movies_path: Path,
+        imdb_path: Optional[Path] = None,
+        year_weight: float = 0.7,
+        popularity_bonus: float = 0.05,
+        precompute_k: int = 20,
+        cache_size: int = 4096
+    ):
+        df = pd.read_csv(movies_path)
+        parsed = [split_movielens_title(t) for t in df['title'].astype(str)]
+        self.titles = [p[0] for p in parsed]
+        self.years = np.array([p[1] or 0 for p in parsed], dtype=np.int32)
+        genre_lists = [
+            [g for g in str(value).split('|') if g and g != '(no genres listed)']
+            for value in df['genres'].fillna('')
+        ]
+        self.genre_lists = genre_lists
+        self.genre_names = sorted({g for genres in genre_lists for g in genres})
+        self.genre_column = {g: i for i, g in enumerate(self.genre_names)}
+        self.decades = list(range(DECADE_MIN, DECADE_MAX + 10, 10))
+        self.year_weight = year_weight
+
+        n = len(df)
+        features = np.zeros((n, len(self.genre_names) + len(self.decades)), dtype=np.float32)
+        for row, genres in enumerate(genre_lists):
+            for g in genres:
+                features[row, self.genre_column[g]] = 1.0
+        for row, year in enumerate(self.years):
+            if year:
+                self._fill_year(features[row], int(year))
+        norms = np.linalg.norm(features, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.features = features / norms
+
+        # Поиск строки по названию (+ году)
+        self.title_index: Dict[str, List[int]] = {}
+        for row, (title, _, aliases) in enumerate(parsed):
+            for name in [title] + aliases:
+                key = _normalize_title(name)
+                if key:
+                    self.title_index.setdefault(key, []).append(row)
+
+        # Рейтинги и «популярность» — из IMDb top-1000 (совпадение по названию и году)
+        self.imdb_ratings = np.full(n, np.nan, dtype=np.float32)
+        if imdb_path and Path(imdb_path).exists():
+            catalog = get_imdb_catalog(imdb_path)
+            for record in catalog.records:
+                row = self.find(record['title'], record['year'])
+                if row is not None and self.years[row] == (record['year'] or 0):
+                    self.imdb_ratings[row] = record['rating_imdb']
+        self.prior = np.where(np.isnan(self.imdb_ratings), 0.0, popularity_bonus).astype(np.float32)
+        self.popular_rows = np.flatnonzero(~np.isnan(self.imdb_ratings))
+
+        self._neighbours = TTLCache(maxsize=cache_size, ttl=float('inf'))
+        self.precompute_k = precompute_k
+        self._precompute()
+
+        logger.info(
+            f"[Similarity] {n} фильмов MovieLens, {len(self.genre_names)} жанров, "
+            f"соседи предрассчитаны для {len(self.popular_rows)} популярных"
+        )
+
+    def _fill_year(self, vector: np.ndarray, year: int):
+        offset = len(self.genre_names)
+        position = (min(max(year, DECADE_MIN), DECADE_MAX) - DECADE_MIN) / 10
+        low = int(position)
+        high = min(low + 1, len(self.decades) - 1)
+        frac = position - low
+        vector[offset + low] += self.year_weight * (1 - frac)
+        vector[offset + high] += self.year_weight * frac
+
+    def _precompute(self):
+        if not len(self.popular_rows):
+            return
+        # Блоками по PRECOMPUTE_CHUNK строк: весь блок (популярные × все) — сотни МБ на воркер
+        for start in range(0, len(self.popular_rows), PRECOMPUTE_CHUNK):
+            rows = self.popular_rows[start:start + PRECOMPUTE_CHUNK]
+            # Отрицательные оценки (на месте, без копии): argpartition/argsort — по возрастанию
+            scores = self.features[rows] @ self.features.T
+            scores += self.prior
+            np.negative(scores, out=scores)
+            scores[np.arange(len(rows)), rows] = np.inf
+            top = np.argpartition(scores, self.precompute_k, axis=1)[:, :self.precompute_k]
+            for i, row in enumerate(rows):
+                ranked = top[i][np.argsort(scores[i, top[i]])]
+                self._neighbours.set(int(row), ranked)
+
+    def find(self, title: str, year: Optional[int] = None) -> Optional[int]:
+        rows = self.title_index.get(_normalize_title(title))
+        if not rows:
+            return None
+        if year:
+            for row in rows:
+                if self.years[row] == int(year):
+                    return row
+        return rows[0]
+
+    def vector_for(self, genres: Iterable[str], year: Optional[int] = None) -> Optional[np.ndarray]:
+        vector = np.zeros(self.features.shape[1], dtype=np.float32)
+        for genre in genres:
+            name = genre.strip().lower()
+            for ml_genre in RU_TO_MOVIELENS_GENRE.get(name, [genre.strip().title()]):
+                column = self.genre_column.get(ml_genre)
+                if column is not None:
+                    vector[column] = 1.0
+        if not vector.any():
+            return None
+        if year:
+            self._fill_year(vector, int(year))
+        return vector / np.linalg.norm(vector)
+
+    def _rank(self, vector: np.ndarray, k: int, exclude: Optional[int] = None) -> np.ndarray:
+        scores = self.features @ vector + self.prior
+        if exclude is not None:
+            scores[exclude] = -np.inf
+        top = np.argpartition(-scores, k)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def neighbours(self, row: int, k: int = 5) -> List[int]:
+        cached = self._neighbours.get(row)
+        if cached is MISSING or len(cached) < k:
+            cached = self._rank(self.features[row], max(k, self.precompute_k), exclude=row)
+            self._neighbours.set(row, cached)
+        return [int(r) for r in cached[:k]]
+
+    def similar(
+        self,
+        title: Optional[str] = None,
+        year: Optional[int] = None,
+        genres: Optional[Iterable[str]] = None,
+        k: int = 5,
+        original_title: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Похожие фильмы: по названию (оригинальному, затем локализованному), если оно есть
+        в MovieLens, иначе по жанрам и году. Возвращает записи в формате MovieAgent.
+        """
+        names = [name for name in (original_title, title) if name]
+        row = next((r for r in (self.find(name, year) for name in names) if r is not None), None)
+        if row is not None:
+            rows = self.neighbours(row, k)
+        else:
+            vector = self.vector_for(genres or [], year)
+            if vector is None:
+                return []
+            # Сам фильм мог не найтись из-за года или написания — исключаем его по названию;
+            # ранжируем с запасом, чтобы после фильтра осталось k
+            title_keys = {_normalize_title(name) for name in names}
+            ranked = [int(r) for r in self._rank(vector, 2 * k)]
+            rows = [r for r in ranked if _normalize_title(self.titles[r]) not in title_keys][:k]
+        return [self._to_movie(r) for r in rows]
+
+    def _to_movie(self, row: int) -> Dict:
+        rating = self.imdb_ratings[row]
+        rating = None if np.isnan(rating) else round(float(rating), 1)
+        return {
+            'id': None,
+            'title': self.titles[row],
+            'year': int(self.years[row]) or None,
+            'genre': ', '.join(self.genre_lists[row]) or '—',
+            'country': '—',
+            'rating': rating or '—',
+            'rating_imdb': rating,
+            'rating_kp': None,
+            'description': ''
+        }
+
+
+_engine: Optional[SimilarityEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_similarity_engine() -> SimilarityEngine:
+    """Движок строится один раз на процесс, при первом запросе «похожих»."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                data_dir = Path(__file__).parent.parent / "data" / "processed"
+                _engine = SimilarityEngine(
+                    data_dir / "recommendation" / "movies.csv",
+                    imdb_path=data_dir / "imdb" / "imdb_top_1000.csv"
+                )
+    return _engine
@@ -1,6 +1,9 @@
 # telegram_bot.py
 import os
+import asyncio
 import logging
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from telegram import Update
 from telegram.ext import (
     Application,
@@ -9,7 +12,9 @@ from telegram.ext import (
     filters,
     ContextTypes
 )
-from src.llm.dialog_agent import DialogMovieAgent
+from src.agent_registry import get_dialog_agent
+from src.session_store import create_session_store
+from config import TELEGRAM_WORKERS, SESSION_BACKEND, SESSION_DB_PATH, SESSION_MAX, SESSION_TTL
 from dotenv import load_dotenv
 
 # Настройка логирования
@@ -20,7 +25,24 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Инициализация агента один раз при запуске
-agent = DialogMovieAgent()
+agent = get_dialog_agent()
+
+# Агент синхронный (LLM + API) — выполняем его вне event loop, в ограниченном пуле
+chat_executor = ThreadPoolExecutor(max_workers=TELEGRAM_WORKERS, thread_name_prefix='chat')
+
+# Состояние диалога по chat_id (тот же бэкенд, что и у веб-чата)
+chat_states = create_session_store(SESSION_BACKEND, SESSION_DB_PATH, maxsize=SESSION_MAX, ttl=SESSION_TTL)
+
+# Сообщения одного чата — по очереди (общее состояние, порядок ответов), разных чатов — параллельно.
+# Замок живёт, пока его держит или ждёт хотя бы один обработчик
+chat_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _chat_lock(chat_id: int) -> asyncio.Lock:
+    lock = chat_locks.get(chat_id)
+    if lock is None:
+        lock = chat_locks[chat_id] = asyncio.Lock()
+    return lock
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -37,6 +59,20 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(welcome_text)
 
 
+async def new_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработка команды /new — сброс контекста диалога"""
+    chat_states.delete(update.effective_chat.id)
+    await update.message.reply_text("Начинаем заново! Что хочешь посмотреть? 🍿")
+
+
+def run_chat(chat_id: int, user_message: str) -> dict:
+    """Синхронный вызов агента с состоянием конкретного чата (выполняется в пуле потоков)"""
+    state = chat_states.load(chat_id)
+    result = agent.chat(user_message, history=[], state=state)
+    chat_states.save(chat_id, state)
+    return result
+
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка текстовых сообщений от пользователя"""
     user_message = update.message.text.strip()
@@ -48,13 +84,18 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     logger.info(f"[Telegram] Пользователь {user_id}: {user_message}")
 
+    chat_id = update.effective_chat.id
+
     try:
-        # Вызываем ваш агент
-        result = agent.chat(user_message, history=[])
-        response = result.get("response", "Извини, что-то пошло не так 😔")
+        await update.message.chat.send_action("typing")
+        async with _chat_lock(chat_id):
+            result = await asyncio.get_running_loop().run_in_executor(
+                chat_executor, run_chat, chat_id, user_message
+            )
+            response = result.get("response", "Извини, что-то пошло не так 😔")
 
-        # Отправляем ответ
-        await update.message.reply_text(response, parse_mode="HTML")
+            # Отправляем ответ
+            await update.message.reply_text(response, parse_mode="HTML")
 
     except Exception as e:
         logger.error(f"[Telegram] Ошибка при обработке сообщения: {e}", exc_info=True)
@@ -76,10 +117,12 @@ def main():
             "Токен бота не найден. Установите TELEGRAM_BOT_TOKEN в файле .env"
         )
 
-    app = Application.builder().token(token).build()
+    # Обновления от разных пользователей обрабатываются параллельно
+    app = Application.builder().token(token).concurrent_updates(TELEGRAM_WORKERS).build()
 
     # Обработчики
     app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("new", new_chat))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 
     # Обработчик ошибок
@@ -0,0 +1,224 @@
+# src/title_index.py
+import re
+import logging
+import threading
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.imdb_catalog import get_imdb_catalog
+from src.similarity import split_movielens_title
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD = re.compile(r'[^\w]+')
+
+
+def normalize_title(title: str) -> str:
+    return _NON_WORD.sub(' ', (title or '').lower().replace('ё', 'е')).strip()
+
+
+def trigrams(text: str) -> List[str]:
+    padded = f"  {text} "
+    return list({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+
+class TitleMatch(NamedTuple):
+    score: float
+    title: str
+    year: Optional[int]
+    movie: Optional[Dict]  # карточка Кинопоиска, если фильм уже приходил из API
+
+
+class TitleIndex:
+    """
+    Нечёткий поиск фильма по названию по триграммам (коэффициент Дайса).
+
+    Статическая часть — названия из локальных CSV (IMDb top-1000 и MovieLens без года) —
+    хранится в массивах NumPy: постинг-листы триграмм складываются через bincount.
+    Динамическая часть — карточки, полученные от Кинопоиска (русское и оригинальное
+    название), — небольшой словарь, пополняемый на лету.
+    """
+
+    def __init__(self, imdb_path: Optional[Path] = None, movielens_path: Optional[Path] = None, max_movies: int = 50000):
+        self.imdb_path = imdb_path
+        self.movielens_path = movielens_path
+        self.max_movies = max_movies
+        self._static_ready = False
+        self._static_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+        # Динамическая часть: id карточки → карточка; нормализованное имя → id
+        self._movies: "OrderedDict[object, Dict]" = OrderedDict()
+        self._names: Dict[str, set] = {}
+        self._grams: Dict[str, set] = {}
+        # Ключи названий карточки — чтобы при вытеснении убрать её из _names/_grams
+        self._movie_keys: Dict[object, List[str]] = {}
+
+        self.local_hits = 0
+        self.csv_hits = 0
+        self.misses = 0
+
+    # --- статическая часть (CSV) ---
+
+    def _ensure_static(self):
+        if self._static_ready:
+            return
+        with self._static_lock:
+            if self._static_ready:
+                return
+            titles, years = [], []
+            if self.imdb_path and Path(self.imdb_path).exists():
+                for record in get_imdb_catalog(self.imdb_path).records:
+                    titles.append(record['title'])
+                    years.append(record['year'] or 0)
+            if self.movielens_path and Path(self.movielens_path).exists():
+                for raw in pd.read_csv(self.movielens_path, usecols=['title'])['title'].astype(str):
+                    title, year, aliases = split_movielens_title(raw)
+                    for name in [title] + aliases:
+                        titles.append(name)
+                        years.append(year or 0)
+
+            keys = [normalize_title(t) for t in titles]
+            postings: Dict[str, List[int]] = {}
+            gram_counts = np.zeros(len(keys), dtype=np.float32)
+            self._static_exact: Dict[str, List[int]] = {}
+            for row, key in enumerate(keys):
+                if not key:
+                    continue
+                self._static_exact.setdefault(key, []).append(row)
+                grams = trigrams(key)
+                gram_counts[row] = len(grams)
+                for gram in grams:
+                    postings.setdefault(gram, []).append(row)
+
+            self._static_titles = titles
+            self._static_years = np.array(years, dtype=np.int32)
+            self._static_postings = {g: np.array(rows, dtype=np.int32) for g, rows in postings.items()}
+            self._static_gram_counts = gram_counts
+            self._static_ready = True
+            logger.info(f"[TitleIndex] Локальный индекс: {len(titles)} названий, {len(postings)} триграмм")
+
+    def _lookup_static(self, key: str, grams: List[str], year: Optional[int], limit: int, min_score: float) -> List[TitleMatch]:
+        exact = self._static_exact.get(key)
+        if exact:
+            rows = [r for r in exact if not year or self._static_years[r] == year] or exact
+            return [TitleMatch(1.0, self._static_titles[r], int(self._static_years[r]) or None, None) for r in rows[:limit]]
+
+        lists = [self._static_postings[g] for g in grams if g in self._static_postings]
+        if not lists:
+            return []
+        common = np.bincount(np.concatenate(lists), minlength=len(self._static_titles)).astype(np.float32)
+        scores = 2 * common / (len(grams) + self._static_gram_counts + 1e-9)
+        if year:
+            scores[self._static_years == year] += 0.05
+        top = np.argpartition(-scores, min(limit, len(scores) - 1))[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [
+            TitleMatch(float(min(scores[r], 1.0)), self._static_titles[r], int(self._static_years[r]) or None, None)
+            for r in top if scores[r] >= min_score
+        ]
+
+    # --- динамическая часть (Кинопоиск) ---
+
+    def add_movies(self, movies: Iterable[Dict]):
+        """Запоминает карточки фильмов из ответов Кинопоиска (формат MovieAgent)."""
+        with self._lock:
+            for movie in movies:
+                movie_id = movie.get('id')
+                if movie_id is None:
+                    continue
+                if movie_id in self._movies:
+                    self._movies.move_to_end(movie_id)
+                    self._unindex(movie_id)
+                self._movies[movie_id] = movie
+                keys = [normalize_title(name) for name in (movie.get('title'), movie.get('original_title'))]
+                keys = list(dict.fromkeys(key for key in keys if key and key != '—'))
+                self._movie_keys[movie_id] = keys
+                for key in keys:
+                    self._names.setdefault(key, set()).add(movie_id)
+                    for gram in trigrams(key):
+                        self._grams.setdefault(gram, set()).add(movie_id)
+            while len(self._movies) > self.max_movies:
+                movie_id, _ = self._movies.popitem(last=False)
+                self._unindex(movie_id)
+
+    def _unindex(self, movie_id):
+        # Вызывается под self._lock
+        for key in self._movie_keys.pop(movie_id, ()):
+            for index, index_key in [(self._names, key)] + [(self._grams, gram) for gram in trigrams(key)]:
+                ids = index.get(index_key)
+                if ids is not None:
+                    ids.discard(movie_id)
+                    if not ids:
+                        del index[index_key]
+
+    def _lookup_dynamic(self, key: str, grams: List[str], year: Optional[int], limit: int, min_score: float) -> List[TitleMatch]:
+        with self._lock:
+            counts = Counter()
+            for gram in grams:
+                counts.update(self._grams.get(gram, ()))
+            exact = self._names.get(key, set())
+            matches = []
+            for movie_id, common in counts.items():
+                movie = self._movies.get(movie_id)
+                if movie is None:
+                    continue
+                if movie_id in exact:
+                    score = 1.0
+                else:
+                    names = [normalize_title(n) for n in (movie.get('title'), movie.get('original_title')) if n]
+                    score = max(2 * common / (len(grams) + len(trigrams(n))) for n in names) if names else 0.0
+                if year and movie.get('year') == year:
+                    score += 0.05
+                if score >= min_score:
+                    matches.append(TitleMatch(min(score, 1.0), movie.get('title'), movie.get('year'), movie))
+        matches.sort(key=lambda m: (m.score, m.movie.get('rating_imdb') or 0), reverse=True)
+        return matches[:limit]
+
+    def lookup(self, title: str, year: Optional[int] = None, limit: int = 5, min_score: float = 0.6) -> List[TitleMatch]:
+        """Лучшие совпадения: сначала карточки Кинопоиска, затем названия из CSV."""
+        key = normalize_title(title)
+        if not key:
+            return []
+        grams = trigrams(key)
+        matches = self._lookup_dynamic(key, grams, year, limit, min_score)
+        if matches:
+            self.local_hits += 1
+            return matches
+        self._ensure_static()
+        matches = self._lookup_static(key, grams, year, limit, min_score)
+        if matches:
+            self.csv_hits += 1
+        else:
+            self.misses += 1
+        return matches
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'movies': len(self._movies),
+            'local_hits': self.local_hits,
+            'csv_hits': self.csv_hits,
+            'misses': self.misses
+        }
+
+
+_index: Optional[TitleIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_title_index() -> TitleIndex:
+    """Один индекс на процесс: карточки от Кинопоиска копятся между запросами."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                data_dir = Path(__file__).parent.parent / "data" / "processed"
+                _index = TitleIndex(
+                    imdb_path=data_dir / "imdb" / "imdb_top_1000.csv",
+                    movielens_path=data_dir / "recommendation" / "movies.csv"
+                )
+    return _index